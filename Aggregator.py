@@ -0,0 +1,419 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Line Aggregator (station event collector)
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import asyncio
+import socket
+import sqlite3
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Publisher
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+DB_DEFAULT = "line.db"  # 集計値の保存先
+FLUSH_INTERVAL = 5.0  # 保存の間隔（sec）
+
+QUEUE_MAX = 10000  # 処理待ちのデータグラム数の上限
+QUEUE_HIGH = 8000  # これを超えたら受信を止める（カーネルの受信バッファで待たせる）
+QUEUE_LOW = 2000  # これを下回ったら受信を再開
+RCVBUF = 4 * 1024 * 1024  # ソケットの受信バッファ（byte）
+
+BUCKET = 60  # 集計の刻み（sec）
+BUCKETS = 60  # 刻みの数（BUCKET×BUCKETS = 1時間の移動窓）
+
+# ステートの表示名（Main.State_Main の値）
+STATE_NAMES = {0: "-", 1: "NONE", 2: "RESET", 3: "PAUSE", 4: "DO",
+               5: "CHANGERANGE", 6: "CHANGERANGE_DONE"}
+
+
+class StationAgg():
+    """
+    1ステーション分の移動集計
+    （1分刻みのリングバッファで直近1時間を持つ。大きさは固定）
+    """
+    __slots__ = ("name", "state", "first", "last", "seq", "lost",
+                 "minute", "cycles", "steps", "wrong",
+                 "total_cycles", "total_steps", "total_wrong", "dirty")
+
+    def __init__(self, arg_name):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_name : str
+            ステーション名
+        """
+        self.name = arg_name
+        # 現在のステート
+        self.state = 0
+        # 最初と最後に受信したイベントの時刻（ステーションの時計）
+        self.first = None
+        self.last = 0.0
+        # 次の通し番号、届かなかったデータグラム数
+        self.seq = None
+        self.lost = 0
+        # 刻みごとの（分番号, サイクル数, ステップ数, 間違い押下数）
+        self.minute = [-1] * BUCKETS
+        self.cycles = [0] * BUCKETS
+        self.steps = [0] * BUCKETS
+        self.wrong = [0] * BUCKETS
+        # 累計
+        self.total_cycles = 0
+        self.total_steps = 0
+        self.total_wrong = 0
+        # 前回の保存から変化があった
+        self.dirty = True
+
+    def Add(self, arg_time, arg_kind):
+        """
+        イベント1件分の加算
+        Parameters
+        ----------
+        arg_time : float
+            時刻（epoch sec）
+        arg_kind : int
+            種類（Publisher.EV_*）
+        """
+        if self.first is None:
+            self.first = arg_time
+        if arg_time > self.last:
+            self.last = arg_time
+        minute = int(arg_time // BUCKET)
+        i = minute % BUCKETS
+        if self.minute[i] != minute:
+            # 古い刻みを使い回す
+            self.minute[i] = minute
+            self.cycles[i] = 0
+            self.steps[i] = 0
+            self.wrong[i] = 0
+        if arg_kind == Publisher.EV_CYCLE:
+            self.cycles[i] += 1
+            self.total_cycles += 1
+        elif arg_kind == Publisher.EV_STEP:
+            self.steps[i] += 1
+            self.total_steps += 1
+        elif arg_kind == Publisher.EV_WRONG:
+            self.wrong[i] += 1
+            self.total_wrong += 1
+
+    def Rates(self):
+        """
+        直近1時間の集計値
+        Returns
+        -------
+        cycles_per_hour : float
+            1時間あたりのサイクル数
+        error_rate : float
+            間違い押下の割合（間違い / (ステップ完了 + 間違い)）
+        """
+        now = int(self.last // BUCKET)
+        cycles = steps = wrong = 0
+        for i in range(BUCKETS):
+            if now - BUCKETS < self.minute[i] <= now:
+                cycles += self.cycles[i]
+                steps += self.steps[i]
+                wrong += self.wrong[i]
+        # 動き始めて1時間経たない時は、経過時間で割る
+        span = BUCKET * BUCKETS
+        if self.first is not None:
+            span = min(span, max(self.last - self.first, BUCKET))
+        presses = steps + wrong
+        return cycles * 3600.0 / span, wrong / presses if presses > 0 else 0.0
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    """
+    データグラムの受信（処理待ちに積むだけ）
+    """
+
+    def __init__(self, arg_agg):
+        self.__agg = arg_agg
+
+    def connection_made(self, transport):
+        self.__agg.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.__agg.Received(data)
+
+
+class Aggregator():
+    """
+    ライン全体のイベント集計
+    （1つのasyncioループで全ステーションのデータグラムを受けて、
+      ステーションごとの移動集計をメモリに持ち、定期的にまとめて保存する）
+    """
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 受信・処理したデータグラム数、イベント数
+    received = 0
+    datagrams = 0
+    events = 0
+    # 処理待ちが溢れて捨てたデータグラム数、受信を止めた回数
+    dropped = 0
+    paused = 0
+    # 保存した行数
+    written = 0
+
+    transport = None
+
+    def __init__(self, arg_db=DB_DEFAULT, arg_group=Publisher.GROUP_DEFAULT,
+                 arg_port=Publisher.PORT_DEFAULT, arg_flush=FLUSH_INTERVAL, arg_verbose=False):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_db : str
+            保存先（sqlite3）
+        arg_group : str
+            マルチキャストグループ
+        arg_port : int
+            受信ポート
+        arg_flush : float
+            保存の間隔（sec）
+        arg_verbose : bool
+            保存のたびに受信状況を表示する
+        """
+        self.__db_file = arg_db
+        self.__group = arg_group
+        self.__port = arg_port
+        self.__flush = arg_flush
+        self.__debug = arg_verbose
+        self.__db = None
+        # 保存は専用の1スレッドで行う（sqlite3の接続をスレッド間で共有しない）
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__queue = None
+        self.__reading = True
+        # ステーション名ごとの集計
+        self.stations = {}
+
+    def print(self, arg_message):
+        """
+        デバッグ用メッセージ
+        """
+        if self.__debug == True:
+            print(" > %s" % (arg_message))
+
+    def Received(self, arg_data):
+        """
+        データグラムを処理待ちに積む（受信コールバックから呼び出す）
+        """
+        self.received += 1
+        queue = self.__queue
+        try:
+            queue.put_nowait(arg_data)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        if self.__reading and queue.qsize() >= QUEUE_HIGH:
+            # 処理が追いつくまで受信を止める
+            self.__reading = False
+            self.paused += 1
+            self.transport.pause_reading()
+
+    def Ingest(self, arg_data):
+        """
+        データグラム1つ分の集計
+        """
+        try:
+            name, state, seq, base, events = Publisher.decode(arg_data)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            return
+        st = self.stations.get(name)
+        if st is None:
+            st = self.stations[name] = StationAgg(name)
+        if st.seq is not None and seq != st.seq:
+            st.lost += (seq - st.seq) & 0xffffffff
+            st.dirty = True
+        st.seq = (seq + 1) & 0xffffffff
+        if state != st.state:
+            st.state = state
+            st.dirty = True
+        if events:
+            # 生存通知だけの時は保存しない（変化したステーションだけ書き込む）
+            st.dirty = True
+            for t, kind, ev_state, a, b in events:
+                st.Add(t, kind)
+            self.events += len(events)
+        elif base > st.last:
+            # 生存通知
+            # （刻みが変わると移動集計の値も変わるので、1刻みに1回は保存する）
+            if int(base // BUCKET) != int(st.last // BUCKET):
+                st.dirty = True
+            st.last = base
+        self.datagrams += 1
+
+    async def __Consume(self):
+        """
+        処理待ちの集計
+        """
+        queue = self.__queue
+        while True:
+            self.Ingest(await queue.get())
+            # 溜まっている分は続けて処理する
+            while not queue.empty():
+                self.Ingest(queue.get_nowait())
+            if not self.__reading and queue.qsize() <= QUEUE_LOW:
+                self.__reading = True
+                self.transport.resume_reading()
+
+    def __Open(self):
+        """
+        保存先を開く（保存スレッドで呼び出す）
+        """
+        db = sqlite3.connect(self.__db_file)
+        db.execute("CREATE TABLE IF NOT EXISTS station_stats ("
+                   "time REAL, station TEXT, state TEXT, cycles_per_hour REAL,"
+                   " error_rate REAL, cycles INTEGER, steps INTEGER, wrong INTEGER,"
+                   " lost INTEGER, last_seen REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS station_current ("
+                   "station TEXT PRIMARY KEY, time REAL, state TEXT, cycles_per_hour REAL,"
+                   " error_rate REAL, cycles INTEGER, steps INTEGER, wrong INTEGER,"
+                   " lost INTEGER, last_seen REAL)")
+        db.commit()
+        return db
+
+    def __Write(self, arg_rows):
+        """
+        集計値をまとめて保存（保存スレッドで呼び出す）
+        """
+        if self.__db is None:
+            self.__db = self.__Open()
+        with self.__db:
+            # 履歴と、最新値（ステーションごとに1行）
+            self.__db.executemany(
+                "INSERT INTO station_stats VALUES (?,?,?,?,?,?,?,?,?,?)", arg_rows)
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO station_current VALUES (?,?,?,?,?,?,?,?,?,?)",
+                [(row[1], row[0]) + row[2:] for row in arg_rows])
+        return len(arg_rows)
+
+    def Snapshot(self):
+        """
+        変化のあったステーションの集計値
+        Returns
+        -------
+        list
+            保存する行のリスト
+        """
+        now = time.time()
+        rows = []
+        for st in self.stations.values():
+            if not st.dirty:
+                continue
+            st.dirty = False
+            cph, err = st.Rates()
+            rows.append((now, st.name, STATE_NAMES.get(st.state, str(st.state)), cph, err,
+                         st.total_cycles, st.total_steps, st.total_wrong, st.lost, st.last))
+        return rows
+
+    async def __Flush(self):
+        """
+        定期的な保存
+        （保存中は次の保存を始めないので、保存先が遅い時は間隔が延びる）
+        """
+        loop = asyncio.get_running_loop()
+        last = (time.monotonic(), 0, 0)
+        while True:
+            await asyncio.sleep(self.__flush)
+            rows = self.Snapshot()
+            if rows:
+                self.written += await loop.run_in_executor(self.__executor, self.__Write, rows)
+            now = time.monotonic()
+            elapsed = now - last[0]
+            self.print("stations %d, %.0f datagrams/s, %.0f events/s, queue %d,"
+                       " dropped %d, paused %d, lost %d, rows %d" % (
+                           len(self.stations),
+                           (self.datagrams - last[1]) / elapsed,
+                           (self.events - last[2]) / elapsed,
+                           self.__queue.qsize(), self.dropped, self.paused,
+                           sum(st.lost for st in self.stations.values()), self.written))
+            last = (now, self.datagrams, self.events)
+
+    async def Run(self):
+        """
+        受信・集計・保存の開始（止めるまで戻らない）
+        """
+        loop = asyncio.get_running_loop()
+        self.__queue = asyncio.Queue(QUEUE_MAX)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+        sock.bind(("", self.__port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.__group),
+                                 socket.inet_aton("0.0.0.0"))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.setblocking(False)
+        await loop.create_datagram_endpoint(lambda: _Protocol(self), sock=sock)
+
+        try:
+            await asyncio.gather(self.__Consume(), self.__Flush())
+        finally:
+            self.transport.close()
+            # 最後の集計値を保存
+            rows = self.Snapshot()
+            if rows:
+                self.written += await loop.run_in_executor(self.__executor, self.__Write, rows)
+
+    def Report(self):
+        """
+        ステーションごとの集計値の表示
+        """
+        print("%-16s %-8s %10s %8s %8s %8s" %
+              ("station", "state", "cycles/h", "err%", "cycles", "lost"))
+        for name in sorted(self.stations):
+            st = self.stations[name]
+            cph, err = st.Rates()
+            print("%-16s %-8s %10.1f %8.2f %8d %8d" % (
+                name[:16], STATE_NAMES.get(st.state, str(st.state))[:8],
+                cph, err * 100, st.total_cycles, st.lost))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE line aggregator")
+    parser.add_argument("-d", "--db", default=DB_DEFAULT,
+                        help="集計値の保存先（sqlite3、既定: %s）" % (DB_DEFAULT))
+    parser.add_argument("-g", "--group", default=Publisher.GROUP_DEFAULT,
+                        help="マルチキャストグループ（既定: %s）" % (Publisher.GROUP_DEFAULT))
+    parser.add_argument("-p", "--port", type=int, default=Publisher.PORT_DEFAULT,
+                        help="受信ポート（既定: %d）" % (Publisher.PORT_DEFAULT))
+    parser.add_argument("-i", "--interval", type=float, default=FLUSH_INTERVAL,
+                        help="保存の間隔sec（既定: %g）" % (FLUSH_INTERVAL))
+    parser.add_argument("--duration", type=float, default=0,
+                        help="指定した時間sec動かして終了（0の時は止めるまで）")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="保存のたびに受信状況を表示する")
+    args = parser.parse_args()
+
+    agg = Aggregator(args.db, args.group, args.port, args.interval, args.verbose)
+
+    async def run():
+        if args.duration > 0:
+            try:
+                await asyncio.wait_for(agg.Run(), args.duration)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await agg.Run()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    agg.Report()
+    print("-- %d datagrams, %d events, %d dropped, %d paused, %d rows written --" %
+          (agg.datagrams, agg.events, agg.dropped, agg.paused, agg.written))
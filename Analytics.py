@@ -0,0 +1,458 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Cycle / Event Log Analytics
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import time
+
+import EventRecorder
+
+try:
+    import numpy as np
+except ImportError:
+    # 集計する時だけ必要（ステーション本体では使わない）
+    np = None
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+CHUNK = 1 << 20  # 一度に読み込む件数（12MB）
+
+TAKT_BIN = 0.1  # タクトタイムの階級幅（sec）
+DWELL_BIN = 0.05  # ステップ滞留時間の階級幅（sec）
+DWELL_MAX = 60.0  # ステップ滞留時間の上限（超えた分は最後の階級に入れる）
+GAP_DEFAULT = 600.0  # これより長い間隔は休憩として集計から外す（sec）
+
+SHIFTS_DEFAULT = "A=06:00,B=14:00,C=22:00"  # シフトの開始時刻
+
+
+def parse_shifts(arg_text):
+    """
+    シフト設定の読み込み
+    Parameters
+    ----------
+    arg_text : str
+        "名前=開始時刻" のカンマ区切り（例: A=06:00,B=14:00,C=22:00）
+    Returns
+    -------
+    names : list
+        開始時刻順のシフト名
+    starts : list
+        開始時刻（0時からのsec）
+    """
+    shifts = []
+    for item in arg_text.split(","):
+        name, start = item.split("=", 1)
+        hour, minute = start.split(":", 1)
+        shifts.append((int(hour) * 3600 + int(minute) * 60, name.strip()))
+    shifts.sort()
+    return [name for start, name in shifts], [start for start, name in shifts]
+
+
+def percentile(arg_hist, arg_width, arg_q):
+    """
+    度数分布からパーセンタイル値を求める
+    Parameters
+    ----------
+    arg_hist : numpy.ndarray
+        度数
+    arg_width : float
+        階級幅
+    arg_q : float
+        0～100
+    Returns
+    -------
+    float
+        該当する階級の上限（度数が0の時は0）
+    """
+    total = arg_hist.sum()
+    if total == 0:
+        return 0.0
+    cum = np.cumsum(arg_hist)
+    index = int(np.searchsorted(cum, total * arg_q / 100.0))
+    return (index + 1) * arg_width
+
+
+class StationStats():
+    """
+    1ステーション・1パターン分の集計値
+    （大きさはパターン数とシフト数だけで決まり、記録の量によらない）
+    """
+
+    def __init__(self, arg_station, arg_pattern, arg_shifts, arg_gap):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_station : str
+            ステーション名
+        arg_pattern : list
+            点灯パターン
+        arg_shifts : int
+            シフト数
+        arg_gap : float
+            休憩とみなす間隔（sec）
+        """
+        self.station = arg_station
+        self.pattern = list(arg_pattern)
+        steps = len(self.pattern)
+
+        # サイクル数、休憩の回数
+        self.cycles = 0
+        self.breaks = 0
+        # タクトタイム（サイクル完了の間隔）
+        self.takt_hist = np.zeros(int(arg_gap / TAKT_BIN) + 1, np.int64)
+        self.takt_sum = 0.0
+        self.takt_max = 0.0
+        # ステップごとの滞留時間（前のステップ完了からの時間）
+        self.dwell_hist = np.zeros((steps, int(DWELL_MAX / DWELL_BIN) + 1), np.int64)
+        self.dwell_sum = np.zeros(steps)
+        # ステップごとの間違い押下
+        self.wrong = np.zeros(steps, np.int64)
+        # シフトごとのサイクル数、タクトタイム、間違い押下
+        self.shift_cycles = np.zeros(arg_shifts, np.int64)
+        self.shift_takt_sum = np.zeros(arg_shifts)
+        self.shift_takt_count = np.zeros(arg_shifts, np.int64)
+        self.shift_wrong = np.zeros(arg_shifts, np.int64)
+
+
+class Analytics():
+    """
+    記録ファイル（EventRecorder）の集計
+    （CHUNK件ずつNumPy配列に読み込んで、配列演算で集計する）
+    """
+
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 集計した件数・ファイル数
+    records = 0
+    files = 0
+
+    def __init__(self, arg_shifts=SHIFTS_DEFAULT, arg_gap=GAP_DEFAULT):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_shifts : str
+            シフト設定（parse_shiftsの書式）
+        arg_gap : float
+            休憩とみなす間隔（sec）
+        """
+        if np is None:
+            raise ImportError("Analytics requires numpy")
+        # 1件分（EventRecorder.RECORD と同じ並び）
+        self.__dtype = np.dtype(
+            [("t", "<f8"), ("kind", "u1"), ("a", "u1"), ("b", "<u2")])
+        self.shift_names, starts = parse_shifts(arg_shifts)
+        # 0時～最初のシフト開始までは、最後のシフトの続き
+        self.__shift_bounds = np.array([0] + starts, np.float64)
+        self.__shift_index = np.array(
+            [len(starts) - 1] + list(range(len(starts))), np.int64)
+        self.__gap = arg_gap
+        # (ステーション名, パターン) ごとの集計値
+        self.stats = {}
+
+    def __Stats(self, arg_station, arg_pattern):
+        """
+        ステーション・パターンに対応する集計値の取得
+        """
+        key = (arg_station, tuple(arg_pattern))
+        if key not in self.stats:
+            self.stats[key] = StationStats(
+                key[0], key[1], len(self.shift_names), self.__gap)
+        return self.stats[key]
+
+    def __Shift(self, arg_epoch):
+        """
+        時刻（epoch secの配列）からシフト番号を求める
+        """
+        if len(arg_epoch) == 0:
+            return np.zeros(0, np.int64)
+        # 夏時間の切替はCHUNK単位で反映
+        offset = time.localtime(float(arg_epoch[0])).tm_gmtoff
+        sec = (arg_epoch + offset) % 86400
+        return self.__shift_index[
+            np.searchsorted(self.__shift_bounds, sec, side="right") - 1]
+
+    def Add(self, arg_file):
+        """
+        記録ファイル1つ分の集計
+        Parameters
+        ----------
+        arg_file : str
+            記録ファイル名
+        """
+        size = self.__dtype.itemsize
+        with open(arg_file, "rb") as file:
+            info = EventRecorder.read_header(file, arg_file)
+            station = info.get("station", "main")
+            stats = self.__Stats(station, info["pattern"])
+            # CHUNKをまたぐ間隔の計算用（直前のサイクル完了、直前のステップ完了）
+            carry = {"cycle": np.nan, "mark": np.nan}
+            # 新しいパターンがCHUNKの中で分からなかった残り
+            rest = None
+            while True:
+                data = file.read(CHUNK * size)
+                # 書きかけの最後の1件は捨てる
+                count = len(data) // size
+                if count == 0:
+                    break
+                rec = np.frombuffer(data, self.__dtype, count)
+                self.records += count
+                if rest is not None:
+                    rec = np.concatenate((rest, rec))
+                stats, rest = self.__Segments(station, stats, info["start"], rec, carry,
+                                              False)
+            if rest is not None:
+                self.__Segments(station, stats, info["start"], rest, carry, True)
+        self.files += 1
+
+    def __Segments(self, arg_station, arg_stats, arg_start, arg_rec, arg_carry, arg_last):
+        """
+        パターンの切替ごとに分けて集計
+        （記録中に範囲が変更されると、EV_STEPのch・EV_CYCLEのパターン数が合わなくなる。
+          そのサイクルの始まりから、新しいパターンの集計値に切り替える）
+        Parameters
+        ----------
+        arg_last : bool
+            記録の最後（新しいパターンが分からなくても、残さずに集計する）
+        Returns
+        -------
+        stats : StationStats
+            最後のパターンの集計値
+        rest : numpy.ndarray
+            新しいパターンが分からなかった残り（次のCHUNKと一緒に集計する。無い時はNone）
+        """
+        st = arg_stats
+        rec = arg_rec
+        while len(rec) > 0:
+            begin = self.__Mismatch(st.pattern, rec)
+            if begin is None:
+                break
+            pattern = self.__Pattern(rec[begin:])
+            if pattern is None and not arg_last and len(rec) - begin < CHUNK:
+                self.__Chunk(st, arg_start, rec[:begin], arg_carry)
+                return st, rec[begin:]
+            if pattern is None or pattern == st.pattern:
+                # 新しいパターンが分からない時は、前のパターンのまま集計する
+                break
+            self.__Chunk(st, arg_start, rec[:begin], arg_carry)
+            st = self.__Stats(arg_station, pattern)
+            rec = rec[begin:]
+        self.__Chunk(st, arg_start, rec, arg_carry)
+        return st, None
+
+    def __Mismatch(self, arg_pattern, arg_rec):
+        """
+        パターンと合わない記録を含むサイクルの始まりを探す
+        Returns
+        -------
+        int
+            サイクルの始まりの位置（直前のサイクル完了・ステート変化の次）
+            （全て合っている時はNone）
+        """
+        kind = arg_rec["kind"]
+        step = arg_rec["a"].astype(np.int64)
+        steps = len(arg_pattern)
+        channels = np.array(arg_pattern, np.int64)
+        bad = (kind == EventRecorder.EV_STEP) & (
+            (step >= steps) | (channels[np.minimum(step, steps - 1)] != arg_rec["b"]))
+        bad |= (kind == EventRecorder.EV_CYCLE) & (step != steps)
+        found = np.flatnonzero(bad)
+        if len(found) == 0:
+            return None
+        first = int(found[0])
+        marks = np.flatnonzero((kind[:first] == EventRecorder.EV_CYCLE) |
+                               (kind[:first] == EventRecorder.EV_STATE))
+        return int(marks[-1]) + 1 if len(marks) > 0 else 0
+
+    def __Pattern(self, arg_rec):
+        """
+        最初に完了したサイクルのステップからパターンを求める
+        （途中でリセットされたサイクルは使わない）
+        Returns
+        -------
+        list
+            パターン（サイクルが完了していない時はNone）
+        """
+        kinds = arg_rec["kind"]
+        steps = arg_rec["a"]
+        channels = arg_rec["b"]
+        pattern = []
+        for i in range(len(arg_rec)):
+            kind = kinds[i]
+            if kind == EventRecorder.EV_STEP:
+                if steps[i] == len(pattern):
+                    pattern.append(int(channels[i]))
+                elif steps[i] == 0:
+                    pattern = [int(channels[i])]
+                else:
+                    pattern = []
+            elif kind == EventRecorder.EV_CYCLE:
+                if pattern and steps[i] == len(pattern):
+                    return pattern
+                pattern = []
+            elif kind == EventRecorder.EV_STATE:
+                pattern = []
+        return None
+
+    def __Chunk(self, arg_stats, arg_start, arg_rec, arg_carry):
+        """
+        CHUNK件分の集計
+        """
+        st = arg_stats
+        t = arg_rec["t"]
+        kind = arg_rec["kind"]
+        step_all = arg_rec["a"].astype(np.int64)
+        shifts = len(self.shift_names)
+        steps = len(st.pattern)
+
+        # タクトタイム（サイクル完了の間隔）
+        sel = kind == EventRecorder.EV_CYCLE
+        tc = t[sel]
+        if len(tc) > 0:
+            shift = self.__Shift(arg_start + tc)
+            st.cycles += len(tc)
+            st.shift_cycles += np.bincount(shift, minlength=shifts)
+            prev = np.concatenate(([arg_carry["cycle"]], tc[:-1]))
+            takt = tc - prev
+            arg_carry["cycle"] = tc[-1]
+            # 記録の最初（前のサイクルが無い）と休憩は除く
+            ok = takt <= self.__gap
+            st.breaks += int(np.count_nonzero(takt > self.__gap))
+            takt = takt[ok]
+            shift = shift[ok]
+            if len(takt) > 0:
+                bins = len(st.takt_hist)
+                index = np.minimum((takt / TAKT_BIN).astype(np.int64), bins - 1)
+                st.takt_hist += np.bincount(index, minlength=bins)
+                st.takt_sum += float(takt.sum())
+                st.takt_max = max(st.takt_max, float(takt.max()))
+                st.shift_takt_sum += np.bincount(shift, weights=takt, minlength=shifts)
+                st.shift_takt_count += np.bincount(shift, minlength=shifts)
+
+        # ステップの滞留時間（直前のステップ完了・サイクル完了からの時間）
+        sel = (kind == EventRecorder.EV_STEP) | (kind == EventRecorder.EV_CYCLE)
+        tm = t[sel]
+        if len(tm) > 0:
+            prev = np.concatenate(([arg_carry["mark"]], tm[:-1]))
+            dwell = tm - prev
+            arg_carry["mark"] = tm[-1]
+            step = step_all[sel]
+            ok = (kind[sel] == EventRecorder.EV_STEP) & (dwell <= self.__gap) & (step < steps)
+            step = step[ok]
+            dwell = dwell[ok]
+            if len(step) > 0:
+                bins = st.dwell_hist.shape[1]
+                index = step * bins + np.minimum((dwell / DWELL_BIN).astype(np.int64), bins - 1)
+                st.dwell_hist += np.bincount(
+                    index, minlength=steps * bins).reshape(steps, bins)
+                st.dwell_sum += np.bincount(step, weights=dwell, minlength=steps)
+
+        # 間違い押下
+        sel = kind == EventRecorder.EV_WRONG
+        if np.any(sel):
+            step = step_all[sel]
+            st.wrong += np.bincount(step[step < steps], minlength=steps)
+            st.shift_wrong += np.bincount(
+                self.__Shift(arg_start + t[sel]), minlength=shifts)
+
+    def Report(self, arg_top=3):
+        """
+        集計結果の表示
+        Parameters
+        ----------
+        arg_top : int
+            間違い押下の多いステップを何件表示するか
+        """
+        shifts = len(self.shift_names)
+        total_cycles = np.zeros(shifts, np.int64)
+        total_takt_sum = np.zeros(shifts)
+        total_takt_count = np.zeros(shifts, np.int64)
+        total_wrong = np.zeros(shifts, np.int64)
+
+        for key in sorted(self.stats):
+            st = self.stats[key]
+            print("== %s pattern %s ==" % (st.station, st.pattern))
+            takt_count = st.takt_hist.sum()
+            print(" > cycles   : %d (breaks %d)" % (st.cycles, st.breaks))
+            if takt_count > 0:
+                print(" > takt sec : mean %.2f / p50 %.1f / p90 %.1f / p99 %.1f / max %.2f" %
+                      (st.takt_sum / takt_count,
+                       percentile(st.takt_hist, TAKT_BIN, 50),
+                       percentile(st.takt_hist, TAKT_BIN, 90),
+                       percentile(st.takt_hist, TAKT_BIN, 99),
+                       st.takt_max))
+
+            # ステップごとの滞留時間と間違い押下
+            print(" > step  ch   count   mean    p50    p90   wrong")
+            for step, ch in enumerate(st.pattern):
+                hist = st.dwell_hist[step]
+                count = hist.sum()
+                print("   %4d %3d %7d %6.2f %6.2f %6.2f %7d" %
+                      (step, ch, count,
+                       st.dwell_sum[step] / count if count > 0 else 0.0,
+                       percentile(hist, DWELL_BIN, 50),
+                       percentile(hist, DWELL_BIN, 90),
+                       st.wrong[step]))
+            order = np.argsort(-st.wrong, kind="stable")[:arg_top]
+            top = ["step %d (ch %d) %d" % (step, st.pattern[step], st.wrong[step])
+                   for step in order if st.wrong[step] > 0]
+            if top:
+                print(" > most wrong presses : %s" % (" / ".join(top)))
+
+            self.__ReportShift(st.shift_cycles, st.shift_takt_sum,
+                               st.shift_takt_count, st.shift_wrong)
+            total_cycles += st.shift_cycles
+            total_takt_sum += st.shift_takt_sum
+            total_takt_count += st.shift_takt_count
+            total_wrong += st.shift_wrong
+
+        if len(self.stats) > 1:
+            print("== all stations ==")
+            self.__ReportShift(total_cycles, total_takt_sum,
+                               total_takt_count, total_wrong)
+
+    def __ReportShift(self, arg_cycles, arg_takt_sum, arg_takt_count, arg_wrong):
+        """
+        シフトごとの比較の表示
+        """
+        print(" > shift   cycles  takt mean    wrong  wrong/cycle")
+        for i, name in enumerate(self.shift_names):
+            print("   %-5s %8d %10.2f %8d %12.3f" %
+                  (name, arg_cycles[i],
+                   arg_takt_sum[i] / arg_takt_count[i] if arg_takt_count[i] > 0 else 0.0,
+                   arg_wrong[i],
+                   arg_wrong[i] / arg_cycles[i] if arg_cycles[i] > 0 else 0.0))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE cycle / event log analytics")
+    parser.add_argument("logs", nargs="+",
+                        help="記録ファイル（Main.py --record で作成、複数指定可）")
+    parser.add_argument("--shifts", default=SHIFTS_DEFAULT,
+                        help="シフトの開始時刻（既定: %s）" % (SHIFTS_DEFAULT))
+    parser.add_argument("--gap", type=float, default=GAP_DEFAULT,
+                        help="休憩とみなす間隔sec（既定: %g）" % (GAP_DEFAULT))
+    parser.add_argument("--top", type=int, default=3,
+                        help="間違い押下の多いステップの表示件数")
+    args = parser.parse_args()
+
+    analytics = Analytics(args.shifts, args.gap)
+    begin = time.monotonic()
+    for log in args.logs:
+        analytics.Add(log)
+    wall = time.monotonic() - begin
+    analytics.Report(args.top)
+    print("-- %d records in %d files, %.2f sec (%.0f records/sec) --" %
+          (analytics.records, analytics.files, wall,
+           analytics.records / wall if wall > 0 else 0))
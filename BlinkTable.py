@@ -0,0 +1,221 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Blink Pattern Lookup Table
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import math
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+CHANNELS = 16  # 表に用意するch数（IoExpanderの8ch、GPIO出力もこの範囲）
+PERIOD_MAX = 256  # 点滅周期の上限（回）
+MODE_MIN = 2  # 点滅パターンの番号（0:消灯、1:点灯 は固定）
+MODE_MAX = 255
+
+# 既定の点滅パターン（点灯条件値: (周期, 点灯回数, 位相)、単位は点滅1回=0.15sec）
+# （3bitの点滅カウンタの各bitで点滅させていた時と同じ点灯タイミング）
+PATTERNS_DEFAULT = {
+    2: (8, 4, 4),  # 点滅（長）
+    3: (4, 2, 2),  # 点滅（中）
+    4: (2, 1, 1),  # 点滅（短）
+}
+
+
+def parse_pattern(arg_value):
+    """
+    設定ファイルの点滅パターンの解釈
+    Parameters
+    ----------
+    arg_value : list or dict
+        [周期, 点灯回数, 位相] または {period: , on: , phase: , channels: }
+        （位相はchごとのリストでも良い。channels はchごとに周期・点灯回数を
+          変える時に {ch: [周期, 点灯回数, 位相]} で書く）
+    Returns
+    -------
+    period : int
+        周期（回）
+    on : int
+        1周期の中で点灯する回数
+    phase : int or list
+        位相（回）
+    channels : dict
+        chごとの (周期, 点灯回数, 位相)（指定の無い時はNone）
+    """
+    channels = None
+    if isinstance(arg_value, dict):
+        period = arg_value["period"]
+        on = arg_value.get("on", period // 2)
+        phase = arg_value.get("phase", 0)
+        if arg_value.get("channels") is not None:
+            channels = {}
+            for ch, value in arg_value["channels"].items():
+                channels[int(ch)] = parse_pattern(value)[:3]
+    else:
+        period, on = arg_value[0], arg_value[1]
+        phase = arg_value[2] if len(arg_value) > 2 else 0
+    return period, on, phase, channels
+
+
+class BlinkTable():
+    """
+    点滅パターンの表
+    （パターンごとに、周期の各回で点灯しているchのマスクを前もって計算しておく。
+      出力の値は、パターンを使っているchのマスクとのAND・ORだけで求まる）
+    """
+
+    def __init__(self, arg_patterns=None):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_patterns : dict
+            点灯条件値ごとの点滅パターン（parse_patternの書式）
+            （既定のパターン 2～4 に追加・上書きする。Noneの時は既定のみ）
+        """
+        # 点灯条件値ごとの、回ごとの点灯マスク
+        self.__tables = {}
+        patterns = dict(PATTERNS_DEFAULT)
+        if arg_patterns is not None:
+            patterns.update(arg_patterns)
+        for mode, value in patterns.items():
+            self.Define(int(mode), *parse_pattern(value))
+
+    def Define(self, arg_mode, arg_period, arg_on, arg_phase=0, arg_channels=None):
+        """
+        点滅パターンの定義（表の計算）
+        Parameters
+        ----------
+        arg_mode : int
+            点灯条件値（2～255）
+        arg_period : int
+            周期（回）
+        arg_on : int
+            1周期の中で点灯する回数
+        arg_phase : int or list
+            位相（回）（リストの時はchごと、足りないchは0）
+            （(回 + 位相) % 周期 < 点灯回数 の時に点灯）
+        arg_channels : dict
+            chごとの (周期, 点灯回数, 位相)（指定したchだけ周期・点灯回数も変える）
+            （表の長さは各chの周期の最小公倍数。PERIOD_MAXを超えるとエラー）
+        """
+        if not MODE_MIN <= arg_mode <= MODE_MAX:
+            raise ValueError("blink mode %s is out of range" % (arg_mode))
+        if isinstance(arg_phase, int):
+            phases = [arg_phase] * CHANNELS
+        else:
+            phases = (list(arg_phase) + [0] * CHANNELS)[:CHANNELS]
+        # chごとの (周期, 点灯回数, 位相)
+        settings = [(arg_period, arg_on, phases[ch]) for ch in range(CHANNELS)]
+        if arg_channels is not None:
+            for ch, (period, on, phase) in arg_channels.items():
+                if not 0 <= ch < CHANNELS:
+                    raise ValueError("blink mode %d : ch %s is out of range" % (arg_mode, ch))
+                settings[ch] = (period, on, phase)
+
+        length = 1
+        for period, on, phase in settings:
+            if not 1 <= period <= PERIOD_MAX or not 0 <= on <= period:
+                raise ValueError("blink mode %d : bad period %s / on %s" %
+                                 (arg_mode, period, on))
+            length = length * period // math.gcd(length, period)
+        if length > PERIOD_MAX:
+            raise ValueError("blink mode %d : channel periods repeat after %d ticks (max %d)" %
+                             (arg_mode, length, PERIOD_MAX))
+
+        table = []
+        for tick in range(length):
+            mask = 0
+            for ch, (period, on, phase) in enumerate(settings):
+                if (tick + phase) % period < on:
+                    mask |= 1 << ch
+            table.append(mask)
+        self.__tables[arg_mode] = tuple(table)
+
+    def __contains__(self, arg_mode):
+        """
+        点滅パターンが定義されているか
+        """
+        return arg_mode in self.__tables
+
+    def Image(self, arg_masks, arg_tick):
+        """
+        点滅しているchの出力値
+        Parameters
+        ----------
+        arg_masks : dict
+            点灯条件値ごとの、そのパターンで点滅させるchのマスク
+            （使っていないパターンは入れない事）
+        arg_tick : int
+            点滅カウンタ
+        Returns
+        -------
+        int
+            点灯するchのマスク（点滅していないchは0）
+        """
+        image = 0
+        tables = self.__tables
+        for mode, mask in arg_masks.items():
+            table = tables[mode]
+            image |= mask & table[arg_tick % len(table)]
+        return image
+
+
+def set_mask(arg_masks, arg_ch, arg_old, arg_new):
+    """
+    点灯条件値の変更に合わせて、パターンごとのchのマスクを更新
+    （arg_masksのキーを増減するので、Imageを呼ぶ点滅スレッドと同じロックの中で呼ぶこと）
+    Parameters
+    ----------
+    arg_masks : dict
+        点灯条件値ごとのchのマスク（使っていないパターンは消す）
+    arg_ch : int
+        ch番号
+    arg_old : int
+        変更前の点灯条件値
+    arg_new : int
+        変更後の点灯条件値
+    Returns
+    -------
+    int
+        点滅しているch全体のマスク
+    """
+    bit = 1 << arg_ch
+    if arg_old >= MODE_MIN:
+        mask = arg_masks.get(arg_old, 0) & ~bit
+        if mask == 0:
+            arg_masks.pop(arg_old, None)
+        else:
+            arg_masks[arg_old] = mask
+    if arg_new >= MODE_MIN:
+        arg_masks[arg_new] = arg_masks.get(arg_new, 0) | bit
+    blinking = 0
+    for mask in arg_masks.values():
+        blinking |= mask
+    return blinking
+
+
+def load(arg_config):
+    """
+    設定ファイルの点滅パターンから表を作る
+    （書き間違いがあれば、止まらずに既定の点滅パターンで動かす）
+    Parameters
+    ----------
+    arg_config : dict
+        設定ファイルの blink の内容
+    Returns
+    -------
+    BlinkTable.BlinkTable
+        点滅パターンの表
+    """
+    try:
+        return BlinkTable(arg_config)
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+        print(" > blink setting error, using default patterns : %r" % (e))
+        return BlinkTable()
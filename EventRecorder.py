@@ -0,0 +1,181 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Event Recorder Class
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import struct
+import threading
+import time
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+# ファイル先頭の識別子と書式のバージョン
+MAGIC = b"PKEV"
+VERSION = 1
+
+# ヘッダ（識別子, バージョン, 情報(json)の長さ）
+HEADER = struct.Struct("<4sBH")
+# 1件分（記録開始からの経過時間sec, 種類, 値a, 値b）
+RECORD = struct.Struct("<dBBH")
+
+# 記録の種類
+EV_GPIO = 0  # GPIO入力のエッジ（a:ピン番号, b:レベル）
+EV_I2C_READ = 1  # IoExpanderの入力読み込み（a:0, b:PORTBの値）
+EV_LAMP = 2  # ランプの点灯条件値の変化（a:ch番号, b:点灯条件値）
+EV_STEP = 3  # パターンのステップ完了（a:ステップ番号, b:ch番号）
+EV_WRONG = 4  # 間違ったボタンの押下（a:ステップ番号, b:PORTBの値）
+EV_CYCLE = 5  # サイクル完了（a:パターン数, b:サイクル時間 10ms単位）
+EV_STATE = 6  # ステートの変化（a:変化後のステート, b:変化前のステート）
+EV_OLAT = 7  # IoExpanderの出力ラッチ書き込み（a:0, b:OLATAの値）（FlightRecorderのみ）
+
+# ファイルへの書き出し間隔（sec）
+FLUSH_INTERVAL = 1.0
+
+
+class EventRecorder():
+    """
+    入力イベントの記録
+    （ファイル名を指定しない時はメモリ上のrecordsに溜める）
+    """
+
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # メモリ上の記録（ファイル名を指定しない時）
+    records = None
+    # 記録開始時の情報
+    info = None
+
+    # 記録開始時刻
+    __start = 0.0
+    # 最後にファイルへ書き出した時刻
+    __last_flush = 0.0
+
+    # ------------------------
+    # メンバ関数
+    # ------------------------
+
+    def __init__(self, arg_file=None, arg_clock=time):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_file : str
+            記録先のファイル名（Noneの時はメモリ上に記録）
+        arg_clock :
+            時計（timeモジュール、またはSimBackend.SimClock）
+        """
+        self.__clock = arg_clock
+        self.__lock = threading.Lock()
+        self.__file = None
+        if arg_file is None:
+            self.records = []
+        else:
+            self.__file = open(arg_file, "wb")
+
+    def Start(self, arg_info):
+        """
+        記録開始（ヘッダを書き込む）
+        Parameters
+        ----------
+        arg_info : dict
+            記録開始時の情報（パターンなど、再生に必要なもの）
+        """
+        info = dict(arg_info)
+        info["start"] = self.__clock.time()
+        self.info = info
+        self.__start = self.__clock.monotonic()
+        self.__last_flush = self.__start
+        if self.__file is not None:
+            # 記録する時だけ読み込む（軽量モードの起動を軽くする）
+            import json
+            body = json.dumps(info).encode()
+            self.__file.write(HEADER.pack(MAGIC, VERSION, len(body)))
+            self.__file.write(body)
+
+    def Write(self, arg_kind, arg_a=0, arg_b=0):
+        """
+        1件記録
+        Parameters
+        ----------
+        arg_kind : int
+            種類（EV_*）
+        arg_a : int
+            値a（0～255）
+        arg_b : int
+            値b（0～65535）
+        """
+        now = self.__clock.monotonic()
+        with self.__lock:
+            if self.__file is None:
+                self.records.append((now - self.__start, arg_kind, arg_a, arg_b))
+                return
+            self.__file.write(RECORD.pack(now - self.__start, arg_kind, arg_a, arg_b))
+            if now - self.__last_flush > FLUSH_INTERVAL:
+                # 定期的に書き出す（異常終了しても直前までは残る）
+                self.__last_flush = now
+                self.__file.flush()
+
+    def Close(self):
+        """
+        記録終了
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+
+def read_header(arg_file, arg_name=""):
+    """
+    記録ファイルのヘッダ読み込み（読み込み位置は最初の1件に進む）
+    Parameters
+    ----------
+    arg_file : file
+        バイナリモードで開いた記録ファイル
+    arg_name : str
+        エラー表示用のファイル名
+    Returns
+    -------
+    dict
+        記録開始時の情報
+    """
+    head = arg_file.read(HEADER.size)
+    if len(head) < HEADER.size:
+        raise ValueError("%s is not an event log" % (arg_name))
+    magic, version, length = HEADER.unpack(head)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not an event log" % (arg_name))
+    import json
+    return json.loads(arg_file.read(length).decode())
+
+
+def load(arg_file):
+    """
+    記録ファイルの読み込み
+    Parameters
+    ----------
+    arg_file : str
+        記録ファイル名
+    Returns
+    -------
+    info : dict
+        記録開始時の情報
+    records : list
+        (経過時間, 種類, 値a, 値b) のリスト
+    """
+    with open(arg_file, "rb") as file:
+        info = read_header(file, arg_file)
+        data = file.read()
+    # 書きかけの最後の1件は捨てる
+    end = len(data) // RECORD.size * RECORD.size
+    records = list(RECORD.iter_unpack(data[:end]))
+    return info, records
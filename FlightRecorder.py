@@ -0,0 +1,218 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Crash-Surviving Flight Recorder (mmap ring buffer)
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import itertools
+import mmap
+import os
+import struct
+import time
+
+import EventRecorder
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+# 記録先（tmpfsならSDカードに書き込まず、プロセスが落ちても内容は残る）
+DIR_DEFAULT = "/dev/shm" if os.path.isdir("/dev/shm") else os.environ.get("TMPDIR", "/tmp")
+FILE_DEFAULT = os.path.join(DIR_DEFAULT, "poka-flight.bin")
+CAPACITY_DEFAULT = 65536  # 記録できる件数（1件24byte、約1.5MB）
+
+# ファイル先頭の識別子と書式のバージョン
+MAGIC = b"PKFR"
+VERSION = 1
+
+# ヘッダ（識別子, バージョン, 正常終了, 1件のサイズ, 件数, プロセスID, 開始時刻 epoch sec）
+HEADER = struct.Struct("<4sBBHIId")
+# 1件目の位置（ヘッダの後ろを空けて揃える）
+DATA_OFFSET = 64
+# 1件分（通し番号+1（0は未使用）, 時刻 epoch sec, 種類, 値a, 値b, ゾーン番号）
+# （ゾーン番号は1から。0はゾーン運転でない、またはボード全体の記録）
+RECORD = struct.Struct("<QdBBHB3x")
+# 正常終了フラグの位置
+CLEAN_OFFSET = 5
+
+# 記録の種類（EventRecorderと同じ番号）
+EV_GPIO = EventRecorder.EV_GPIO
+EV_I2C_READ = EventRecorder.EV_I2C_READ
+EV_STEP = EventRecorder.EV_STEP
+EV_WRONG = EventRecorder.EV_WRONG
+EV_CYCLE = EventRecorder.EV_CYCLE
+EV_STATE = EventRecorder.EV_STATE
+EV_OLAT = EventRecorder.EV_OLAT
+
+SECONDS_DEFAULT = 5.0  # 解読する時間（最後の記録から遡るsec）
+
+
+def previous_name(arg_file):
+    """
+    前回の記録の退避先のファイル名
+    """
+    root, ext = os.path.splitext(arg_file)
+    return root + ".prev" + ext
+
+
+class FlightRecorder():
+    """
+    異常終了しても残る入出力の記録
+    （固定サイズのファイルをmmapしてリングバッファとして使う。
+      書き込みはmmapに直接pack_intoするだけなので、メモリも時間も一定）
+    """
+
+    def __init__(self, arg_file=FILE_DEFAULT, arg_capacity=CAPACITY_DEFAULT, arg_clock=time):
+        """
+        コンストラクタ
+        （前回の記録が残っていれば .prev に退避してから、新しく記録を始める）
+        Parameters
+        ----------
+        arg_file : str
+            記録ファイル名
+        arg_capacity : int
+            記録できる件数（古いものから上書きする）
+        arg_clock :
+            時計（timeモジュール、またはSimBackend.SimClock）
+        """
+        self.file = arg_file
+        self.__capacity = arg_capacity
+        self.__clock = arg_clock
+        # 通し番号（next()はGILの中で1回で進むので、ロック無しで複数スレッドから書ける）
+        self.__seq = itertools.count()
+
+        if os.path.exists(arg_file):
+            os.replace(arg_file, previous_name(arg_file))
+        size = DATA_OFFSET + arg_capacity * RECORD.size
+        fd = os.open(arg_file, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.__map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.__map, 0, MAGIC, VERSION, 0, RECORD.size, arg_capacity,
+                         os.getpid(), self.__clock.time())
+
+    def Write(self, arg_kind, arg_a=0, arg_b=0, arg_zone=0):
+        """
+        1件記録
+        Parameters
+        ----------
+        arg_kind : int
+            種類（EV_*）
+        arg_a : int
+            値a（0～255）
+        arg_b : int
+            値b（0～65535）
+        arg_zone : int
+            ゾーン番号（1～255、ゾーンで共有する時に区別する。0はボード全体）
+        """
+        seq = next(self.__seq)
+        RECORD.pack_into(self.__map, DATA_OFFSET + (seq % self.__capacity) * RECORD.size,
+                         seq + 1, self.__clock.time(), arg_kind, arg_a, arg_b, arg_zone)
+
+    def Close(self):
+        """
+        記録終了（正常終了の印を付ける）
+        （他のスレッドが書いていても落ちないよう、mmapは閉じずにプロセス終了に任せる）
+        """
+        self.__map[CLEAN_OFFSET] = 1
+        self.__map.flush()
+
+
+def load(arg_file):
+    """
+    記録ファイルの読み込み
+    Parameters
+    ----------
+    arg_file : str
+        記録ファイル名
+    Returns
+    -------
+    info : dict
+        pid, start（開始時刻 epoch sec）, clean（正常終了したか）, capacity
+    records : list
+        (通し番号, 時刻, 種類, 値a, 値b, ゾーン番号) のリスト（古い順）
+    """
+    with open(arg_file, "rb") as file:
+        data = file.read()
+    if len(data) < DATA_OFFSET:
+        raise ValueError("%s is not a flight record" % (arg_file))
+    magic, version, clean, size, capacity, pid, start = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        raise ValueError("%s is not a flight record" % (arg_file))
+    info = {"pid": pid, "start": start, "clean": clean == 1, "capacity": capacity}
+
+    # 使われた枠だけ取り出して、通し番号順に並べる
+    end = min(len(data), DATA_OFFSET + capacity * RECORD.size)
+    records = []
+    for seq, t, kind, a, b, zone in RECORD.iter_unpack(data[DATA_OFFSET:end]):
+        if seq != 0:
+            records.append((seq - 1, t, kind, a, b, zone))
+    records.sort()
+    return info, records
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE flight record decoder")
+    parser.add_argument("file", nargs="?", default=previous_name(FILE_DEFAULT),
+                        help="記録ファイル（既定: 前回の記録 %s）" % (previous_name(FILE_DEFAULT)))
+    parser.add_argument("-s", "--seconds", type=float, default=SECONDS_DEFAULT,
+                        help="最後の記録から遡って表示する時間（既定: %.0f sec、0で全件）" %
+                        (SECONDS_DEFAULT))
+    parser.add_argument("-z", "--zone", type=int,
+                        help="1つのゾーンの記録だけ表示する（ボード全体の記録は常に表示）")
+    args = parser.parse_args()
+
+    info, records = load(args.file)
+    print("# pid %d, started %s, %s, %d / %d records" % (
+        info["pid"], time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info["start"])),
+        "closed normally" if info["clean"] else "NOT closed (crash or kill)",
+        len(records), info["capacity"]))
+    if not records:
+        raise SystemExit(0)
+    if records[0][0] != 0:
+        print("# oldest %d records overwritten" % (records[0][0]))
+
+    # ステート名（Mainの読み込みは表示の時だけ）
+    try:
+        import Main
+        states = dict((st.value, st.name) for st in Main.State_Main)
+    except ImportError:
+        states = {}
+
+    last = records[-1][1]
+    begin = last - args.seconds if args.seconds > 0 else records[0][1]
+    prev = None
+    for seq, t, kind, a, b, zone in records:
+        if t < begin:
+            continue
+        if args.zone is not None and zone != 0 and zone != args.zone:
+            continue
+        if prev is not None and seq != prev + 1 and args.zone is None:
+            print("# ... %d records missing" % (seq - prev - 1))
+        prev = seq
+        stamp = "%s.%03d %+8.3f" % (time.strftime("%H:%M:%S", time.localtime(t)),
+                                   int(t * 1000) % 1000, t - last)
+        if kind == EV_GPIO:
+            line = "GPIO   pin %d -> %d" % (a, b)
+        elif kind == EV_I2C_READ:
+            line = "READ   %s" % (format(b, "08b"))
+        elif kind == EV_OLAT:
+            line = "OLAT   %s" % (format(b, "08b"))
+        elif kind == EV_STATE:
+            line = "STATE  %s <- %s" % (states.get(a, a), states.get(b, b))
+        elif kind == EV_STEP:
+            line = "STEP   %d ch %d" % (a, b)
+        elif kind == EV_WRONG:
+            line = "WRONG  step %d port %s" % (a, format(b, "08b"))
+        elif kind == EV_CYCLE:
+            line = "CYCLE  %d steps %.2f sec" % (a, b / 100.0)
+        else:
+            line = "kind %d a %d b %d" % (kind, a, b)
+        print("%s  %s%s" % (stamp, "z%-3d " % (zone) if zone != 0 else "", line))
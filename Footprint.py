@@ -0,0 +1,157 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Resident Memory / Thread / Idle CPU Benchmark
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import os
+import select
+import subprocess
+import sys
+import time
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+HOME = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(HOME, "Main.py")
+ARGS_DEFAULT = "--fast"  # Main.pyに渡す引数
+READY_TIMEOUT = 30.0  # 起動完了を待つ上限（sec）
+SETTLE_DEFAULT = 3.0  # 起動後、計測を始めるまでの時間（sec）
+WINDOW_DEFAULT = 10.0  # アイドルCPUの計測時間（sec）
+
+
+def proc_status(arg_pid):
+    """
+    /proc/<pid>/status の読み込み
+    Returns
+    -------
+    dict
+        項目名ごとの値（kBの項目は数値）
+    """
+    status = {}
+    with open("/proc/%d/status" % (arg_pid)) as file:
+        for line in file:
+            key, value = line.split(":", 1)
+            fields = value.split()
+            if len(fields) == 2 and fields[1] == "kB":
+                status[key] = int(fields[0])
+            elif len(fields) == 1 and fields[0].isdigit():
+                status[key] = int(fields[0])
+    return status
+
+
+def proc_cpu(arg_pid):
+    """
+    プロセスのCPU時間（sec）（全スレッドの utime + stime）
+    """
+    with open("/proc/%d/stat" % (arg_pid)) as file:
+        # コマンド名の後ろの utime, stime
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def measure(arg_args, arg_settle=SETTLE_DEFAULT, arg_window=WINDOW_DEFAULT):
+    """
+    Main.pyを起動して、アイドル状態のフットプリントを計測
+    Parameters
+    ----------
+    arg_args : list
+        Main.pyに渡す引数
+    arg_settle : float
+        起動後、計測を始めるまでの時間（sec）
+    arg_window : float
+        アイドルCPUの計測時間（sec）
+    Returns
+    -------
+    dict
+        ready_ms（起動時間）, rss_kb, peak_kb（最大RSS）, threads, cpu（%）
+    """
+    # パイプでも起動完了の表示がすぐ届くように、出力をバッファしない
+    child = subprocess.Popen([sys.executable, "-u", MAIN] + arg_args,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True, bufsize=1)
+    try:
+        # 起動完了の表示を待つ（" > Ready [main] : 123.4 ms after start"）
+        ready_ms = None
+        end = time.monotonic() + READY_TIMEOUT
+        while ready_ms is None:
+            if child.poll() is not None:
+                raise RuntimeError("Main.py exited (%d) : %s" %
+                                   (child.returncode, child.stdout.read().strip()))
+            if not select.select([child.stdout], [], [], max(end - time.monotonic(), 0))[0]:
+                raise RuntimeError("Main.py did not become ready")
+            line = child.stdout.readline()
+            if " > Ready" in line:
+                ready_ms = float(line.rsplit(":", 1)[1].split()[0])
+
+        time.sleep(arg_settle)
+        cpu_begin = proc_cpu(child.pid)
+        begin = time.monotonic()
+        time.sleep(arg_window)
+        cpu_end = proc_cpu(child.pid)
+        elapsed = time.monotonic() - begin
+        status = proc_status(child.pid)
+        return {
+            "ready_ms": ready_ms,
+            "rss_kb": status["VmRSS"],
+            "peak_kb": status["VmHWM"],
+            "threads": status["Threads"],
+            "cpu": 100.0 * (cpu_end - cpu_begin) / elapsed,
+        }
+    finally:
+        child.terminate()
+        child.wait()
+
+
+if __name__ == '__main__':
+    import argparse
+    import shlex
+    parser = argparse.ArgumentParser(
+        description="POKAYOKE footprint benchmark (resident memory, threads, idle CPU)")
+    parser.add_argument("-a", "--args", default=ARGS_DEFAULT,
+                        help="Main.pyに渡す引数（既定: %s）" % (ARGS_DEFAULT))
+    parser.add_argument("-c", "--compare", action="store_true",
+                        help="通常モードと軽量モード（--lean）を両方計測する")
+    parser.add_argument("--settle", type=float, default=SETTLE_DEFAULT,
+                        help="起動後、計測を始めるまでの時間（sec）")
+    parser.add_argument("-w", "--window", type=float, default=WINDOW_DEFAULT,
+                        help="アイドルCPUの計測時間（sec）")
+    parser.add_argument("--max-rss", type=float, metavar="MB",
+                        help="RSSの上限（超えたら終了コード1）")
+    parser.add_argument("--max-threads", type=int, metavar="N",
+                        help="スレッド数の上限（超えたら終了コード1）")
+    parser.add_argument("--max-cpu", type=float, metavar="PERCENT",
+                        help="アイドルCPUの上限（超えたら終了コード1）")
+    args = parser.parse_args()
+
+    runs = [shlex.split(args.args)]
+    if args.compare and "--lean" not in runs[0]:
+        runs.append(runs[0] + ["--lean"])
+
+    failed = []
+    print("%-28s %9s %9s %9s %8s %8s" %
+          ("args", "ready ms", "RSS MB", "peak MB", "threads", "CPU %"))
+    for run in runs:
+        result = measure(run, args.settle, args.window)
+        print("%-28s %9.1f %9.1f %9.1f %8d %8.2f" % (
+            " ".join(run)[:28], result["ready_ms"], result["rss_kb"] / 1024.0,
+            result["peak_kb"] / 1024.0, result["threads"], result["cpu"]))
+        if args.max_rss is not None and result["rss_kb"] / 1024.0 > args.max_rss:
+            failed.append("%s : RSS %.1f MB > %.1f MB" %
+                          (" ".join(run), result["rss_kb"] / 1024.0, args.max_rss))
+        if args.max_threads is not None and result["threads"] > args.max_threads:
+            failed.append("%s : %d threads > %d" %
+                          (" ".join(run), result["threads"], args.max_threads))
+        if args.max_cpu is not None and result["cpu"] > args.max_cpu:
+            failed.append("%s : idle CPU %.2f %% > %.2f %%" %
+                          (" ".join(run), result["cpu"], args.max_cpu))
+
+    for line in failed:
+        print(" > FAIL %s" % (line))
+    sys.exit(1 if failed else 0)
@@ -8,10 +8,17 @@
 # -----------------------------------------------
 
 import time
-import RPi.GPIO as GPIO
-import smbus
 import threading
 
+import BlinkTable
+import Metrics
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Raspberry Pi以外（GPIOを外から渡して使う）
+    GPIO = None
+
 
 class GpioOut():
     """
@@ -32,16 +39,29 @@ class GpioOut():
     __GpioPin = []
     # GPIOの出力ステータス
     # 0:消灯、1:点灯、2:点滅（長）、3:点滅（中）、4:点滅（短）
+    # （5以降は設定ファイルで追加した点滅パターン）
     __GpioStatus = []
 
     # 点滅カウンタ
     __blink = 0
+    # 点滅パターンごとの、そのパターンで点滅しているchのマスク
+    __blink_masks = {}
+    # 点滅しているch全体のマスク
+    __blink_all = 0
+    # 出力中の値（chごとのbit）
+    __image = 0
+    # 点灯ステータスを変更した回数（公開内容の変化の検出用）
+    status_changes = 0
+
+    # 点滅スレッドの最終動作時刻（Watchdog監視用）
+    last_tick = 0.0
 
     # ------------------------
     # メンバ関数
     # ------------------------
 
-    def __init__(self, arg_Pin, arg_verbose=False):
+    def __init__(self, arg_Pin, arg_verbose=False, arg_thread=True, arg_gpio=None,
+                 arg_blink=None):
         """
         コンストラクタ
         Parameters
@@ -50,24 +70,38 @@ class GpioOut():
             出力ピン番号
         arg_verbose:bool
             メッセージの強制表示
+        arg_thread:bool
+            点滅スレッドを起動する（Falseの時はTickを外から呼び出す）
+        arg_gpio:
+            GPIO（Noneの時はRPi.GPIO）
+        arg_blink: BlinkTable.BlinkTable
+            点滅パターンの表（Noneの時は既定のパターン）
         """
         pass
+        # GPIO
+        self.__gpio = GPIO if arg_gpio is None else arg_gpio
+        self.__blink_table = BlinkTable.BlinkTable() if arg_blink is None else arg_blink
+        self.__blink_masks = {}
+        # 出力と点滅マスクの排他（メイン処理・GPIOコールバックと点滅スレッドから呼ばれる）
+        self.__lock = threading.RLock()
         # 引数に渡されたピン番号をプロパティに代入
         self.__GpioPin = arg_Pin
 
         # GPIO初期化
-        GPIO.setmode(GPIO.BCM)
+        self.__gpio.setmode(self.__gpio.BCM)
         self.__GpioStatus = []
         for item in self.__GpioPin:
             # ピンを出力設定
-            GPIO.setup(item, GPIO.OUT, initial=GPIO.LOW)
+            self.__gpio.setup(item, self.__gpio.OUT, initial=self.__gpio.LOW)
             # 制御対象のピン番号のステータスを初期化
             self.__GpioStatus.append(0)
 
         # 点滅制御用スレッド
-        thread_1 = threading.Thread(target=self.event_Thread)
-        thread_1.daemon = True
-        thread_1.start()
+        self.last_tick = time.monotonic()
+        if arg_thread == True:
+            thread_1 = threading.Thread(target=self.event_Thread, name="GpioOut")
+            thread_1.daemon = True
+            thread_1.start()
 
     def __del__(self):
         """
@@ -75,59 +109,58 @@ class GpioOut():
         """
         pass
         # GPIOを解放
-        GPIO.cleanup()
+        self.__gpio.cleanup()
 
     def event_Thread(self):
         """
         スレッド・ランプ出力の点滅
         """
         while True:
-            # 点滅パターン計算
-            # 毎回
-            pattern_1 = self.__blink >> 0 & 0b1
-            # 2回に一回
-            pattern_2 = self.__blink >> 1 & 0b1
-            # 4回に一回
-            pattern_3 = self.__blink >> 2 & 0b1
-
-            # 長点滅の処理
-            if pattern_3 == 1:
-                for i in range(len(self.__GpioPin)):
-                    if self.__GpioStatus[i] == 2:
-                        GPIO.output(self.__GpioPin[i], 1)
-            else:
-                for i in range(len(self.__GpioPin)):
-                    if self.__GpioStatus[i] == 2:
-                        GPIO.output(self.__GpioPin[i], 0)
-
-            # 中点滅の処理
-            if pattern_2 == 1:
-                for i in range(len(self.__GpioPin)):
-                    if self.__GpioStatus[i] == 3:
-                        GPIO.output(self.__GpioPin[i], 1)
-            else:
-                for i in range(len(self.__GpioPin)):
-                    if self.__GpioStatus[i] == 3:
-                        GPIO.output(self.__GpioPin[i], 0)
-
-            # 短点滅の処理
-            if pattern_1 == 1:
-                for i in range(len(self.__GpioPin)):
-                    if self.__GpioStatus[i] == 4:
-                        GPIO.output(self.__GpioPin[i], 1)
-            else:
-                for i in range(len(self.__GpioPin)):
-                    if self.__GpioStatus[i] == 4:
-                        GPIO.output(self.__GpioPin[i], 0)
+            # 動作時刻の記録（点滅間隔のずれも記録）
+            now = time.monotonic()
+            Metrics.BLINK_JITTER_GPIO.Observe(
+                abs(now - self.last_tick - self.__INTERVAL))
+            self.last_tick = now
 
-            # 点滅カウンタ
-            self.__blink += 1
-            if self.__blink > 7:
-                self.__blink = 0
+            # 点滅の更新
+            self.Tick()
 
             # ウェイト
             time.sleep(self.__INTERVAL)
 
+    def Tick(self):
+        """
+        点滅1回分の更新
+        （点滅スレッド、または共有の出力周期から呼び出す）
+        """
+        with self.__lock:
+            # 点滅しているchだけ、表から引いた値に置き換える
+            if self.__blink_all != 0:
+                image = self.__blink_table.Image(self.__blink_masks, self.__blink)
+                image = (self.__image & ~self.__blink_all) | image
+                # 変化したピンだけ出力
+                changed = image ^ self.__image
+                self.__image = image
+                ch = 0
+                while changed != 0:
+                    if changed & 0x01:
+                        self.__gpio.output(self.__GpioPin[ch], (image >> ch) & 0x01)
+                    changed >>= 1
+                    ch += 1
+
+            # 点滅カウンタ
+            self.__blink += 1
+
+    def GetStatus(self):
+        """
+        出力ステータスの取得
+        Returns
+        -------
+        tuple
+            chごとの点灯条件値
+        """
+        return tuple(self.__GpioStatus)
+
     def Update(self, arg_ch, arg_val):
         """
         GPIO出力状態の更新
@@ -138,45 +171,54 @@ class GpioOut():
             (出力ピン番号のリストで指定した順番。0から始まる値で指定)
         arg_val : 
             点灯条件値
-            （0:消灯、1:点灯、2:点滅（長）、3:点滅（中）、4:点滅（短））
+            （0:消灯、1:点灯、2:点滅（長）、3:点滅（中）、4:点滅（短）、
+              5以降は設定ファイルで追加した点滅パターン）
         """
         if arg_ch < len(self.__GpioPin):
             # 受け取ったポート番号が、配列長を超えていないこと
-            if arg_val == 0:
-                # 指定の番号をOFF
-                GPIO.output(self.__GpioPin[arg_ch], 0)
+            if arg_val == 0 or arg_val == 1:
+                # 指定の番号をOFF/ON
+                self.__Output(arg_ch, arg_val)
                 # 点灯ステータスの変更
-                self.__GpioStatus[arg_ch] = 0
-            elif arg_val == 1:
-                # 指定の番号をON
-                GPIO.output(self.__GpioPin[arg_ch], 1)
+                self.__SetStatus(arg_ch, arg_val)
+            elif arg_val in self.__blink_table:
+                # 指定の番号を点滅（パターンは表で決まる）
                 # 点灯ステータスの変更
-                self.__GpioStatus[arg_ch] = 1
-            elif arg_val == 2:
-                # 指定の番号を点滅・長
-                # 点灯ステータスの変更
-                self.__GpioStatus[arg_ch] = 2
-                pass
-            elif arg_val == 3:
-                # 指定の番号を点滅・中
-                # 点灯ステータスの変更
-                self.__GpioStatus[arg_ch] = 3
-                pass
-            elif arg_val == 4:
-                # 指定の番号を点滅・短
-                self.__GpioStatus[arg_ch] = 4
-                pass
+                self.__SetStatus(arg_ch, arg_val)
             else:
                 pass
         elif arg_ch == 99:
             # ポート99番を指定されたときは、全ポートを同時操作
-            for i in self.__GpioPin:
+            for ch in range(len(self.__GpioPin)):
                 if arg_val == 1:
                     # 全てON
-                    GPIO.output(i, 1)
+                    self.__Output(ch, 1)
                 else:
                     # 全てOFF
-                    GPIO.output(i, 0)
+                    self.__Output(ch, 0)
         else:
             # それ以外の時はエラー
             print("Port %s is not found." % (arg_ch))
+
+    def __SetStatus(self, arg_ch, arg_val):
+        """
+        点灯ステータスの変更（点滅パターンごとのマスクも更新する）
+        """
+        if self.__GpioStatus[arg_ch] != arg_val:
+            # 点滅スレッドのTickがマスクを読んでいる間は変更しない
+            with self.__lock:
+                self.__blink_all = BlinkTable.set_mask(
+                    self.__blink_masks, arg_ch, self.__GpioStatus[arg_ch], arg_val)
+                self.__GpioStatus[arg_ch] = arg_val
+                self.status_changes += 1
+
+    def __Output(self, arg_ch, arg_val):
+        """
+        1ピン分の出力（出力中の値も更新する）
+        """
+        with self.__lock:
+            self.__gpio.output(self.__GpioPin[arg_ch], arg_val)
+            if arg_val == 1:
+                self.__image |= 1 << arg_ch
+            else:
+                self.__image &= ~(1 << arg_ch)
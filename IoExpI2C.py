@@ -7,10 +7,19 @@
 # Copyright (C) 2019 myasu.
 # -----------------------------------------------
 
-import smbus
 import threading
 import time
 
+import BlinkTable
+import EventRecorder
+import Metrics
+
+try:
+    import smbus
+except ImportError:
+    # Raspberry Pi以外（バスを外から渡して使う）
+    smbus = None
+
 
 # ------------------------
 # 定数
@@ -20,6 +29,7 @@ import time
 CHANNEL = 1  # i2c割り当てチャンネル 1 or 0
 REG_IODIRA_INOUT = 0x00  # Aポート側設定（1:入力、0:出力）
 REG_IODIRB_INOUT = 0xff  # Bポート側設定（1:入力、0:出力）
+REG_IOCON_CONFIG = 0b00000110  # IOCON設定値（ODR, INTPOL）
 ICADDR_DEFAULT = 0x20   # スレーブ側ICアドレス
 
 # MCP23017 入出力設定レジスタ（変更不可）
@@ -91,6 +101,14 @@ class IoExpI2C():
 
     # 点滅速度（間隔sec）
     __INTERVAL = 0.15
+    # ICのリセットを確認する間隔（点滅の回数）
+    __RECOVER_TICKS = 8
+
+    # I2C通信エラー時のリトライ回数
+    __RETRY = 5
+    # リトライ間隔（sec）（1回ごとに倍にする）
+    __RETRY_WAIT = 0.001
+    __RETRY_WAIT_MAX = 0.016
 
     # ------------------------
     # メンバ変数
@@ -98,19 +116,59 @@ class IoExpI2C():
 
     # GPIOの出力ステータス
     # 0:消灯、1:点灯、2:点滅（長）、3:点滅（中）、4:点滅（短）
-    __GpioStatus = [0, 0, 0, 0, 0, 0, 0, 0]
+    # （5以降は設定ファイルで追加した点滅パターン）
+    __GpioStatus = []
 
     # 点滅カウンタ
     __blink = 0
+    # 点滅パターンごとの、そのパターンで点滅しているchのマスク
+    __blink_masks = {}
+    # 点滅しているch全体のマスク
+    __blink_all = 0
+
+    # 点滅スレッドの最終動作時刻（Watchdog監視用）
+    last_tick = 0.0
 
     #デバッグモード
     __debug=False
 
+    # 出力ラッチ(OLATA)に書き込む値
+    # （ICがリセットされた時に書き戻す）
+    __olat = 0x00
+    # 出力ラッチに書き込み済みの値（変化が無ければ書き込まない）
+    __olat_written = None
+    # 出力の書き込みをFlushまで遅らせる（共有バスでまとめて書き込む）
+    __defer = False
+
+    # I2C通信エラーからの復旧待ち
+    __fault_pending = False
+    # 復旧処理中
+    __recovering = False
+    # 通信できない状態が続いている間、その始まりのlost_count（Noneの時は通信できている）
+    # （エラーの表示は、通信できなくなった時と戻った時の1回ずつ）
+    __lost_since = None
+
+    # I2C通信エラーの回数
+    fault_count = 0
+    # リトライしても通信できなかった回数
+    lost_count = 0
+    # ICのリセットを検出して再設定した回数
+    reset_count = 0
+    # 点灯ステータスを変更した回数（公開内容の変化の検出用）
+    status_changes = 0
+
+    # 入力・点灯の記録（EventRecorder、Noneの時は記録しない）
+    recorder = None
+    # 入力・出力ラッチの常時記録（FlightRecorder、Noneの時は記録しない）
+    flight = None
+
     # ------------------------
     # メンバ関数
     # ------------------------
 
-    def __init__(self, arg_icaddr=ICADDR_DEFAULT, arg_verbose=False):
+    def __init__(self, arg_icaddr=ICADDR_DEFAULT, arg_verbose=False, arg_fast=False,
+                 arg_bus=None, arg_thread=True, arg_defer=False, arg_clock=time,
+                 arg_blink=None):
         '''
         初期化
         Parameters
@@ -119,35 +177,54 @@ class IoExpI2C():
             I2Cアドレス
         arg_verbose: bool
             メッセージの強制表示
+        arg_fast: bool
+            高速起動（設定済みのレジスタは書き直さない）
+        arg_bus:
+            共有するバス（Noneの時はSMBusを開く）
+        arg_thread: bool
+            点滅スレッドを起動する（Falseの時はTickを外から呼び出す）
+        arg_defer: bool
+            出力の書き込みをFlushの呼び出しまで遅らせる
+        arg_clock:
+            時計（timeモジュール、またはSimBackend.SimClock）
+        arg_blink: BlinkTable.BlinkTable
+            点滅パターンの表（Noneの時は既定のパターン）
         '''
         # 定数の設定
         self.__ICADDR = arg_icaddr
+        self.__defer = arg_defer
+        self.__clock = arg_clock
+        self.__GpioStatus = [0, 0, 0, 0, 0, 0, 0, 0]
+        self.__inputs = [0, 0, 0, 0, 0, 0, 0, 0]
+        self.__blink_table = BlinkTable.BlinkTable() if arg_blink is None else arg_blink
+        self.__blink_masks = {}
 
         #デバッグモード
         self.__debug = arg_verbose
 
+        # バス操作の排他（メイン処理と点滅スレッドから呼ばれる）
+        self.__lock = threading.RLock()
+
         # IoExpander ICの初期化
         # I2Cの設定
-        self.bus = smbus.SMBus(CHANNEL)
-        # PORTAの設定
-        self.bus.write_byte_data(
-            self.__ICADDR, REG_IOCONA, 0b00000110)  # コンフィグ
-        self.bus.write_byte_data(
-            self.__ICADDR, REG_IODIRA, REG_IODIRA_INOUT)  # 入出力
-        # PORTBの設定
-        self.bus.write_byte_data(
-            self.__ICADDR, REG_IOCONB, 0b00000110)  # コンフィグ
-        self.bus.write_byte_data(
-            self.__ICADDR, REG_IODIRB, REG_IODIRB_INOUT)  # 入出力
-        self.bus.write_byte_data(
-            self.__ICADDR, REG_GPPUB, REG_IODIRB_INOUT)  # プルアップ
-        self.bus.write_byte_data(
-            self.__ICADDR, REG_GPINTENB, REG_IODIRB_INOUT)  # 割込
+        if arg_bus is None:
+            self.bus = smbus.SMBus(CHANNEL)
+        else:
+            self.bus = arg_bus
+        # レジスタの設定
+        self.InitRegisters(arg_fast)
+        # 現在の出力を読み込み
+        olat = self.__Transfer(self.bus.read_byte_data, REG_OLATA)
+        if olat is not None:
+            self.__olat = olat
+            self.__olat_written = olat
 
         # 点滅制御用スレッド
-        thread_1 = threading.Thread(target=self.event_Thread)
-        thread_1.daemon = True
-        thread_1.start()
+        self.last_tick = time.monotonic()
+        if arg_thread == True:
+            thread_1 = threading.Thread(target=self.event_Thread, name="IoExpI2C")
+            thread_1.daemon = True
+            thread_1.start()
 
     def __del__(self):
         """
@@ -155,11 +232,132 @@ class IoExpI2C():
         """
         pass
 
+    def InitRegisters(self, arg_check=False):
+        """
+        IoExpander ICのレジスタ設定
+        Parameters
+        ----------
+        arg_check : bool
+            Trueの時、設定レジスタを一括で読み出し、
+            設定済みであれば書き込みを省略する
+        """
+        if arg_check == True:
+            # IODIRA～GPPUBを1回のトランザクションで読み込み
+            # （IOCON.SEQOP=0なのでアドレスが自動で進む）
+            regs = self.__Transfer(
+                self.bus.read_i2c_block_data, REG_IODIRA, REG_GPPUB + 1)
+            if (regs is not None
+                    and regs[REG_IOCONA] == REG_IOCON_CONFIG
+                    and regs[REG_IODIRA] == REG_IODIRA_INOUT
+                    and regs[REG_IODIRB] == REG_IODIRB_INOUT
+                    and regs[REG_GPPUB] == REG_IODIRB_INOUT
+                    and regs[REG_GPINTENB] == REG_IODIRB_INOUT):
+                # 前回起動時の設定が残っている
+                self.print("Registers already configured.")
+                return
+
+        # PORTAの設定
+        self.__Transfer(
+            self.bus.write_byte_data, REG_IOCONA, REG_IOCON_CONFIG)  # コンフィグ
+        self.__Transfer(
+            self.bus.write_byte_data, REG_IODIRA, REG_IODIRA_INOUT)  # 入出力
+        # PORTBの設定
+        self.__Transfer(
+            self.bus.write_byte_data, REG_IOCONB, REG_IOCON_CONFIG)  # コンフィグ
+        self.__Transfer(
+            self.bus.write_byte_data, REG_IODIRB, REG_IODIRB_INOUT)  # 入出力
+        self.__Transfer(
+            self.bus.write_byte_data, REG_GPPUB, REG_IODIRB_INOUT)  # プルアップ
+        self.__Transfer(
+            self.bus.write_byte_data, REG_GPINTENB, REG_IODIRB_INOUT)  # 割込
+
+    def __Transfer(self, arg_func, *arg_args):
+        """
+        リトライ付きのI2C通信
+        Parameters
+        ----------
+        arg_func :
+            smbusの関数（read_byte_data など）
+        arg_args :
+            I2Cアドレス以降の引数
+        Returns
+        -------
+        読み込んだ値（リトライしても通信できない時はNone）
+        """
+        with self.__lock:
+            wait = self.__RETRY_WAIT
+            for retry in range(self.__RETRY):
+                Metrics.COUNTERS[Metrics.I2C_TRANSFERS] += 1
+                try:
+                    result = arg_func(self.__ICADDR, *arg_args)
+                except OSError as e:
+                    # 通信エラー：間隔を空けてリトライ
+                    self.fault_count += 1
+                    Metrics.COUNTERS[Metrics.I2C_ERRORS] += 1
+                    self.__fault_pending = True
+                    self.print("I2C error (retry %d) : %s" % (retry, e))
+                    self.__clock.sleep(wait)
+                    wait = min(wait * 2, self.__RETRY_WAIT_MAX)
+                    continue
+                if self.__lost_since is not None:
+                    self.print("I2C recovered : addr 0x%02x, %d transfers lost" %
+                               (self.__ICADDR, self.lost_count - self.__lost_since), True)
+                    self.__lost_since = None
+                if self.__fault_pending == True and self.__recovering == False:
+                    # 通信が戻ったので、ICの状態を確認して復旧
+                    self.Recover()
+                return result
+            # 諦める（次に通信できた時に復旧する）
+            self.lost_count += 1
+            Metrics.COUNTERS[Metrics.I2C_LOST] += 1
+            if self.__lost_since is None:
+                self.__lost_since = self.lost_count - 1
+                self.print("I2C lost : addr 0x%02x" % (self.__ICADDR), True)
+            else:
+                self.print("I2C lost : addr 0x%02x" % (self.__ICADDR))
+            return None
+
+    def Recover(self, arg_force=True):
+        """
+        ICのリセット検出と復旧
+        （リセットされていればレジスタを再設定し、出力を書き戻す）
+        Parameters
+        ----------
+        arg_force : bool
+            Trueの時、リセットされていなくても出力を書き戻す
+        """
+        with self.__lock:
+            self.__recovering = True
+            try:
+                # 入出力方向がリセット時の値(0xff)に戻っていないか
+                iodir = self.__Transfer(self.bus.read_byte_data, REG_IODIRA)
+                if iodir is None:
+                    # まだ通信できない
+                    return
+                self.__fault_pending = False
+                if iodir != REG_IODIRA_INOUT:
+                    self.reset_count += 1
+                    Metrics.COUNTERS[Metrics.I2C_RESETS] += 1
+                    self.print("IoExpander reset detected : addr 0x%02x" %
+                               (self.__ICADDR), True)
+                    self.InitRegisters()
+                elif arg_force == False:
+                    return
+                # 出力を書き戻す
+                olat = self.__olat
+                if self.flight is not None:
+                    self.flight.Write(EventRecorder.EV_OLAT, 0, olat)
+                self.__Transfer(self.bus.write_byte_data, REG_OLATA, olat)
+                if self.__fault_pending == False:
+                    self.__olat_written = olat
+            finally:
+                self.__recovering = False
+
     def print(self, arg_message, arg_err=False):
         """
         デバッグ用メッセージ
         """
-        if self.__debug == True:
+        if self.__debug == True or arg_err == True:
             print(" > %s" % (arg_message))
 
     def event_Thread(self):
@@ -167,90 +365,96 @@ class IoExpI2C():
         スレッド・ランプ出力の点滅
         """
         while True:
-            # 点滅パターン計算
-            # 毎回
-            pattern_1 = self.__blink >> 0 & 0b1
-            # 2回に一回
-            pattern_2 = self.__blink >> 1 & 0b1
-            # 4回に一回
-            pattern_3 = self.__blink >> 2 & 0b1
-
-            # 長点滅の処理
-            if pattern_3 == 1:
-                for i in range(8):
-                    if self.__GpioStatus[i] == 2:
-                        self.IoExpUpdate(i, 1)
-            else:
-                for i in range(8):
-                    if self.__GpioStatus[i] == 2:
-                        self.IoExpUpdate(i, 0)
-
-            # 中点滅の処理
-            if pattern_2 == 1:
-                for i in range(8):
-                    if self.__GpioStatus[i] == 3:
-                        self.IoExpUpdate(i, 1)
-            else:
-                for i in range(8):
-                    if self.__GpioStatus[i] == 3:
-                        self.IoExpUpdate(i, 0)
-
-            # 短点滅の処理
-            if pattern_1 == 1:
-                for i in range(8):
-                    if self.__GpioStatus[i] == 4:
-                        self.IoExpUpdate(i, 1)
-            else:
-                for i in range(8):
-                    if self.__GpioStatus[i] == 4:
-                        self.IoExpUpdate(i, 0)
+            # 動作時刻の記録（点滅間隔のずれも記録）
+            now = time.monotonic()
+            Metrics.BLINK_JITTER_IOEXP.Observe(
+                abs(now - self.last_tick - self.__INTERVAL))
+            self.last_tick = now
 
-            # 点滅カウンタ
-            self.__blink += 1
-            if self.__blink > 7:
-                self.__blink = 0
+            # 点滅の更新
+            self.Tick()
 
             # ウェイト
             time.sleep(self.__INTERVAL)
 
-    def Flash(self, arg_mode=0):
+    def Tick(self):
+        """
+        点滅1回分の更新
+        （点滅スレッド、または共有の出力周期から呼び出す）
+        """
+        with self.__lock:
+            # 点滅しているchだけ、表から引いた値に置き換える
+            if self.__blink_all != 0:
+                image = self.__blink_table.Image(self.__blink_masks, self.__blink)
+                self.__olat = (self.__olat & ~self.__blink_all) | image
+
+            # 点滅カウンタ
+            self.__blink += 1
+            if self.__blink % self.__RECOVER_TICKS == 0:
+                # 通信エラーが無くてもICがリセットされていないか確認
+                self.Recover(arg_force=False)
+
+            if self.__defer == False:
+                # 変化したchをまとめて1回で書き込む
+                self.Flush()
+
+    def Flash(self, arg_mode=0, arg_channels=None):
         """
         フラッシュ（流星）点灯
         Parameters
         ----------
         arg_mode :
             点灯パターン(0:流星、1:点滅)
+        arg_channels : list
+            点灯するch（ゾーン運転時。Noneの時は全ch）
+        """
+        for wait in self.FlashSteps(arg_mode, arg_channels):
+            self.__clock.sleep(wait)
+
+    def FlashSteps(self, arg_mode=0, arg_channels=None):
+        """
+        フラッシュ（流星）点灯を1コマずつ進める
+        （軽量モードでは、メインループから1コマずつ進める）
+        Parameters
+        ----------
+        arg_mode :
+            点灯パターン(0:流星、1:点滅)
+        arg_channels : list
+            点灯するch（ゾーン運転時。Noneの時は全ch）
+        Yields
+        ------
+        float
+            次のコマまでのウェイト（sec）
         """
+        channels = range(8) if arg_channels is None else arg_channels
         if arg_mode == 0:
             # 流星左～右
-            for i in range(8):
+            for i in channels:
                 self.IoExpUpdate(i, 1)
-                time.sleep(0.03)
-            for i in range(8):
+                yield 0.03
+            for i in channels:
                 self.IoExpUpdate(i, 0)
-                time.sleep(0.03)
+                yield 0.03
         elif arg_mode == 1:
             # 流星右～左
-            for i in range(8):
-                self.IoExpUpdate(7 - i, 1)
-                time.sleep(0.03)
-            for i in range(8):
-                self.IoExpUpdate(7 - i, 0)
-                time.sleep(0.03)
+            for i in reversed(channels):
+                self.IoExpUpdate(i, 1)
+                yield 0.03
+            for i in reversed(channels):
+                self.IoExpUpdate(i, 0)
+                yield 0.03
         elif arg_mode == 2:
             # 点滅
             for j in range(4):
-                for i in range(8):
+                for i in channels:
                     self.IoExpUpdate(i, 1)
-                time.sleep(0.08)
-                for i in range(8):
+                yield 0.08
+                for i in channels:
                     self.IoExpUpdate(i, 0)
-                time.sleep(0.08)
+                yield 0.08
         else:
             pass
 
-        pass
-
     def Update(self, arg_ch, arg_val):
         """
         出力状態の更新
@@ -261,26 +465,27 @@ class IoExpI2C():
             (ポート9番を指定されたときは、全ポートを同時操作)
         arg_val : 
             点灯条件値
-            （0:消灯、1:点灯、2:点滅（長）、3:点滅（中）、4:点滅（短））
+            （0:消灯、1:点灯、2:点滅（長）、3:点滅（中）、4:点滅（短）、
+              5以降は設定ファイルで追加した点滅パターン）
         """
-        if arg_val < 5:
-            # 受け取った点灯条件値が、5を超えていないこと
+        if arg_val in (0, 1) or arg_val in self.__blink_table:
+            # 受け取った点灯条件値が、定義されていること
             if arg_ch < 8:
                 # 受け取ったポート番号が、8を超えていないこと
                 if arg_val == 0:
                     # 指定の番号をOFF
                     self.IoExpUpdate(arg_ch, 0)
                     # 点灯ステータスの変更
-                    self.__GpioStatus[arg_ch] = 0
+                    self.__SetStatus(arg_ch, 0)
                 elif arg_val == 1:
                     # 指定の番号をON
                     self.IoExpUpdate(arg_ch, 1)
                     # 点灯ステータスの変更
-                    self.__GpioStatus[arg_ch] = 1
-                elif arg_val >= 2 and arg_val <= 4:
-                    # 指定の番号を点滅・長・中・短
+                    self.__SetStatus(arg_ch, 1)
+                elif arg_val >= 2:
+                    # 指定の番号を点滅（パターンは表で決まる）
                     # 点灯ステータスの変更
-                    self.__GpioStatus[arg_ch] = arg_val
+                    self.__SetStatus(arg_ch, arg_val)
                 else:
                     pass
             elif arg_ch == 9:
@@ -289,7 +494,7 @@ class IoExpI2C():
                     # 指定の番号をON
                     self.IoExpUpdate(ch, arg_val)
                     # 点灯ステータスの変更
-                    self.__GpioStatus[ch] = arg_val
+                    self.__SetStatus(ch, arg_val)
             else:
                 # それ以外の時はエラー
                 self.print("Port %s is not found." % (arg_ch))
@@ -297,6 +502,20 @@ class IoExpI2C():
             # それ以外の時はエラー
             self.print("val error %d." % (arg_ch))
 
+    def __SetStatus(self, arg_ch, arg_val):
+        """
+        点灯ステータスの変更（変化した時だけ記録する）
+        """
+        if self.__GpioStatus[arg_ch] != arg_val:
+            # 点滅スレッドのTickがマスクを読んでいる間は変更しない
+            with self.__lock:
+                self.__blink_all = BlinkTable.set_mask(
+                    self.__blink_masks, arg_ch, self.__GpioStatus[arg_ch], arg_val)
+                self.__GpioStatus[arg_ch] = arg_val
+                self.status_changes += 1
+            if self.recorder is not None:
+                self.recorder.Write(EventRecorder.EV_LAMP, arg_ch, arg_val)
+
     def IoExpUpdate(self, arg_ch, arg_val):
         """
         IoExpander出力
@@ -309,64 +528,121 @@ class IoExpI2C():
             点灯条件値
             （0:消灯、1:点灯）
         """
+        with self.__lock:
+            if self.__SetOutput(arg_ch, arg_val) and self.__defer == False:
+                self.Flush()
+
+    def __SetOutput(self, arg_ch, arg_val):
+        """
+        出力ラッチに書き込む値の変更（書き込みはFlushで行う）
+        Parameters
+        ----------
+        arg_ch :
+            ch番号(0から始まる値で指定)
+        arg_val :
+            点灯条件値
+            （0:消灯、1:点灯）
+        Returns
+        -------
+        bool
+            ch番号が正しければTrue
+        """
         port = arg_ch
         if (0 <= port) and (port <= 7):
             # 受け取ったポート番号が、範囲を超えてないこと
+            val = 0x01 << port
             if arg_val == 1:
                 # 指定の番号をON
-                val = 0x01 << port
-                # 現在のON場所を読み込み
-                current = self.bus.read_byte_data(self.__ICADDR, REG_GPIOA)
                 # 制御する箇所をORして作る
-                control = current | val
+                self.__olat = self.__olat | val
             else:
                 # 指定の番号をOFF
-                val = 0x01 << port
-                # 現在のON場所を読み込み
-                current = self.bus.read_byte_data(self.__ICADDR, REG_GPIOA)
                 # 制御する箇所をANDして作る
-                control = current & ~val
-            # ON場所を更新
-            self.bus.write_byte_data(self.__ICADDR, REG_OLATA, control)
+                self.__olat = self.__olat & ~val
         elif port == 9:
             # ポート*9番を指定されたときは、全ポートを同時操作
             if arg_val == 1:
                 # 全てON
-                self.bus.write_byte_data(self.__ICADDR, REG_OLATA, 0xff)
+                self.__olat = 0xff
             else:
                 # 全てOFF
-                self.bus.write_byte_data(self.__ICADDR, REG_OLATA, 0x00)
+                self.__olat = 0x00
         else:
             # それ以外の時はエラー
             print("Ch %s is not found." % (arg_ch))
+            return False
+        return True
+
+    def Flush(self):
+        """
+        出力ラッチへの書き込み
+        （前回書き込んだ値から変化した時だけバスに書き込む）
+        """
+        with self.__lock:
+            control = self.__olat
+            if control == self.__olat_written:
+                return
+            # ON場所を更新
+            # （通信できなくても、復旧時に書き戻せるように記録済み）
+            if self.flight is not None:
+                self.flight.Write(EventRecorder.EV_OLAT, 0, control)
+            self.__Transfer(self.bus.write_byte_data, REG_OLATA, control)
+            if self.__fault_pending == False:
+                self.__olat_written = control
+
+    def GetStatus(self):
+        """
+        出力ステータスの取得
+        Returns
+        -------
+        tuple
+            chごとの点灯条件値
+        """
+        return tuple(self.__GpioStatus)
+
+    def GetOutput(self):
+        """
+        出力ラッチに書き込んだ値の取得（バス操作はしない）
+        Returns
+        -------
+        int
+            OLATAの値
+        """
+        return self.__olat
+
+    def ReadPort(self):
+        """
+        GPIO入力の読み込み（割込みもクリアされる）
+        Returns
+        -------
+        int
+            GPIOBの値（通信できない時は入力無しとして0）
+        """
+        # GPIO読み込み
+        i2c_in_val = self.__Transfer(self.bus.read_byte_data, REG_GPIOB)
+        if i2c_in_val is None:
+            # 通信できない時は入力無しとする
+            i2c_in_val = 0
+        if self.recorder is not None:
+            self.recorder.Write(EventRecorder.EV_I2C_READ, 0, i2c_in_val)
+        if self.flight is not None:
+            self.flight.Write(EventRecorder.EV_I2C_READ, 0, i2c_in_val)
+        return i2c_in_val
 
     def Read(self):
         """
         GPIO入力状態の更新
-        Parameters
-        ----------
-        arg_ch : 
-            ch番号
-            (出力ピン番号のリストで指定した順番。0から始まる値で指定)
+        Returns
+        -------
+        list
+            chごとのON状態
         """
-        # GPIO読み込み
-        i2c_in_val = self.bus.read_byte_data(self.__ICADDR, REG_GPIOB)
+        i2c_in_val = self.ReadPort()
 
-        # 指定のポートだけ読み込み
-        # 現在のH/L状態の一時格納
-        port_now = []
-        val_now = []
+        # chごとのON状態に分ける
+        # （毎回リストを作らず、確保済みのリストを書き換える）
+        val_now = self.__inputs
         for ch in range(8):
-            # ON状態のチェック
-            if (i2c_in_val >> ch) & 0x01 == 1:
-                val = 1
-            else:
-                val = 0
-            # 現在のH/L状態に追記
-            port_now.append(ch)
-            val_now.append(val)
-        # ログの表示
-        # print("Port (IN): %s -> %s (INTCAP) %s " %
-        #        (port_now, val_now, bin(i2c_in_val)))
-        # 読んだ値を返す
+            val_now[ch] = (i2c_in_val >> ch) & 0x01
+        # 読んだ値を返す（次のReadで書き換わるので、残す時はコピーすること）
         return val_now
@@ -0,0 +1,468 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Synthetic Operator Load Generator
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import heapq
+import math
+import os
+import random
+import time
+from array import array
+
+import EventRecorder
+import IoExpI2C
+import Main
+import Publisher
+import SimBackend
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+STEP = 0.01  # メインループの周期（sec）（Main.Loopと同じ）
+PIN_A = 21  # ボタンAのGPIOピン番号（Main.__gpio_input[0]）
+
+# イベントの種類
+EV_DOWN = 0  # ボタンを押す
+EV_UP = 1  # ボタンを離す
+EV_TOGGLE = 2  # チャタリング（入力が一瞬反転する）
+EV_LOOK = 3  # 操作者がランプを見て次の操作を決める
+EV_GPIO = 4  # GPIOボタンのエッジ
+
+# 操作者モデル
+MODELS = {
+    # 普通の作業者
+    "normal": {
+        "rate": 1.0,  # 1秒あたりの押下回数（考える時間の逆数の平均）
+        "error": 0.03,  # 間違ったボタンを押す確率
+        "chord": 0.01,  # 隣のボタンも一緒に押してしまう確率
+        "chord_ms": 40.0,  # 同時押しのずれ（ms）の最大値
+        "hold_ms": 180.0,  # 押している時間の平均（ms）
+        "long": 0.01,  # 長押しする確率
+        "long_ms": 1500.0,  # 長押しの時間の平均（ms）
+        "bounce": 0.05,  # チャタリングが起きる確率
+        "bounce_ms": 3.0,  # チャタリングの時間（ms）
+        "react_ms": 300.0,  # ランプを見て判断するまでの時間（ms）
+    },
+    # 速い作業者（点灯演出中でも次のボタンを押す）
+    "fast": {
+        "rate": 4.0, "error": 0.05, "chord": 0.03, "chord_ms": 20.0,
+        "hold_ms": 80.0, "long": 0.0, "long_ms": 0.0,
+        "bounce": 0.05, "bounce_ms": 3.0, "react_ms": 150.0,
+    },
+    # 間違いが多い作業者
+    "sloppy": {
+        "rate": 1.5, "error": 0.25, "chord": 0.10, "chord_ms": 60.0,
+        "hold_ms": 150.0, "long": 0.05, "long_ms": 2000.0,
+        "bounce": 0.10, "bounce_ms": 5.0, "react_ms": 250.0,
+    },
+    # スイッチの接触が悪い
+    "bouncy": {
+        "rate": 1.0, "error": 0.03, "chord": 0.01, "chord_ms": 40.0,
+        "hold_ms": 150.0, "long": 0.01, "long_ms": 1500.0,
+        "bounce": 0.9, "bounce_ms": 15.0, "react_ms": 300.0,
+    },
+}
+
+
+class LoadGen():
+    """
+    操作者モデルでMainを動かす負荷試験
+    （SimBackendの仮想時計で動かすので、実時間より速く進む）
+    """
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 処理した入力イベント数
+    events = 0
+    # 押下回数（正しいボタン / 間違えたボタン / 同時押し / 長押し / チャタリング）
+    presses_ok = 0
+    presses_wrong = 0
+    presses_chord = 0
+    presses_long = 0
+    presses_bounce = 0
+    # 正しいボタンを押したのに進まなかった回数
+    lost = 0
+    # 想定外のステート遷移（押していないのに進んだ、DO以外に移った 等）
+    wrong_transitions = 0
+
+    def __init__(self, arg_model, arg_pattern=None, arg_seed=0, arg_record=None, arg_epoch=0.0,
+                 arg_publish=None, arg_name="main"):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_model : dict
+            操作者モデル（MODELSと同じ項目）
+        arg_pattern : list
+            点灯パターン（Noneの時はMainの既定値）
+        arg_seed : int
+            乱数の種
+        arg_record : str
+            記録ファイル名（Noneの時は記録しない）
+        arg_epoch : float
+            仮想時計の起点（epoch sec、記録の時刻に使う）
+        arg_publish : str
+            イベントの配信先 "グループ:ポート"（Noneの時は配信しない）
+        arg_name : str
+            ステーション名
+        """
+        self.__model = arg_model
+        self.__rnd = random.Random(arg_seed)
+
+        self.backend = SimBackend.SimBackend(arg_epoch=arg_epoch)
+        self.__clock = self.backend.clock
+        self.recorder = None
+        if arg_record is not None:
+            self.recorder = EventRecorder.EventRecorder(arg_record, self.__clock)
+        self.publisher = None
+        if arg_publish is not None:
+            # 送信は仮想時計で進めるので、Runの区切りごとにまとめて送る
+            group, port = arg_publish.rsplit(":", 1)
+            self.publisher = Publisher.Publisher(
+                arg_name, group, int(port), arg_clock=self.__clock, arg_thread=False)
+        self.main = Main.Main(arg_station={"name": arg_name}, arg_backend=self.backend,
+                              arg_recorder=self.recorder, arg_publisher=self.publisher)
+        if arg_pattern is not None:
+            self.main.pattern = list(arg_pattern)
+        self.__pattern = self.main.pattern
+        self.main.Setup()
+
+        # イベント待ち行列 (時刻, 通し番号, 種類, ch)
+        self.__queue = []
+        self.__seq = 0
+        # 次にメインループを回す時刻（Noneの時は予定なし）
+        self.__next_step = None
+        # PORTBの入力値
+        self.__port = 0
+
+        # 操作者が押した正しいボタン（押した時刻、押した時の進捗）
+        self.__pending = None
+        # 操作者が最後に押したボタン（正しいボタンを狙ったか、押した時の進捗）
+        self.__last_press = None
+        # 最後に確認した進捗
+        self.__progress = 0
+        # 運転中（ボタンAで運転を開始した）
+        self.__running = False
+        # 最初の操作を予定済み
+        self.__started = False
+
+        # 押してから進むまでの時間（sec）
+        self.latency = array("d")
+
+    def __Push(self, arg_t, arg_kind, arg_ch=0):
+        """
+        イベントの追加
+        """
+        self.__seq += 1
+        heapq.heappush(self.__queue, (arg_t, self.__seq, arg_kind, arg_ch))
+
+    def __Progress(self):
+        """
+        進捗（完了したサイクル数×パターン数＋進捗カウンタ）
+        """
+        state, counter, cycles, wrong = self.main.GetState()
+        return state, cycles * len(self.__pattern) + counter, counter
+
+    def __Press(self, arg_now):
+        """
+        次のボタン操作を決める
+        （ランプが示すボタンを狙う。サイクル完了の演出中は次のサイクルの先頭を狙う）
+        """
+        model = self.__model
+        rnd = self.__rnd
+        state, progress, counter = self.__Progress()
+        target = self.__pattern[counter if counter < len(self.__pattern) else 0]
+
+        t = arg_now + rnd.expovariate(model["rate"])
+        if rnd.random() < model["error"]:
+            ch = rnd.choice([c for c in range(8) if c != target])
+            ok = False
+            self.presses_wrong += 1
+        else:
+            ch = target
+            ok = True
+            self.presses_ok += 1
+            self.__pending = (t, progress)
+        self.__last_press = (ok, progress)
+
+        # 押している時間
+        if rnd.random() < model["long"]:
+            hold = rnd.expovariate(1000.0 / model["long_ms"])
+            self.presses_long += 1
+        else:
+            hold = rnd.expovariate(1000.0 / model["hold_ms"])
+        hold = max(hold, 0.02)
+
+        self.__Contact(t, t + hold, ch)
+        if rnd.random() < model["chord"]:
+            # 隣のボタンも一緒に押してしまう
+            other = ch + 1 if ch < 7 else ch - 1
+            offset = rnd.uniform(0, model["chord_ms"] / 1000.0)
+            self.__Contact(t + offset, t + offset + hold, other)
+            self.presses_chord += 1
+
+        # ランプを見て次の操作を決める
+        self.__Push(t + hold + model["react_ms"] / 1000.0, EV_LOOK)
+
+    def __Contact(self, arg_down, arg_up, arg_ch):
+        """
+        ボタン1回分の接点の動き（押す・離す、チャタリング）
+        """
+        model = self.__model
+        rnd = self.__rnd
+        self.__Push(arg_down, EV_DOWN, arg_ch)
+        self.__Push(arg_up, EV_UP, arg_ch)
+        if rnd.random() < model["bounce"]:
+            # 押した直後と離した直後に、入力が一瞬反転する
+            self.presses_bounce += 1
+            width = model["bounce_ms"] / 1000.0
+            for edge in (arg_down, arg_up):
+                t = edge + rnd.uniform(0, width)
+                self.__Push(t, EV_TOGGLE, arg_ch)
+                self.__Push(t + rnd.uniform(0, width), EV_TOGGLE, arg_ch)
+
+    def __Look(self, arg_now):
+        """
+        操作者がランプを見て結果を確認する
+        """
+        state, progress, counter = self.__Progress()
+        ok, before = self.__last_press
+        if ok and progress == before:
+            # 正しいボタンを押したのに進んでいない
+            self.lost += 1
+            self.__pending = None
+        self.__Press(arg_now)
+
+    def __Step(self, arg_t):
+        """
+        メインループ1回分
+        """
+        clock = self.__clock
+        if arg_t > clock.now:
+            clock.now = arg_t
+        step_time = clock.now
+        self.main.Step()
+        self.main.OutputTick(False)
+
+        state, progress, counter = self.__Progress()
+        if state != Main.State_Main.DO:
+            if self.__running:
+                # 操作者はボタンA以外のリモコンを触らないので、運転中のまま
+                self.wrong_transitions += 1
+                self.__running = False
+                self.__PressA(clock.now)
+        elif progress != self.__progress and self.__running:
+            if progress != self.__progress + 1 or self.__pending is None:
+                # 1つずつ、正しいボタンを押した時だけ進むこと
+                self.wrong_transitions += 1
+            else:
+                self.latency.append(step_time - self.__pending[0])
+            self.__pending = None
+        self.__running = state == Main.State_Main.DO
+
+        if progress != self.__progress or counter >= len(self.__pattern):
+            # サイクル完了の処理のため、続けてメインループを回す
+            self.__Schedule(clock.now)
+        self.__progress = progress
+
+    def __Schedule(self, arg_t):
+        """
+        メインループの予定（arg_tより後の、10ms刻みの時刻）
+        """
+        t = (math.floor(arg_t / STEP + 1e-6) + 1) * STEP
+        if self.__next_step is None or t < self.__next_step:
+            self.__next_step = t
+
+    def __PressA(self, arg_now):
+        """
+        ボタンAで運転開始（離した時に受け付けられる）
+        """
+        self.__Push(arg_now + 0.1, EV_GPIO, 0)
+        self.__Push(arg_now + 0.3, EV_GPIO, 1)
+
+    def Run(self, arg_events=None, arg_until=None):
+        """
+        負荷試験の実行
+        Parameters
+        ----------
+        arg_events : int
+            入力イベント数（ボタンの押下・解放・チャタリング）
+        arg_until : float
+            仮想時計のこの時刻まで進めて戻る（続きは次のRunで行う）
+        """
+        clock = self.__clock
+        bus = self.backend.bus
+        icaddr = IoExpI2C.ICADDR_DEFAULT
+        start = self.events
+
+        if not self.__started:
+            self.__started = True
+            self.__PressA(clock.now)
+            # 運転開始の後、最初の操作
+            self.__Push(clock.now + 0.5, EV_LOOK)
+            self.__last_press = (False, 0)
+
+        while arg_events is None or self.events - start < arg_events:
+            t, seq, kind, ch = self.__queue[0]
+            if arg_until is not None and t > arg_until and (
+                    self.__next_step is None or self.__next_step > arg_until):
+                if clock.now < arg_until:
+                    clock.now = arg_until
+                break
+            if self.__next_step is not None and self.__next_step <= t:
+                step = self.__next_step
+                self.__next_step = None
+                self.__Step(step)
+                continue
+
+            heapq.heappop(self.__queue)
+            if kind == EV_LOOK:
+                # 操作者の時間はMainの処理（サイクル完了の演出など）を待たずに進む
+                self.__Look(t)
+                continue
+            if t > clock.now:
+                clock.now = t
+
+            self.events += 1
+            if kind == EV_GPIO:
+                self.backend.gpio.Edge(PIN_A, ch)
+            else:
+                if kind == EV_DOWN:
+                    self.__port |= 1 << ch
+                elif kind == EV_UP:
+                    self.__port &= ~(1 << ch)
+                else:
+                    self.__port ^= 1 << ch
+                bus.Input(icaddr, self.__port)
+            self.__Schedule(clock.now)
+
+        if arg_until is None:
+            # 最後の入力の処理が終わるまで回す
+            while self.__next_step is not None:
+                step = self.__next_step
+                self.__next_step = None
+                self.__Step(step)
+        if self.publisher is not None:
+            self.publisher.Flush()
+
+    def Report(self, arg_wall):
+        """
+        結果の表示
+        Parameters
+        ----------
+        arg_wall : float
+            実行にかかった時間（sec）
+        """
+        state, counter, cycles, wrong = self.main.GetState()
+        print("-- LOADGEN --")
+        print(" > events            : %d (%.0f events/sec)" %
+              (self.events, self.events / arg_wall if arg_wall > 0 else 0))
+        print(" > simulated time    : %.1f h (%.1f sec wall)" %
+              (self.__clock.now / 3600, arg_wall))
+        print(" > completed cycles  : %d" % (cycles))
+        print(" > presses           : ok %d / wrong %d / chord %d / long %d / bounce %d" %
+              (self.presses_ok, self.presses_wrong, self.presses_chord,
+               self.presses_long, self.presses_bounce))
+        print(" > wrong presses (Main) : %d" % (wrong))
+        print(" > lost presses      : %d (%.2f %%)" %
+              (self.lost, 100.0 * self.lost / max(self.presses_ok, 1)))
+        print(" > wrong transitions : %d" % (self.wrong_transitions))
+        lat = sorted(self.latency)
+        if lat:
+            line = []
+            for p in (50, 90, 99, 99.9):
+                line.append("p%g %.1f" % (p, lat[min(int(len(lat) * p / 100), len(lat) - 1)] * 1000))
+            line.append("max %.1f" % (lat[-1] * 1000))
+            print(" > latency ms        : %s" % (" / ".join(line)))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE synthetic operator load generator")
+    parser.add_argument("-n", "--events", type=int, default=1000000,
+                        help="入力イベント数")
+    parser.add_argument("-m", "--model", default="normal", choices=sorted(MODELS),
+                        help="操作者モデル")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="操作者モデルの値を変更（例: --set error=0.1）")
+    parser.add_argument("-p", "--pattern", default="0,1,2,3",
+                        help="点灯パターン（カンマ区切り）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("-r", "--record", metavar="FILE",
+                        help="入力・点灯・サイクルをFILEに記録（Analytics.pyで集計できる）"
+                        "（複数ステーションの時は FILE.sim000 のようにステーションごと）")
+    parser.add_argument("--start", metavar="YYYY-mm-dd HH:MM",
+                        help="仮想時計の開始時刻（既定は現在時刻）")
+    parser.add_argument("-s", "--stations", type=int, default=1,
+                        help="同時に動かすステーション数（-nは全ステーションの合計）")
+    parser.add_argument("-P", "--publish", nargs="?", metavar="GROUP:PORT",
+                        const="%s:%d" % (Publisher.GROUP_DEFAULT, Publisher.PORT_DEFAULT),
+                        help="イベントをUDPマルチキャストで配信（Aggregator.pyで集計できる）")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="実時間に対する仮想時計の速さ（0の時は待たずに進める）")
+    args = parser.parse_args()
+
+    model = dict(MODELS[args.model])
+    for item in args.set:
+        key, val = item.split("=", 1)
+        if key not in model:
+            parser.error("unknown model key %s" % (key))
+        model[key] = float(val)
+
+    epoch = time.time()
+    if args.start is not None:
+        epoch = time.mktime(time.strptime(args.start, "%Y-%m-%d %H:%M"))
+    pattern = [int(ch) for ch in args.pattern.split(",")]
+    if args.stations == 1 and args.speed <= 0:
+        gen = LoadGen(model, pattern, args.seed, args.record, epoch, args.publish)
+        begin = time.monotonic()
+        gen.Run(args.events)
+        gen.Report(time.monotonic() - begin)
+        if gen.recorder is not None:
+            gen.recorder.Close()
+    else:
+        # 複数ステーションを仮想時計の区切りごとに交互に進める
+        gens = []
+        for i in range(args.stations):
+            record = args.record
+            if record is not None and args.stations > 1:
+                # ステーションごとに記録（FILE.sim000.pkev など）
+                root, ext = os.path.splitext(record)
+                record = "%s.sim%03d%s" % (root, i, ext)
+            gens.append(LoadGen(model, pattern, args.seed + i, record, epoch, args.publish,
+                                "sim%03d" % (i)))
+        begin = time.monotonic()
+        now = 0.0
+        try:
+            while sum(gen.events for gen in gens) < args.events:
+                now += STEP * 5
+                for gen in gens:
+                    gen.Run(arg_until=now)
+                if args.speed > 0:
+                    wait = begin + now / args.speed - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+        except KeyboardInterrupt:
+            pass
+        for gen in gens:
+            if gen.recorder is not None:
+                gen.recorder.Close()
+        wall = time.monotonic() - begin
+        events = sum(gen.events for gen in gens)
+        print("-- LOADGEN %d stations --" % (len(gens)))
+        print(" > events            : %d (%.0f events/sec)" % (events, events / wall))
+        print(" > simulated time    : %.1f h (%.1f sec wall)" % (now / 3600, wall))
+        print(" > completed cycles  : %d" % (sum(gen.main.GetState()[2] for gen in gens)))
+        if args.publish is not None:
+            print(" > published         : %d datagrams, %d dropped, %d errors" % (
+                sum(gen.publisher.sent for gen in gens),
+                sum(gen.publisher.dropped for gen in gens),
+                sum(gen.publisher.errors for gen in gens)))
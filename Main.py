@@ -8,13 +8,26 @@
 # -----------------------------------------------
 
 import time
-import RPi.GPIO as GPIO
+
+# 起動時刻（初回入力受付までの時間計測用）
+_T_START = time.monotonic()
+
+import collections
+import threading
 from enum import Enum, auto
-from datetime import datetime
-import yaml
 
+import BlinkTable
+import EventRecorder
 import GpioOut
 import IoExpI2C
+import Metrics
+import Watchdog
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Raspberry Pi以外（SimBackendで動かす）
+    GPIO = None
 
 
 class State_Main(Enum):
@@ -29,6 +42,49 @@ class State_Main(Enum):
     CHANGERANGE_DONE = auto()
 
 
+def parse_buttonrange(arg_text):
+    """
+    設定ファイルの簡易読み込み
+    （SaveToSettingが書き出す buttonrange だけの書式を、yamlを使わずに解釈する）
+    Parameters
+    ----------
+    arg_text : str
+        設定ファイルの内容
+    Returns
+    -------
+    list or None
+        パターン（解釈できない書式の時はNone）
+    """
+    lines = []
+    for line in arg_text.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        lines.append(line)
+    if len(lines) == 0 or not lines[0].startswith("buttonrange:"):
+        return None
+
+    # キーと同じ行の値
+    rest = lines[0][len("buttonrange:"):].strip()
+    if rest != "":
+        # フロー形式 [0, 1, 2]
+        if len(lines) > 1 or not (rest.startswith("[") and rest.endswith("]")):
+            return None
+        items = rest[1:-1].split(",")
+    else:
+        # ブロック形式 - 0
+        items = []
+        for line in lines[1:]:
+            if not line.startswith("-"):
+                return None
+            items.append(line[1:])
+
+    try:
+        return [int(item) for item in items]
+    except ValueError:
+        return None
+
+
 def test_out():
     """
     GPIOランプ点灯テスト
@@ -67,10 +123,51 @@ def test_i2cout():
         time.sleep(3.0)
 
 
+# 入力が無い時のI2C入力状態（毎回リストを作らない）
+NO_INPUT = (0, 0, 0, 0, 0, 0, 0, 0)
+
+
+class PinState():
+    """
+    ポーリングで監視するGPIO入力ピンの状態（軽量モード）
+    """
+    __slots__ = ("pin", "level", "changed")
+
+    def __init__(self, arg_pin, arg_level):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_pin : int
+            ピン番号
+        arg_level : int
+            現在のH/L
+        """
+        self.pin = arg_pin
+        self.level = arg_level
+        # 最後に変化を受け付けた時刻（チャタリング除去用）
+        self.changed = 0.0
+
+
 class Main():
     """
     メイン処理クラス
     """
+    # ------------------------
+    # メンバ定数
+    # ------------------------
+
+    # 軽量モードで点滅を進める周期（メインループの回数）
+    # （IoExpI2C/GpioOutの点滅間隔 0.15sec に合わせる）
+    __BLINK_TICKS = 15
+    # 軽量モードのGPIO入力のチャタリング除去時間（sec）
+    # （add_event_detect の bouncetime と同じ）
+    __BOUNCE = 0.1
+
+    # ステーション名
+    name = "main"
+    # IoExpanderのI2Cアドレス
+    __icaddr = IoExpI2C.ICADDR_DEFAULT
 
     # GPIO入力監視ポート
     __gpio_input = [21, 20, 16, 12]
@@ -99,26 +196,205 @@ class Main():
 
     # 設定ファイル名
     __setting_file = '/home/pi/gitwork/python/poka/config.yaml'
+    # 点滅パターンの表（設定ファイルに blink が無い時は既定のパターン）
+    __blink = None
+    # 設定ファイルの blink の内容（保存時に書き戻す）
+    __blink_config = None
+
+    # 高速起動モード
+    __fast = False
+    # 起動時の点灯（高速起動モードではバックグラウンドで実行）
+    __boot_thread = None
+    __boot_cancel = None
+    # 起動時の点灯のコマ送り（軽量モードの高速起動では、スレッドを使わずメインループで進める）
+    __boot_steps = None
+    # 次のコマに進める時刻（monotonic）
+    __boot_next = 0.0
+    # 初回入力を受け付けた時刻
+    __first_input = None
+
+    # 完了したサイクル数
+    __cycle_count = 0
+    # 間違ったボタンを押した回数
+    __wrong_count = 0
+    # 現在のサイクルの開始時刻
+    __cycle_start = None
 
-    def __init__(self, arg_verbose=False):
+    # 状態公開サーバ（ポート番号0の時は起動しない）
+    __status_port = 0
+    __status = None
+    # 最後に公開した内容（変化が無ければ公開しない）
+    __status_key = None
+
+    # 共有バス（複数ステーション運転時。Noneの時は単独で動作）
+    __bus = None
+    # systemd Watchdog（単独で動作する時だけ使う）
+    __watchdog = None
+    # メインループの最終動作時刻（Watchdog監視用）
+    last_loop = 0.0
+
+    # IoExpander・GPIO出力（Setupで初期化）
+    ioexp = None
+    gpioout = None
+
+    # シミュレーション用のバックエンド（Noneの時は実機）
+    __backend = None
+    # 入力・点灯の記録（EventRecorder）
+    __recorder = None
+    # 異常終了しても残る入出力の記録（FlightRecorder、Noneの時は記録しない）
+    __flight = None
+    # シグナルで開始するプロファイラ（Profiler、Noneの時は計測しない）
+    profiler = None
+    # イベントの配信（Publisher、Noneの時は配信しない）
+    __publisher = None
+    # 最後に記録・配信したステート
+    __state_event = None
+
+    # 軽量モード（スレッドを使わず、メインループだけで入力・点滅・生存通知を行う）
+    __lean = False
+    # ポーリングで監視するGPIO入力（軽量モード）
+    __pins = ()
+    # I2C入力状態（chごとのON状態）
+    i2c_status = NO_INPUT
+
+    # 担当するIoExpanderのch（ゾーン運転では一部のchだけを担当する）
+    __channels = (0, 1, 2, 3, 4, 5, 6, 7)
+    # ボードで読んだ入力の受け取り（ゾーン運転時。Noneの時は自分で読む）
+    __zone_input = None
+    # 担当chのマスク
+    __zone_mask = 0xff
+    # ゾーン番号（常時記録でゾーンを区別する。1から、0はゾーン運転でない）
+    __zone_id = 0
+    # フラッシュ点灯するch（Noneの時は全ch）
+    __flash_channels = None
+
+    def __init__(self, arg_verbose=False, arg_fast=False, arg_status_port=0,
+                 arg_station=None, arg_bus=None, arg_backend=None, arg_recorder=None,
+                 arg_publisher=None, arg_lean=False, arg_ioexp=None, arg_flight=None,
+                 arg_zone=0):
         """
         コンストラクタ
         Parameters
         ----------
+        arg_verbose : bool
+            デバッグモード
+        arg_fast : bool
+            高速起動モード
+            （起動時の点灯を待たずに入力を受け付ける）
+        arg_status_port : int
+            状態公開サーバのポート番号（0の時は起動しない）
+        arg_station : dict
+            ステーションの設定（name, icaddr, gpio_input, gpio_int,
+            gpio_output, config）。Noneの時は既定値を使う
+        arg_bus :
+            共有バス（MultiStation.BusScheduler）
+            指定した時は点滅スレッドを持たず、出力はOutputTickで行う
+        arg_backend : SimBackend.SimBackend
+            シミュレーション用のGPIO・バス・時計
+            （指定した時は共有バスと同じく出力はOutputTickで行い、
+              設定ファイルはarg_stationで指定した時だけ読み書きする）
+        arg_recorder : EventRecorder.EventRecorder
+            入力・点灯の記録先
+        arg_publisher : Publisher.Publisher
+            ステート変化・ステップ完了・間違い押下・サイクル完了の配信先
+        arg_lean : bool
+            軽量モード（点滅・生存通知・GPIO入力コールバックのスレッドを使わず、
+            メインループで処理する。配信はarg_threadをFalseにして渡すこと）
+        arg_ioexp : IoExpI2C.IoExpI2C
+            他のゾーンと共有するIoExpander（ゾーン運転時。arg_busと一緒に指定する）
+            入力はボードが読んでInputで渡し、書き込みはボードの出力周期で行う
+        arg_flight : FlightRecorder.FlightRecorder
+            入力・GPIOエッジ・出力ラッチ・ステート変化の常時記録先
+            （起動時の点灯も含めて記録する。ゾーン運転ではボード側で出力ラッチを記録する）
+        arg_zone : int
+            ゾーン番号（ゾーン運転時、共有する常時記録の各記録に付ける。1から）
         """
         pass
         if arg_verbose == True:
             # デバッグモードを有効化
             self.__debug = True
+        self.__fast = arg_fast
+        self.__lean = arg_lean
+        self.__status_port = arg_status_port
+        self.__boot_cancel = threading.Event()
+        self.__bus = arg_bus
+        self.__recorder = arg_recorder
+        self.__flight = arg_flight
+        self.__zone_id = arg_zone
+        self.__publisher = arg_publisher
+
+        # GPIO・時計
+        self.__gpio = GPIO
+        self.__clock = time
+        if arg_backend is not None:
+            self.__backend = arg_backend
+            self.__gpio = arg_backend.gpio
+            self.__clock = arg_backend.clock
+            self.__bus = arg_backend.bus
+            self.__setting_file = None
+
+        # インスタンスごとに持つ値（クラスの既定値は書き換えない）
+        self.__gpio_input_timer = []
+        self.pattern = list(self.pattern)
 
+        # ステーションの設定
+        if arg_station is not None:
+            self.name = arg_station.get("name", self.name)
+            self.__icaddr = arg_station.get("icaddr", self.__icaddr)
+            self.__gpio_input = list(
+                arg_station.get("gpio_input", self.__gpio_input))
+            self.__gpio_int = list(
+                arg_station.get("gpio_int", self.__gpio_int))
+            self.__gpio_output = list(
+                arg_station.get("gpio_output", self.__gpio_output))
+            self.__setting_file = arg_station.get(
+                "config", self.__setting_file)
+            if arg_station.get("channels") is not None:
+                # 担当するch（パターンの既定値も担当chにする）
+                self.__channels = tuple(arg_station["channels"])
+                self.pattern = list(self.__channels)
+
+        # ゾーン運転
+        self.ioexp = arg_ioexp
+        if arg_ioexp is not None:
+            # （最新の1回分だけ残す。読み込み時点のH/Lを見るのは単独運転と同じ）
+            self.__zone_input = collections.deque(maxlen=1)
+            self.__zone_mask = 0
+            for ch in self.__channels:
+                self.__zone_mask |= 1 << ch
+            self.__inputs = [0, 0, 0, 0, 0, 0, 0, 0]
+            self.__flash_channels = self.__channels
+            # 割込みはボードで監視する
+            self.__gpio_int = []
+
+        # 設定ファイルを読み込み
+        self.LoadSetting()
+
+    def LoadSetting(self):
+        """
+        設定の読み込み
+        """
+        if self.__setting_file is None:
+            # 設定ファイル無し（シミュレーション）
+            return
         # yaml形式設定ファイルを読み込み
         try:
             with open(self.__setting_file) as file:
-                config = yaml.safe_load(file.read())
-                # パターンを読み込み
-                pattern = config["buttonrange"]
-                if len(pattern) > 1:
-                    # 読み込みが上手くいけば、パターンデータを置き換え
+                text = file.read()
+                # 単純な書式ならyamlを読み込まずに解釈
+                pattern = parse_buttonrange(text)
+                if pattern is None:
+                    import yaml
+                    config = yaml.safe_load(text)
+                    # パターンを読み込み
+                    pattern = config["buttonrange"]
+                    # 点滅パターンを読み込み
+                    if config.get("blink") is not None:
+                        # （保存時は書き間違いがあってもそのまま書き戻す）
+                        self.__blink_config = config["blink"]
+                        self.__blink = BlinkTable.load(config["blink"])
+                if len(pattern) > 1 and all(ch in self.__channels for ch in pattern):
+                    # 読み込みが上手くいけば（担当chの範囲なら）、パターンデータを置き換え
                     self.pattern = pattern
         finally:
             # 読み込みエラーがあれば、デフォルト値をそのまま使う
@@ -136,8 +412,12 @@ class Main():
         GPIO入力コールバック
         """
         # 該当ポートの値読み込み
-        ch_val = GPIO.input(gpio_pin)
+        ch_val = self.__gpio.input(gpio_pin)
         self.print(" Callback > GPIO [ %d ] > %d" % (gpio_pin, ch_val))
+        if self.__recorder is not None:
+            self.__recorder.Write(EventRecorder.EV_GPIO, gpio_pin, ch_val)
+        if self.__flight is not None:
+            self.__flight.Write(EventRecorder.EV_GPIO, gpio_pin, ch_val, self.__zone_id)
 
         btnA = 0
         btnB = 0
@@ -182,6 +462,25 @@ class Main():
         """
         ステートの変更
         """
+        if self.__first_input is None:
+            # 初回入力までの時間を記録
+            self.__first_input = time.monotonic()
+            if self.__backend is None:
+                print(" > First input accepted : %.1f ms after start" %
+                      ((self.__first_input - _T_START) * 1000))
+        if self.__IsBooting():
+            # 起動時の点灯を打ち切り
+            self.__boot_cancel.set()
+            if self.__boot_thread is not None:
+                self.__boot_thread.join()
+            self.__boot_steps = None
+            # 点灯範囲の表示を消す
+            self.__ZoneOff()
+        if (self.__zone_input is None and self.ioexp is not None
+                and self.ioexp.recorder is not self.__recorder):
+            # 起動時の点灯が終わってから、入力の読み込みと点灯を記録する
+            # （再生時は起動時の点灯を行わないため）
+            self.ioexp.recorder = self.__recorder
 
         if self.__state_main == State_Main.RESET or self.__state_main == State_Main.NONE:
             # ■■■　NONE/リセット状態
@@ -200,12 +499,12 @@ class Main():
             if arg_BtnB == 1:
                 # ボタンB：現在時間を保存
                 self.__gpio_input_timer[self.__gpio_input.index(
-                    arg_gpiopin)] = time.time()
+                    arg_gpiopin)] = self.__clock.time()
             elif arg_BtnB == -1:
                 # 長押し時間の指定
                 time_nagaoshi = 0.7
                 # 長押し時間の計算
-                div = time.time() - \
+                div = self.__clock.time() - \
                     self.__gpio_input_timer[self.__gpio_input.index(
                         arg_gpiopin)]
                 if div > time_nagaoshi and div < time_nagaoshi * 5:
@@ -224,12 +523,12 @@ class Main():
             # ■■■　範囲変更中
             if arg_BtnUp == 1:
                 # ■■■　上ボタンが操作された
-                if len(self.pattern) < 8:
-                    # 範囲内である事を確認
-                    # 最後の値を取り出し
-                    val = self.pattern[-1]
-                    # 最後の値に１を加算
-                    val += 1
+                # 最後の値を取り出し
+                val = self.pattern[-1]
+                # 最後の値に１を加算
+                val += 1
+                if len(self.pattern) < len(self.__channels) and val in self.__channels:
+                    # 範囲内（担当ch）である事を確認
                     # パターンリストの最後に追加
                     self.pattern.append(val)
                     self.print(self.pattern)
@@ -255,117 +554,473 @@ class Main():
         """
         設定の保存
         """
+        if self.__setting_file is None:
+            # 設定ファイル無し（シミュレーション）
+            return
+        import yaml
         # 保存データの生成
         yml = {'buttonrange': self.pattern}
+        if self.__blink_config is not None:
+            # 点滅パターンはそのまま残す
+            yml['blink'] = self.__blink_config
         # 書き込み
         with open(self.__setting_file, 'w') as file:
             yaml.dump(yml, file, default_flow_style=False)
 
+    def BootAnimation(self):
+        """
+        立ち上がった事を示す点灯
+        """
+        for wait in self.__BootSteps():
+            if self.__BootWait(wait):
+                return
+
+    def __BootSteps(self):
+        """
+        立ち上がった事を示す点灯を1コマずつ進める
+        Yields
+        ------
+        float
+            次のコマまでのウェイト（sec）
+        """
+        # 点灯範囲を示す
+        for ch in self.pattern:
+            self.ioexp.Update(ch, 3)
+        yield 2
+        yield from self.ioexp.FlashSteps(arg_channels=self.__flash_channels)
+
+    def __BootWait(self, arg_sec):
+        """
+        起動時の点灯のウェイト
+        （軽量モードでメインループより先に実行する時は、待つ間も点滅を進める）
+        Returns
+        -------
+        bool
+            打ち切りが指示されたらTrue
+        """
+        interval = self.__BLINK_TICKS * 0.01
+        if not self.__lean or self.__boot_thread is not None or arg_sec < interval:
+            return self.__boot_cancel.wait(arg_sec)
+        for i in range(int(arg_sec / interval)):
+            self.OutputTick(True)
+            if self.__boot_cancel.wait(interval):
+                return True
+        return False
+
+    def __Event(self, arg_kind, arg_a=0, arg_b=0):
+        """
+        ステーションのイベントの記録・配信
+        Parameters
+        ----------
+        arg_kind : int
+            種類（EventRecorder.EV_STEP/EV_WRONG/EV_CYCLE/EV_STATE）
+        arg_a : int
+            値a（0～255）
+        arg_b : int
+            値b（0～65535）
+        """
+        if self.__recorder is not None:
+            self.__recorder.Write(arg_kind, arg_a, arg_b)
+        if self.__flight is not None:
+            self.__flight.Write(arg_kind, arg_a, arg_b, self.__zone_id)
+        if self.__publisher is not None:
+            self.__publisher.Write(arg_kind, self.__state_main.value, arg_a, arg_b)
+
+    def GetState(self):
+        """
+        進捗の取得（シミュレーション・負荷試験用）
+        Returns
+        -------
+        tuple
+            (ステート, 進捗カウンタ, 完了したサイクル数, 間違ったボタンを押した回数)
+        """
+        return (self.__state_main, self.__pattern_counter,
+                self.__cycle_count, self.__wrong_count)
+
+    def PublishStatus(self):
+        """
+        状態の公開
+        （メインループから呼び出し、変化があった時だけ公開内容を差し替える）
+        """
+        if self.__status is None:
+            return
+        # 前回公開した内容と項目ごとに比べる（変化が無い時は何も作らない）
+        last = self.__status_key
+        if (last is not None and last[0] is self.__state_main
+                and last[1] == self.pattern and last[2] == self.__pattern_counter
+                and last[3] == self.__pattern_now_mode and last[4] == self.__cycle_count
+                and last[5] == self.__wrong_count
+                and last[6] == self.ioexp.status_changes
+                and last[7] == self.ioexp.GetOutput() & self.__zone_mask
+                and last[8] == self.gpioout.status_changes):
+            return
+        self.__status_key = (self.__state_main, list(self.pattern), self.__pattern_counter,
+                             self.__pattern_now_mode, self.__cycle_count, self.__wrong_count,
+                             self.ioexp.status_changes,
+                             self.ioexp.GetOutput() & self.__zone_mask,
+                             self.gpioout.status_changes)
+        # 担当chの分だけ公開する（ゾーン運転で、隣のゾーンの点灯を見せない）
+        lamp = self.ioexp.GetStatus()
+        output = self.ioexp.GetOutput() & self.__zone_mask
+        remote = self.gpioout.GetStatus()
+        self.__status.Publish({
+            # 内容が変わった時刻（応答した時刻はHTTPのDateヘッダ）
+            "changed": self.__clock.time(),
+            "state": self.__state_main.name,
+            "pattern": list(self.pattern),
+            "progress": self.__pattern_counter,
+            "mode": self.__pattern_now_mode,
+            "lamp": {
+                "channels": list(self.__channels),
+                "mode": [lamp[ch] for ch in self.__channels],
+                "output": output,
+                "remote": list(remote),
+            },
+            "counters": {
+                "cycles": self.__cycle_count,
+                "wrong": self.__wrong_count,
+                "i2c_fault": self.ioexp.fault_count,
+                "i2c_lost": self.ioexp.lost_count,
+                "i2c_reset": self.ioexp.reset_count,
+            },
+        })
+
+    def __ZoneOff(self, arg_output=False):
+        """
+        担当chの全消灯（ゾーン運転でなければ、ポート9番で全chを同時操作）
+        Parameters
+        ----------
+        arg_output : bool
+            点灯ステータスは変えずに、出力だけ消灯する
+        """
+        if self.__zone_input is None:
+            if arg_output == True:
+                self.ioexp.IoExpUpdate(9, 0)
+            else:
+                self.ioexp.Update(9, 0)
+            return
+        for ch in self.__channels:
+            if arg_output == True:
+                self.ioexp.IoExpUpdate(ch, 0)
+            else:
+                self.ioexp.Update(ch, 0)
+
+    def Input(self, arg_port):
+        """
+        ボードで読んだ入力の受け取り（ゾーン運転時、ボードの出力周期から呼び出す）
+        （担当chに変化があった時だけ渡される）
+        Parameters
+        ----------
+        arg_port : int
+            GPIOBの値（担当外のchも含む）
+        """
+        self.__zone_input.append(arg_port)
+
+    def __IsBooting(self):
+        """
+        起動時の点灯を実行中か（バックグラウンド、または軽量モードのメインループで）
+        """
+        if self.__boot_steps is not None:
+            return True
+        return self.__boot_thread is not None and self.__boot_thread.is_alive()
+
     def Do(self):
         """
         メイン処理
         """
         try:
-            # GPIO初期化
-            GPIO.setmode(GPIO.BCM)
-            # GPIO入力設定
-            for port in self.__gpio_input:
-                # プルアップ抵抗を有効化
-                GPIO.setup(port, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            self.Setup()
+            self.Loop()
+        except KeyboardInterrupt:
+            self.Shutdown()
+        finally:
+            pass
+
+    def Setup(self):
+        """
+        初期化
+        """
+        shared = self.__bus is not None
+        # 点滅スレッドを持つか（軽量モードではメインループで点滅を進める）
+        threaded = not shared and not self.__lean
+
+        # GPIO初期化
+        self.__gpio.setmode(self.__gpio.BCM)
+        # GPIO入力設定
+        pins = []
+        for port in self.__gpio_input:
+            # プルアップ抵抗を有効化
+            self.__gpio.setup(port, self.__gpio.IN, pull_up_down=self.__gpio.PUD_UP)
+            if self.__lean:
+                # 軽量モード：コールバックのスレッドを使わず、メインループで監視
+                pins.append(PinState(port, self.__gpio.input(port)))
+            else:
                 # コールバック設定（立ち上がり/立ち下がり）
-                GPIO.add_event_detect(
-                    port, GPIO.BOTH, callback=self.event_callback_gpio, bouncetime=100)
-                # 長押しタイマー初期化
-                self.__gpio_input_timer.append(0)
+                self.__gpio.add_event_detect(
+                    port, self.__gpio.BOTH, callback=self.event_callback_gpio, bouncetime=100)
+            # 長押しタイマー初期化
+            self.__gpio_input_timer.append(0)
+        self.__pins = tuple(pins)
 
-            # GPIO入力設定（I2C割込）
-            for port in self.__gpio_int:
-                # プルアップ抵抗を有効化（メインループ中の監視で誤動作少なくなる）
-                GPIO.setup(port, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        # GPIO入力設定（I2C割込）
+        for port in self.__gpio_int:
+            # プルアップ抵抗を有効化（メインループ中の監視で誤動作少なくなる）
+            self.__gpio.setup(port, self.__gpio.IN, pull_up_down=self.__gpio.PUD_UP)
 
-            # I2C初期化
-            self.ioexp = IoExpI2C.IoExpI2C(arg_verbose=self.__debug)
+        # I2C初期化
+        # （共有バスの時は、点滅と書き込みを共有の出力周期で行う）
+        # （ゾーン運転の時は、ボードで初期化したものを使う）
+        if self.__zone_input is None:
+            self.ioexp = IoExpI2C.IoExpI2C(
+                self.__icaddr, arg_verbose=self.__debug, arg_fast=self.__fast,
+                arg_bus=self.__bus, arg_thread=threaded, arg_defer=shared,
+                arg_clock=self.__clock, arg_blink=self.__blink)
 
-            # GPIO出力初期化
-            self.gpioout = GpioOut.GpioOut(self.__gpio_output)
+        # GPIO出力初期化
+        self.gpioout = GpioOut.GpioOut(
+            self.__gpio_output, arg_thread=threaded, arg_gpio=self.__gpio,
+            arg_blink=self.__blink)
 
-            # ステート初期化
-            self.__state_main = State_Main.RESET
+        # 入力・出力ラッチの常時記録
+        if self.__flight is not None and self.__zone_input is None:
+            self.ioexp.flight = self.__flight
 
-            # 立ち上がった事を示す点灯
-            # 点灯範囲を示す
-            for ch in self.pattern:
-                self.ioexp.Update(ch, 3)
-            time.sleep(2)
-            self.ioexp.Flash()
-
-            # メインループ
-            while True:
-
-                # I2C入力監視
-                self.i2c_status = [0, 0, 0, 0, 0, 0, 0, 0]
-                for port in self.__gpio_int:
-                    if GPIO.input(port) == GPIO.LOW:
-                        self.print(" I2C INT > GPIO [ %d ]" % port)
-                        self.i2c_status = self.ioexp.Read()
-
-                # ステート毎の処理
-                if self.__state_main == State_Main.NONE:
-                    #self.print("State > NONE")
-                    self.State_RESET()
-
-                elif self.__state_main == State_Main.RESET:
-                    # リセット状態
-                    #self.print("State > RESET")
-                    self.State_RESET()
-
-                elif self.__state_main == State_Main.PAUSE:
-                    # 一時停止状態
-                    #self.print("State > PAUSE")
-                    self.State_PAUSE()
-
-                elif self.__state_main == State_Main.CHANGERANGE:
-                    # 範囲変更受付の状態
-                    #self.print("State > CHANGERANGE")
-                    self.State_CHANGERANGE()
-
-                elif self.__state_main == State_Main.CHANGERANGE_DONE:
-                    # 範囲変更受付完了の状態
-                    #self.print("State > CHANGERANGE_DONE")
-                    self.State_CHANGERANGE_DONE()
-
-                elif self.__state_main == State_Main.DO:
-                    # 運転中の状態
-                    #self.print("State > DO")
-                    self.State_DO()
-
-                time.sleep(0.01)
+        # 記録開始
+        if self.__recorder is not None:
+            self.__recorder.Start({
+                "station": self.name,
+                "pattern": self.pattern,
+                "icaddr": self.__icaddr,
+                "gpio_input": self.__gpio_input,
+                "gpio_int": self.__gpio_int,
+                "gpio_output": self.__gpio_output,
+            })
 
-        except KeyboardInterrupt:
-            # IoExpを全消灯
-            self.ioexp.IoExpUpdate(9, 0)
-            # GPIOを全消灯
-            self.gpioout.Update(0, 0)
-            # コールバック解放処理
+        if not shared and self.__backend is None:
+            # systemd Watchdog（メインループと出力スレッドを監視）
+            self.__watchdog = Watchdog.Watchdog(arg_verbose=self.__debug)
+            if threaded:
+                self.__watchdog.AddThread(
+                    "IoExpI2C", lambda: self.ioexp.last_tick)
+                self.__watchdog.AddThread(
+                    "GpioOut", lambda: self.gpioout.last_tick)
+
+        if self.profiler is not None and threaded:
+            # 出力スレッドの周期を計測
+            self.profiler.Watch("IoExpI2C", lambda: self.ioexp.last_tick)
+            self.profiler.Watch("GpioOut", lambda: self.gpioout.last_tick)
+
+        # ステート初期化
+        self.__state_main = State_Main.RESET
+
+        # 状態公開サーバ
+        if self.__status_port > 0:
+            # 使う時だけ読み込む（http.serverの読み込みは起動時間とメモリが大きい）
+            import StatusServer
+            self.__status = StatusServer.StatusServer(self.__status_port)
+            self.__status.Start()
+
+        # 立ち上がった事を示す点灯
+        if self.__backend is not None:
+            # シミュレーションでは行わない
+            return
+        if self.__fast == True and self.__lean:
+            # 軽量モード：スレッドを使わず、メインループで1コマずつ進める
+            self.__boot_steps = self.__BootSteps()
+            self.__boot_next = self.__clock.monotonic()
+        elif self.__fast == True or shared:
+            # 高速起動モードでは入力を待たせない
+            # （共有バスの時も、他のステーションを待たせない）
+            self.__boot_thread = threading.Thread(
+                target=self.BootAnimation, name="BootAnimation")
+            self.__boot_thread.daemon = True
+            self.__boot_thread.start()
+        else:
+            self.BootAnimation()
+        print(" > Ready [%s] : %.1f ms after start" %
+              (self.name, (time.monotonic() - _T_START) * 1000))
+        self.last_loop = self.__clock.monotonic()
+        if self.__watchdog is not None:
+            # 起動完了を通知して、生存通知を開始
+            self.__watchdog.Ready()
+            self.__watchdog.Start(arg_thread=not self.__lean)
+
+    def Loop(self):
+        """
+        メインループ
+        """
+        blink = 0
+        while True:
+            self.Step()
+            if self.__lean:
+                # 軽量モード：点滅スレッドの代わりに点滅を進める
+                blink += 1
+                if blink == self.__BLINK_TICKS:
+                    blink = 0
+                self.OutputTick(blink == 0)
+                if self.__publisher is not None:
+                    self.__publisher.Flush()
+            self.__clock.sleep(0.01)
+
+    def __PollInputs(self):
+        """
+        GPIO入力の監視（軽量モード）
+        （変化したピンだけ、コールバックと同じ処理を呼び出す）
+        """
+        now = self.__clock.monotonic()
+        for pin in self.__pins:
+            level = self.__gpio.input(pin.pin)
+            if level != pin.level and now - pin.changed >= self.__BOUNCE:
+                pin.level = level
+                pin.changed = now
+                self.event_callback_gpio(pin.pin)
+
+    def Step(self):
+        """
+        メインループ1回分の処理
+        """
+        loop_start = self.__clock.monotonic()
+
+        # GPIO入力監視（軽量モード）
+        if self.__lean:
+            self.__PollInputs()
+
+        # 起動時の点灯を進める（軽量モードの高速起動）
+        if self.__boot_steps is not None and loop_start >= self.__boot_next:
+            try:
+                self.__boot_next = loop_start + next(self.__boot_steps)
+            except StopIteration:
+                self.__boot_steps = None
+
+        # I2C入力監視
+        self.i2c_status = NO_INPUT
+        if self.__zone_input:
+            # ゾーン運転：ボードで読んだ入力の、担当chだけ見る
+            port = self.__zone_input.popleft() & self.__zone_mask
+            if port != 0:
+                inputs = self.__inputs
+                for ch in range(8):
+                    inputs[ch] = (port >> ch) & 0x01
+                self.i2c_status = inputs
+        for port in self.__gpio_int:
+            if self.__gpio.input(port) == self.__gpio.LOW:
+                self.print(" I2C INT > GPIO [ %d ]" % port)
+                self.i2c_status = self.ioexp.Read()
+
+        # ステートの変化を記録・配信（コールバックでの変化もここで拾う）
+        if self.__state_main != self.__state_event:
+            self.__Event(EventRecorder.EV_STATE, self.__state_main.value,
+                         self.__state_event.value if self.__state_event is not None else 0)
+            self.__state_event = self.__state_main
+
+        # ステート毎の処理
+        if self.__state_main == State_Main.NONE:
+            #self.print("State > NONE")
+            self.State_RESET()
+
+        elif self.__state_main == State_Main.RESET:
+            # リセット状態
+            #self.print("State > RESET")
+            self.State_RESET()
+
+        elif self.__state_main == State_Main.PAUSE:
+            # 一時停止状態
+            #self.print("State > PAUSE")
+            self.State_PAUSE()
+
+        elif self.__state_main == State_Main.CHANGERANGE:
+            # 範囲変更受付の状態
+            #self.print("State > CHANGERANGE")
+            self.State_CHANGERANGE()
+
+        elif self.__state_main == State_Main.CHANGERANGE_DONE:
+            # 範囲変更受付完了の状態
+            #self.print("State > CHANGERANGE_DONE")
+            self.State_CHANGERANGE_DONE()
+
+        elif self.__state_main == State_Main.DO:
+            # 運転中の状態
+            #self.print("State > DO")
+            self.State_DO()
+
+        # 状態の公開
+        self.PublishStatus()
+
+        # 生存通知用
+        self.last_loop = self.__clock.monotonic()
+        if self.__watchdog is not None:
+            self.__watchdog.Beat()
+            if self.__lean:
+                self.__watchdog.Poll()
+
+        # ループ時間の記録
+        elapsed = self.last_loop - loop_start
+        Metrics.COUNTERS[Metrics.LOOPS] += 1
+        Metrics.LOOP_TIME.Observe(elapsed)
+        if self.profiler is not None and self.profiler.active:
+            self.profiler.Loop(self.name, loop_start, elapsed)
+
+    def OutputTick(self, arg_blink):
+        """
+        共有の出力周期から呼び出す出力処理
+        Parameters
+        ----------
+        arg_blink : bool
+            点滅を1回進める
+        """
+        if self.__zone_input is not None:
+            # ゾーン運転：IoExpanderはボードが点滅・書き込みを行う
+            if arg_blink == True:
+                self.gpioout.Tick()
+            return
+        if arg_blink == True:
+            self.ioexp.Tick()
+            self.gpioout.Tick()
+        # 変化があった時だけ書き込む
+        self.ioexp.Flush()
+
+    def Shutdown(self, arg_cleanup=True):
+        """
+        終了処理
+        Parameters
+        ----------
+        arg_cleanup : bool
+            GPIOを解放する（複数ステーションの時は最後に1回だけ）
+        """
+        if self.__watchdog is not None:
+            self.__watchdog.Stopping()
+        # IoExpを全消灯
+        self.__ZoneOff(arg_output=True)
+        self.ioexp.Flush()
+        # GPIOを全消灯
+        self.gpioout.Update(0, 0)
+        # コールバック解放処理
+        if not self.__lean:
             for port in self.__gpio_input:
-                GPIO.remove_event_detect(port)
-            GPIO.cleanup()
-        finally:
-            pass
+                self.__gpio.remove_event_detect(port)
+        if arg_cleanup == True:
+            self.__gpio.cleanup()
+        if self.__flight is not None:
+            self.__flight.Close()
 
     def State_RESET(self):
         """
         ステート・リセット状態
         """
+        if self.__IsBooting():
+            # 起動時の点灯中は消灯しない
+            return
         # リモコンランプを点灯
         self.gpioout.Update(0, 0)
         self.gpioout.Update(1, 1)
         # IoExpを全消灯
-        self.ioexp.Update(9, 0)
+        self.__ZoneOff()
         # パターンの進捗カウンタをリセット
         self.__pattern_counter = 0
         # 点灯・点滅パターンを初期値に戻す
         self.__pattern_now_mode = 3
+        # サイクル時間の計測を中止
+        self.__cycle_start = None
 
     def State_PAUSE(self):
         """
@@ -384,10 +1039,10 @@ class Main():
         # 範囲の数を数える
         length = len(self.pattern)
         # 設定されている範囲だけ点灯
-        for ch in range(length):
+        for ch in self.__channels[:length]:
             self.ioexp.Update(ch, 3)
         # それ以外を消灯
-        for ch in range(length, 8):
+        for ch in self.__channels[length:]:
             self.ioexp.Update(ch, 0)
 
     def State_CHANGERANGE_DONE(self):
@@ -399,11 +1054,11 @@ class Main():
         # 確定した範囲を示す点滅
         for ch in self.pattern:
             self.ioexp.Update(ch, 4)
-        time.sleep(1)
+        self.__clock.sleep(1)
         # フラッシュ
-        self.ioexp.Flash(1)
+        self.ioexp.Flash(1, arg_channels=self.__flash_channels)
         # 全消灯
-        self.ioexp.Update(9, 0)
+        self.__ZoneOff()
         # 保存
         self.SaveToSetting()
         # 状態を移行
@@ -420,6 +1075,9 @@ class Main():
         # パターンに応じて点灯
         if self.__pattern_counter < len(self.pattern):
             # カウンタがパターン数を超えてなければ
+            if self.__cycle_start is None:
+                # サイクル時間の計測開始
+                self.__cycle_start = self.__clock.monotonic()
             # 現在のパターンを読み出し
             pattern_now = self.pattern[self.__pattern_counter]
             # 対象を中速点滅
@@ -429,6 +1087,7 @@ class Main():
             if self.i2c_status[pattern_now] == 1:
                 # 対象を点灯
                 self.ioexp.Update(pattern_now, 1)
+                self.__Event(EventRecorder.EV_STEP, self.__pattern_counter, pattern_now)
                 # パターンの進捗カウンタをインクリメントし、次のパターン番号に移行
                 self.__pattern_counter += 1
                 # 点灯・点滅パターンを初期値に戻す
@@ -437,35 +1096,111 @@ class Main():
                 # 間違ったボタンを押した
                 # 対象を高速点滅に切替
                 self.__pattern_now_mode = 4
+                self.__wrong_count += 1
+                Metrics.COUNTERS[Metrics.WRONG] += 1
+                port = 0
+                for ch, val in enumerate(self.i2c_status):
+                    port |= val << ch
+                self.__Event(EventRecorder.EV_WRONG, self.__pattern_counter, port)
             else:
                 pass
         else:
             # カウンタがパターン数を超えたら、リセット処理に入る
+            # サイクル完了の記録
+            cycle_time = self.__clock.monotonic() - self.__cycle_start
+            Metrics.COUNTERS[Metrics.CYCLES] += 1
+            Metrics.CYCLE_TIME.Observe(cycle_time)
+            self.__cycle_start = None
             # 一旦全点灯
             for ch in self.pattern:
                 self.ioexp.Update(ch, 1)
-            time.sleep(0.5)
+            self.__clock.sleep(0.5)
             # フラッシュ
-            self.ioexp.Flash(1)
+            self.ioexp.Flash(1, arg_channels=self.__flash_channels)
             # 全消灯
-            self.ioexp.Update(9, 0)
-            time.sleep(0.5)
+            self.__ZoneOff()
+            self.__clock.sleep(0.5)
             # パターンの進捗カウンタをリセット
             self.__pattern_counter = 0
+            self.__cycle_count += 1
             # IoExpを全消灯
-            self.ioexp.IoExpUpdate(9, 0)
+            self.__ZoneOff(arg_output=True)
+            # 演出の終わり（次のサイクルの始まり）に記録
+            self.__Event(EventRecorder.EV_CYCLE, len(self.pattern),
+                         min(int(cycle_time * 100), 0xffff))
 
 
-def main(args=None):
+def main(arg_verbose=False, arg_fast=False, arg_status_port=0, arg_record=None,
+         arg_profile_dir=None, arg_publish=None, arg_lean=False, arg_flight=None):
     """
     メイン関数
     Parameters
     ----------
+    arg_verbose : bool
+        デバッグモード
+    arg_fast : bool
+        高速起動モード
+    arg_status_port : int
+        状態公開サーバのポート番号（0の時は起動しない）
+    arg_record : str
+        入力・点灯の記録ファイル名（Noneの時は記録しない）
+    arg_profile_dir : str
+        SIGUSR1で計測したプロファイルの書き出し先（Noneの時は一時ディレクトリ）
+    arg_publish : str
+        イベントの配信先 "グループ:ポート"（Noneの時は配信しない）
+    arg_lean : bool
+        軽量モード（メインループ1本で動かす）
+    arg_flight : str
+        異常終了しても残る入出力の記録ファイル名（Noneの時は記録しない）
     """
-    m = Main(args)
+    import Profiler
+
+    flight = None
+    if arg_flight is not None:
+        import FlightRecorder
+        # 前回の記録は .prev に退避される（FlightRecorder.py で解読できる）
+        flight = FlightRecorder.FlightRecorder(arg_flight)
+
+    recorder = None
+    if arg_record is not None:
+        recorder = EventRecorder.EventRecorder(arg_record)
+    publisher = None
+    if arg_publish is not None:
+        import socket
+        import Publisher
+        group, port = arg_publish.rsplit(":", 1)
+        # ライン全体で区別できるように、ホスト名で配信する
+        publisher = Publisher.Publisher(socket.gethostname(), group, int(port),
+                                        arg_thread=not arg_lean)
+    m = Main(arg_verbose, arg_fast, arg_status_port, arg_recorder=recorder,
+             arg_publisher=publisher, arg_lean=arg_lean, arg_flight=flight)
+    # kill -USR1 で計測の開始・停止
+    m.profiler = Profiler.Profiler(arg_profile_dir, arg_verbose=arg_verbose)
+    m.profiler.Install()
     m.Do()
 
 
 if __name__ == '__main__':
-    # 引数Trueでデバッグモード
-    main(False)
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE System")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="デバッグモード")
+    parser.add_argument("-f", "--fast", action="store_true",
+                        help="高速起動モード（起動時の点灯を待たずに入力を受け付ける）")
+    parser.add_argument("-s", "--status", type=int, default=0, metavar="PORT",
+                        help="状態公開サーバのポート番号（localhostで待ち受け）")
+    parser.add_argument("-r", "--record", metavar="FILE",
+                        help="入力・点灯の記録ファイル（Replay.pyで再生できる）")
+    parser.add_argument("-p", "--profile-dir", metavar="DIR",
+                        help="SIGUSR1で計測したプロファイルの書き出し先")
+    parser.add_argument("-P", "--publish", nargs="?", metavar="GROUP:PORT",
+                        const="239.255.0.23:8123",
+                        help="イベントをUDPマルチキャストで配信（Publisher.pyで購読できる）")
+    parser.add_argument("-l", "--lean", action="store_true",
+                        help="軽量モード（点滅・生存通知・入力監視をメインループ1本で行う）")
+    parser.add_argument("-F", "--flight", nargs="?", metavar="FILE",
+                        const="/dev/shm/poka-flight.bin",
+                        help="異常終了しても残る入出力の記録（FlightRecorder.pyで解読できる）")
+    args = parser.parse_args()
+    main(args.verbose, args.fast, args.status, args.record, args.profile_dir,
+         args.publish, args.lean, args.flight)
@@ -0,0 +1,182 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Metrics (Prometheus text format)
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+from bisect import bisect_left
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+# カウンタ番号（COUNTERSの添字）
+CYCLES = 0  # 完了したサイクル数
+WRONG = 1  # 間違ったボタンを押した回数
+I2C_TRANSFERS = 2  # I2C通信の回数
+I2C_ERRORS = 3  # I2C通信エラーの回数
+I2C_LOST = 4  # リトライしても通信できなかった回数
+I2C_RESETS = 5  # ICのリセットを検出した回数
+LOOPS = 6  # メインループの回数
+PUB_EVENTS = 7  # 配信したイベント数
+PUB_DROPPED = 8  # 送信待ちが溢れて捨てたイベント数
+PUB_ERRORS = 9  # 配信の送信エラーの回数
+
+# カウンタ名と説明（COUNTERSと同じ並び）
+COUNTER_INFO = (
+    ("pokayoke_cycles_total", "Completed pick cycles"),
+    ("pokayoke_wrong_presses_total", "Wrong button presses"),
+    ("pokayoke_i2c_transfers_total", "I2C transactions"),
+    ("pokayoke_i2c_errors_total", "I2C transaction errors (including retries)"),
+    ("pokayoke_i2c_lost_total", "I2C transactions given up after retries"),
+    ("pokayoke_i2c_resets_total", "IO expander resets detected and recovered"),
+    ("pokayoke_loops_total", "Main loop iterations"),
+    ("pokayoke_published_events_total", "Station events published"),
+    ("pokayoke_publish_dropped_total", "Station events dropped from a full send queue"),
+    ("pokayoke_publish_errors_total", "Event datagrams that failed to send"),
+)
+
+# カウンタ本体（起動時に確保して、以降は値の加算だけ）
+COUNTERS = [0] * len(COUNTER_INFO)
+
+
+class Histogram():
+    """
+    ヒストグラム（バケット数固定）
+    """
+    __slots__ = ("name", "help", "labels", "bounds", "counts", "sum")
+
+    def __init__(self, arg_name, arg_help, arg_bounds, arg_labels=""):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_name : str
+            メトリクス名
+        arg_help : str
+            説明
+        arg_bounds : tuple
+            バケットの上限値（昇順）
+        arg_labels : str
+            ラベル（'thread="ioexp"' の形式）
+        """
+        self.name = arg_name
+        self.help = arg_help
+        self.labels = arg_labels
+        self.bounds = tuple(arg_bounds)
+        # バケットごとの件数（最後は+Inf）
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def Observe(self, arg_val):
+        """
+        値の記録
+        Parameters
+        ----------
+        arg_val : float
+            記録する値
+        """
+        self.counts[bisect_left(self.bounds, arg_val)] += 1
+        self.sum += arg_val
+
+    def Render(self, arg_lines):
+        """
+        テキスト形式の出力
+        Parameters
+        ----------
+        arg_lines : list
+            出力先（行を追加する）
+        """
+        sep = "," if self.labels else ""
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            arg_lines.append('%s_bucket{%s%sle="%g"} %d' %
+                             (self.name, self.labels, sep, bound, total))
+        total += self.counts[-1]
+        arg_lines.append('%s_bucket{%s%sle="+Inf"} %d' %
+                         (self.name, self.labels, sep, total))
+        labels = "{%s}" % (self.labels) if self.labels else ""
+        arg_lines.append("%s_sum%s %r" % (self.name, labels, self.sum))
+        arg_lines.append("%s_count%s %d" % (self.name, labels, total))
+
+
+# ヒストグラム
+CYCLE_TIME = Histogram(
+    "pokayoke_cycle_seconds", "Time from first lamp to last confirmed step",
+    (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600))
+LOOP_TIME = Histogram(
+    "pokayoke_loop_seconds", "Main loop iteration time excluding the 10 ms sleep",
+    (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5, 1, 3))
+BLINK_JITTER_IOEXP = Histogram(
+    "pokayoke_blink_jitter_seconds", "Deviation of the blink tick from its interval",
+    (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5), 'thread="ioexp"')
+BLINK_JITTER_GPIO = Histogram(
+    "pokayoke_blink_jitter_seconds", "Deviation of the blink tick from its interval",
+    (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5), 'thread="gpio"')
+
+HISTOGRAMS = (CYCLE_TIME, LOOP_TIME, BLINK_JITTER_IOEXP, BLINK_JITTER_GPIO)
+
+
+def Render():
+    """
+    Prometheusテキスト形式の出力
+    Returns
+    -------
+    bytes
+        出力内容
+    """
+    lines = []
+    for (name, text), val in zip(COUNTER_INFO, COUNTERS):
+        lines.append("# HELP %s %s" % (name, text))
+        lines.append("# TYPE %s counter" % (name))
+        lines.append("%s %d" % (name, val))
+    written = set()
+    for hist in HISTOGRAMS:
+        if hist.name not in written:
+            # 同名のヒストグラムはHELP/TYPEを1回だけ出力
+            written.add(hist.name)
+            lines.append("# HELP %s %s" % (hist.name, hist.help))
+            lines.append("# TYPE %s histogram" % (hist.name))
+        hist.Render(lines)
+    lines.append("")
+    return "\n".join(lines).encode()
+
+
+def scrape(arg_url):
+    """
+    メトリクスの取得と確認（動作確認用）
+    Parameters
+    ----------
+    arg_url : str
+        取得先URL
+    Returns
+    -------
+    dict
+        サンプル名（ラベル込み）と値
+    """
+    import urllib.request
+    with urllib.request.urlopen(arg_url, timeout=5) as res:
+        text = res.read().decode()
+    samples = {}
+    for line in text.splitlines():
+        if line == "" or line.startswith("#"):
+            continue
+        # 名前{ラベル} 値 の形式であること
+        name, val = line.rsplit(" ", 1)
+        samples[name] = float(val)
+    return samples
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE metrics scraper")
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:8023/metrics",
+                        help="取得先URL")
+    args = parser.parse_args()
+    for name, val in sorted(scrape(args.url).items()):
+        print("%-70s %g" % (name, val))
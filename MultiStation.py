@@ -0,0 +1,416 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# POKAYOKE System (Multi Station)
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import socket
+import time
+import threading
+import RPi.GPIO as GPIO
+import smbus
+
+import BlinkTable
+import FlightRecorder
+import IoExpI2C
+import Main
+import Metrics
+import Profiler
+import Publisher
+import Watchdog
+
+'''
+ステーション設定ファイル（yaml）の例
+ステーションごとに、IoExpanderのアドレス・GPIO・パターン設定ファイルを分ける事
+
+stations:
+  - name: st1
+    icaddr: 0x20
+    gpio_input: [21, 20, 16, 12]
+    gpio_int: [7]
+    gpio_output: [26, 19, 13, 6]
+    config: /home/pi/gitwork/python/poka/config_st1.yaml
+    status_port: 8023
+    publish: 239.255.0.23:8123
+    flight: /dev/shm/poka-flight-st1.bin
+  - name: st2
+    icaddr: 0x21
+    gpio_input: [25, 24, 23, 18]
+    gpio_int: [8]
+    gpio_output: [5, 11, 9, 10]
+    config: /home/pi/gitwork/python/poka/config_st2.yaml
+    status_port: 8024
+    publish: 239.255.0.23:8123
+
+1枚のIoExpanderを複数の作業者で分けて使う時は、zones にゾーンごとの設定を書く
+（ゾーンごとに担当ch・ボタン・リモコンランプ・パターン設定ファイルを分ける事。
+  icaddr・gpio_int・blink・flight はボード全体で1つ。
+  flight の各記録には zones の順に1からのゾーン番号が付く）
+
+  - name: bench1
+    icaddr: 0x22
+    gpio_int: [17]
+    flight: /dev/shm/poka-flight-bench1.bin
+    zones:
+      - name: bench1-left
+        channels: [0, 1, 2, 3]
+        gpio_input: [22, 27, 4, 3]
+        gpio_output: [2, 14]
+        config: /home/pi/gitwork/python/poka/config_b1l.yaml
+      - name: bench1-right
+        channels: [4, 5, 6, 7]
+        gpio_input: [15, 0, 1, 2]
+        gpio_output: [3, 4]
+        config: /home/pi/gitwork/python/poka/config_b1r.yaml
+'''
+
+
+class BusScheduler():
+    """
+    共有I2Cバス
+    （全ステーションのバス操作を1本のSMBusに直列化する。
+      出力の書き込みはMultiStationの出力周期でまとめて行う）
+    """
+
+    def __init__(self, arg_channel=IoExpI2C.CHANNEL):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_channel : int
+            i2c割り当てチャンネル
+        """
+        self.__bus = smbus.SMBus(arg_channel)
+        self.__lock = threading.Lock()
+
+    def read_byte_data(self, arg_addr, arg_reg):
+        """
+        1バイト読み込み
+        """
+        with self.__lock:
+            return self.__bus.read_byte_data(arg_addr, arg_reg)
+
+    def write_byte_data(self, arg_addr, arg_reg, arg_val):
+        """
+        1バイト書き込み
+        """
+        with self.__lock:
+            return self.__bus.write_byte_data(arg_addr, arg_reg, arg_val)
+
+    def read_i2c_block_data(self, arg_addr, arg_reg, arg_len):
+        """
+        連続読み込み
+        """
+        with self.__lock:
+            return self.__bus.read_i2c_block_data(arg_addr, arg_reg, arg_len)
+
+
+class ZoneBoard():
+    """
+    1枚のIoExpanderを複数のゾーンで分けて使うボード
+    （ゾーンごとにシーケンス・ステート・進捗を持ち、
+      入力の読み込みと出力の書き込みは出力周期ごとにボードで1回だけ行う）
+    """
+
+    def __init__(self, arg_conf, arg_bus, arg_verbose=False, arg_fast=False):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_conf : dict
+            ボードの設定（name, icaddr, gpio_int, blink, flight, zones）
+        arg_bus :
+            共有バス（BusScheduler）
+        arg_verbose : bool
+            デバッグモード
+        arg_fast : bool
+            高速起動（設定済みのレジスタは書き直さない）
+        """
+        self.name = arg_conf.get("name", "board")
+        self.__gpio_int = list(arg_conf.get("gpio_int", [7]))
+        # ゾーン（Main）と担当chのマスク、最後に渡した担当chの入力
+        self.__zones = []
+
+        # ゾーンの担当chが重なっていない事
+        used = 0
+        for zone in arg_conf["zones"]:
+            mask = 0
+            for ch in zone["channels"]:
+                mask |= 1 << ch
+            if used & mask:
+                raise ValueError("%s : zone %s overlaps another zone" %
+                                 (self.name, zone.get("name")))
+            used |= mask
+
+        # GPIO入力設定（I2C割込）
+        GPIO.setmode(GPIO.BCM)
+        for port in self.__gpio_int:
+            GPIO.setup(port, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+        # 全ゾーンで共有するIoExpander（点滅と書き込みは出力周期で行う）
+        blink = None
+        if arg_conf.get("blink") is not None:
+            blink = BlinkTable.load(arg_conf["blink"])
+        self.ioexp = IoExpI2C.IoExpI2C(
+            arg_conf.get("icaddr", IoExpI2C.ICADDR_DEFAULT), arg_verbose=arg_verbose,
+            arg_fast=arg_fast, arg_bus=arg_bus, arg_thread=False, arg_defer=True,
+            arg_blink=blink)
+
+        # 入力・出力ラッチの常時記録（全ゾーンで1つのファイルに記録する）
+        self.flight = None
+        if arg_conf.get("flight") is not None:
+            self.flight = FlightRecorder.FlightRecorder(arg_conf["flight"])
+            self.ioexp.flight = self.flight
+
+    def Add(self, arg_zone, arg_channels):
+        """
+        ゾーンの追加
+        Parameters
+        ----------
+        arg_zone : Main.Main
+            ゾーン（arg_ioexpにこのボードのIoExpanderを指定したもの）
+        arg_channels : list
+            担当ch
+        """
+        mask = 0
+        for ch in arg_channels:
+            mask |= 1 << ch
+        self.__zones.append([arg_zone, mask, 0])
+
+    def OutputTick(self, arg_blink):
+        """
+        共有の出力周期から呼び出す入出力処理
+        Parameters
+        ----------
+        arg_blink : bool
+            点滅を1回進める
+        """
+        # 割込みが出ていれば1回だけ読み、担当chに変化があったゾーンにだけ渡す
+        # （他のゾーンの操作で、押しっぱなしのボタンを読み直さない）
+        for port in self.__gpio_int:
+            if GPIO.input(port) == GPIO.LOW:
+                val = self.ioexp.ReadPort()
+                for zone in self.__zones:
+                    if (val ^ zone[2]) & zone[1]:
+                        zone[2] = val & zone[1]
+                        zone[0].Input(val)
+                break
+
+        # 点滅を進め、変化があった時だけまとめて1回で書き込む
+        if arg_blink == True:
+            self.ioexp.Tick()
+        for zone in self.__zones:
+            zone[0].OutputTick(arg_blink)
+        self.ioexp.Flush()
+
+
+class MultiStation():
+    """
+    複数ステーションを1プロセスで動かすクラス
+    （ステートマシンはステーションごとのスレッド、
+      バスと出力周期は全ステーションで共有）
+    """
+    # ------------------------
+    # メンバ定数
+    # ------------------------
+
+    # 出力周期（sec）
+    __TICK = 0.01
+    # 点滅を進める周期（出力周期の回数）
+    # （IoExpI2C/GpioOutの点滅間隔 0.15sec に合わせる）
+    __BLINK_TICKS = 15
+
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 動作中のステーション（ゾーンも含む）
+    __stations = []
+    # 出力周期で入出力を行うもの（単独のステーション、またはZoneBoard）
+    __outputs = []
+
+    # 出力周期の最終動作時刻（Watchdog監視用）
+    last_tick = 0.0
+
+    def __init__(self, arg_stations, arg_verbose=False, arg_fast=False, arg_profile_dir=None):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_stations : list
+            ステーションの設定（dictのリスト）
+        arg_verbose : bool
+            デバッグモード
+        arg_fast : bool
+            高速起動モード
+        arg_profile_dir : str
+            SIGUSR1で計測したプロファイルの書き出し先（Noneの時は一時ディレクトリ）
+        """
+        self.__config = arg_stations
+        self.__debug = arg_verbose
+        self.__fast = arg_fast
+        self.__profile_dir = arg_profile_dir
+        self.__stations = []
+        self.__outputs = []
+
+    def Do(self):
+        """
+        メイン処理
+        """
+        # 全ステーションで共有するバス
+        self.__bus = BusScheduler()
+
+        # 共有の出力周期（ステーションの初期化中の点灯にも使う）
+        self.last_tick = time.monotonic()
+        thread_1 = threading.Thread(target=self.event_Thread, name="tick")
+        thread_1.daemon = True
+        thread_1.start()
+
+        # systemd Watchdog（出力周期と各ステーションのメインループを監視）
+        watchdog = Watchdog.Watchdog(arg_verbose=self.__debug)
+        watchdog.AddThread("tick", lambda: self.last_tick)
+
+        # kill -USR1 で計測の開始・停止
+        profiler = Profiler.Profiler(self.__profile_dir, arg_verbose=self.__debug)
+        profiler.Watch("tick", lambda: self.last_tick)
+        profiler.Install()
+
+        try:
+            # ステーションの初期化
+            for conf in self.__config:
+                if conf.get("zones") is not None:
+                    # 1枚のIoExpanderを複数のゾーンで使う
+                    board = ZoneBoard(conf, self.__bus, self.__debug, self.__fast)
+                    for number, zone in enumerate(conf["zones"], 1):
+                        station = self.__Station(zone, watchdog, profiler, board.ioexp,
+                                                 board.flight, number)
+                        board.Add(station, zone["channels"])
+                    self.__outputs.append(board)
+                else:
+                    station = self.__Station(conf, watchdog, profiler)
+                    self.__outputs.append(station)
+
+            # ステーションごとのメインループ
+            for station in self.__stations:
+                thread_2 = threading.Thread(target=station.Loop,
+                                            name="station %s" % (station.name))
+                thread_2.daemon = True
+                thread_2.start()
+
+            # 起動完了を通知して、生存通知を開始
+            watchdog.Ready()
+            watchdog.Start()
+            while True:
+                time.sleep(0.1)
+                watchdog.Beat()
+
+        except KeyboardInterrupt:
+            watchdog.Stopping()
+            for station in self.__stations:
+                station.Shutdown(arg_cleanup=False)
+            GPIO.cleanup()
+
+    def __Station(self, arg_conf, arg_watchdog, arg_profiler, arg_ioexp=None,
+                  arg_flight=None, arg_zone=0):
+        """
+        ステーション（またはゾーン）の初期化
+        Parameters
+        ----------
+        arg_conf : dict
+            ステーションの設定
+        arg_watchdog : Watchdog.Watchdog
+            メインループを監視するWatchdog
+        arg_profiler : Profiler.Profiler
+            プロファイラ
+        arg_ioexp : IoExpI2C.IoExpI2C
+            ゾーンで共有するIoExpander（Noneの時はステーションごとに持つ）
+        arg_flight : FlightRecorder.FlightRecorder
+            ゾーンで共有する常時記録（Noneの時は設定の flight で作る）
+        arg_zone : int
+            ゾーン番号（共有する常時記録の区別用。1から、0はゾーン運転でない）
+        Returns
+        -------
+        Main.Main
+            初期化したステーション
+        """
+        publisher = None
+        if arg_conf.get("publish") is not None:
+            # ライン全体で区別できるように、ホスト名/ステーション名で配信する
+            group, port = str(arg_conf["publish"]).rsplit(":", 1)
+            publisher = Publisher.Publisher(
+                "%s/%s" % (socket.gethostname(), arg_conf.get("name", "main")),
+                group, int(port))
+        flight = arg_flight
+        if flight is None and arg_conf.get("flight") is not None:
+            flight = FlightRecorder.FlightRecorder(arg_conf["flight"])
+        station = Main.Main(self.__debug, self.__fast,
+                            arg_conf.get("status_port", 0),
+                            arg_station=arg_conf, arg_bus=self.__bus,
+                            arg_publisher=publisher, arg_ioexp=arg_ioexp,
+                            arg_flight=flight, arg_zone=arg_zone)
+        station.profiler = arg_profiler
+        station.Setup()
+        self.__stations.append(station)
+        arg_watchdog.AddThread("station %s" % (station.name),
+                               lambda st=station: st.last_loop, 3.0)
+        return station
+
+    def event_Thread(self):
+        """
+        スレッド・共有の出力周期
+        （点滅を進め、変化のあったIoExpanderだけ書き込む）
+        """
+        count = 0
+        while True:
+            now = time.monotonic()
+            blink = count == 0
+            if blink:
+                # 点滅間隔のずれを記録
+                Metrics.BLINK_JITTER_IOEXP.Observe(
+                    abs(now - self.last_tick - self.__TICK * self.__BLINK_TICKS))
+                self.last_tick = now
+            count += 1
+            if count >= self.__BLINK_TICKS:
+                count = 0
+
+            for output in self.__outputs:
+                output.OutputTick(blink)
+
+            # ウェイト
+            time.sleep(self.__TICK)
+
+
+def load_stations(arg_file):
+    """
+    ステーション設定ファイルの読み込み
+    Parameters
+    ----------
+    arg_file : str
+        設定ファイル名
+    Returns
+    -------
+    list
+        ステーションの設定（dictのリスト）
+    """
+    import yaml
+    with open(arg_file) as file:
+        config = yaml.safe_load(file.read())
+    return config["stations"]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE System (Multi Station)")
+    parser.add_argument("stations", help="ステーション設定ファイル（yaml）")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="デバッグモード")
+    parser.add_argument("-f", "--fast", action="store_true",
+                        help="高速起動モード（起動時の点灯を待たずに入力を受け付ける）")
+    parser.add_argument("-p", "--profile-dir", metavar="DIR",
+                        help="SIGUSR1で計測したプロファイルの書き出し先")
+    args = parser.parse_args()
+    MultiStation(load_stations(args.stations), args.verbose, args.fast,
+                 args.profile_dir).Do()
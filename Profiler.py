@@ -0,0 +1,293 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# On-demand Sampling Profiler Class
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import os
+import signal
+import sys
+import threading
+import time
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+WINDOW_DEFAULT = 30.0  # 計測時間（sec）
+INTERVAL_DEFAULT = 0.01  # サンプリング間隔（sec）
+LOOP_PERIOD = 0.01  # メインループの周期（sec）（ジッタの基準）
+TOP = 40  # 表示する関数の数
+HOME = os.path.dirname(os.path.abspath(__file__))  # 集計対象のソースの場所
+
+
+def thread_cpu():
+    """
+    スレッドごとのCPU時間（Linuxのみ、それ以外は空）
+    Returns
+    -------
+    dict
+        スレッド名ごとのCPU時間（sec）
+    """
+    cpu = {}
+    try:
+        tick = os.sysconf("SC_CLK_TCK")
+        for th in threading.enumerate():
+            with open("/proc/self/task/%d/stat" % (th.native_id)) as file:
+                # コマンド名の後ろの utime, stime
+                fields = file.read().rsplit(")", 1)[1].split()
+            cpu[th.name] = (int(fields[11]) + int(fields[12])) / tick
+    except (OSError, ValueError, AttributeError, TypeError):
+        pass
+    return cpu
+
+
+def summary(arg_values):
+    """
+    平均・パーセンタイル・最大の表示用文字列（msで表示）
+    Parameters
+    ----------
+    arg_values : list
+        値（sec）のリスト
+    """
+    if not arg_values:
+        return "-"
+    values = sorted(arg_values)
+    count = len(values)
+    line = ["mean %.2f" % (sum(values) / count * 1000)]
+    for p in (50, 90, 99):
+        line.append("p%d %.2f" % (p, values[min(count * p // 100, count - 1)] * 1000))
+    line.append("max %.2f" % (values[-1] * 1000))
+    return " / ".join(line)
+
+
+class Profiler():
+    """
+    シグナルで開始するサンプリングプロファイラ
+    （計測中だけサンプリングスレッドを動かすので、停止中は何もしない）
+    """
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 計測中
+    active = False
+    # 最後に書き出したファイル名
+    last_file = None
+
+    def __init__(self, arg_dir=None, arg_window=WINDOW_DEFAULT,
+                 arg_interval=INTERVAL_DEFAULT, arg_verbose=False):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_dir : str
+            結果の書き出し先ディレクトリ（Noneの時は一時ディレクトリ）
+        arg_window : float
+            計測時間（sec）
+        arg_interval : float
+            サンプリング間隔（sec）
+        arg_verbose : bool
+            デバッグモード
+        """
+        self.__dir = arg_dir if arg_dir is not None else os.environ.get("TMPDIR", "/tmp")
+        self.__window = arg_window
+        self.__interval = arg_interval
+        self.__debug = arg_verbose
+        self.__stop = threading.Event()
+        # 周期を計測するスレッド（名前, 最終動作時刻を返す関数）
+        self.__watch = []
+        # メインループごとの (開始時刻, 処理時間)
+        self.__loops = {}
+
+    def print(self, arg_message):
+        """
+        デバッグ用メッセージ
+        """
+        if self.__debug == True:
+            print(" > Profiler > %s" % (arg_message))
+
+    def Watch(self, arg_name, arg_func):
+        """
+        周期を計測するスレッドの追加
+        Parameters
+        ----------
+        arg_name : str
+            表示名
+        arg_func : function
+            最終動作時刻（time.monotonic）を返す関数
+        """
+        self.__watch.append((arg_name, arg_func))
+
+    def Install(self, arg_signal=signal.SIGUSR1):
+        """
+        シグナルで計測の開始・停止を切り替える（メインスレッドから呼び出す事）
+        Parameters
+        ----------
+        arg_signal : int
+            シグナル番号
+        """
+        signal.signal(arg_signal, lambda signum, frame: self.Toggle())
+
+    def Toggle(self):
+        """
+        計測の開始・停止の切替
+        """
+        if self.active:
+            self.__stop.set()
+        else:
+            self.Start()
+
+    def Start(self):
+        """
+        計測開始（計測時間が過ぎるとファイルに書き出して停止する）
+        """
+        if self.active:
+            return
+        self.__stop.clear()
+        self.__loops = {}
+        self.active = True
+        thread_1 = threading.Thread(target=self.event_Thread, name="Profiler")
+        thread_1.daemon = True
+        thread_1.start()
+
+    def Loop(self, arg_name, arg_start, arg_elapsed):
+        """
+        メインループ1回分の記録（計測中だけ呼び出す）
+        Parameters
+        ----------
+        arg_name : str
+            ループの名前
+        arg_start : float
+            開始時刻（time.monotonic）
+        arg_elapsed : float
+            処理時間（sec）
+        """
+        loops = self.__loops.get(arg_name)
+        if loops is None:
+            loops = self.__loops[arg_name] = []
+        loops.append((arg_start, arg_elapsed))
+
+    def event_Thread(self):
+        """
+        スレッド・サンプリング
+        （全スレッドのスタックを一定間隔で採取する）
+        """
+        me = threading.get_ident()
+        # (スレッド名, コード) ごとの採取数（自身 / 呼び出し先を含む）
+        own = {}
+        total = {}
+        # スレッド名ごとの採取数
+        threads = {}
+        # 周期を計測するスレッドの最終動作時刻と周期
+        ticks = dict((name, [None, []]) for name, func in self.__watch)
+        samples = 0
+
+        self.print("start (%.1f sec)" % (self.__window))
+        cpu_begin = thread_cpu()
+        begin = time.monotonic()
+        end = begin + self.__window
+        while time.monotonic() < end and not self.__stop.is_set():
+            names = dict((th.ident, th.name) for th in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                name = names.get(ident, str(ident))
+                threads[name] = threads.get(name, 0) + 1
+                # このディレクトリのソースだけ数える
+                # （ライブラリ内の時間は呼び出し元の自身の時間になる）
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    if code.co_filename.startswith(HOME):
+                        key = (name, code)
+                        if not seen:
+                            own[key] = own.get(key, 0) + 1
+                        if key not in seen:
+                            seen.add(key)
+                            total[key] = total.get(key, 0) + 1
+                    frame = frame.f_back
+            for name, func in self.__watch:
+                tick = ticks[name]
+                last = func()
+                if tick[0] is not None and last != tick[0]:
+                    tick[1].append(last - tick[0])
+                tick[0] = last
+            samples += 1
+            time.sleep(self.__interval)
+        elapsed = time.monotonic() - begin
+        cpu_end = thread_cpu()
+        cpu = dict((name, cpu_end[name] - cpu_begin[name])
+                   for name in cpu_end if name in cpu_begin)
+
+        self.active = False
+        loops = self.__loops
+        try:
+            self.last_file = self.Dump(elapsed, samples, threads, own, total, ticks,
+                                       loops, cpu)
+            print(" > Profile written : %s" % (self.last_file))
+        except OSError as e:
+            print(" > Profile write error : %s" % (e))
+
+    def Dump(self, arg_elapsed, arg_samples, arg_threads, arg_own, arg_total,
+             arg_ticks, arg_loops, arg_cpu):
+        """
+        計測結果の書き出し
+        Returns
+        -------
+        str
+            書き出したファイル名
+        """
+        file_name = os.path.join(self.__dir, "poka-profile-%d-%s.txt" % (
+            os.getpid(), time.strftime("%Y%m%d-%H%M%S")))
+        # 1サンプルあたりの時間（実際のサンプリング間隔）
+        per = arg_elapsed / arg_samples if arg_samples > 0 else 0.0
+
+        with open(file_name, "w") as file:
+            file.write("# POKAYOKE profile pid %d, %.1f sec, %d samples (%.2f ms each)\n" %
+                       (os.getpid(), arg_elapsed, arg_samples, per * 1000))
+
+            # メインループの周期と処理時間
+            for name in sorted(arg_loops):
+                loops = arg_loops[name]
+                period = [loops[i][0] - loops[i - 1][0] for i in range(1, len(loops))]
+                file.write("\n== loop %s : %d iterations ==\n" % (name, len(loops)))
+                file.write(" period ms : %s\n" % (summary(period)))
+                file.write(" jitter ms : %s\n" % (summary(
+                    [abs(p - LOOP_PERIOD) for p in period])))
+                file.write(" step ms   : %s\n" % (summary([e for s, e in loops])))
+
+            # 出力スレッドの周期
+            for name in sorted(arg_ticks):
+                period = arg_ticks[name][1]
+                file.write("\n== thread %s : %d ticks ==\n" % (name, len(period)))
+                file.write(" period ms : %s\n" % (summary(period)))
+
+            # スレッドごとのCPU時間（sleep中は増えない）
+            if arg_cpu:
+                file.write("\n== thread cpu ==\n")
+                for name in sorted(arg_cpu, key=lambda n: arg_cpu[n], reverse=True):
+                    file.write(" %-24s %9.1f ms %6.2f %%\n" % (
+                        name, arg_cpu[name] * 1000, 100.0 * arg_cpu[name] / arg_elapsed))
+
+            # 関数ごとの時間（採取数×サンプリング間隔）
+            # （sleep中はその呼び出し元の自身の時間になる）
+            file.write("\n== functions (top %d by total) ==\n" % (TOP))
+            file.write("%-16s %9s %9s %7s %7s  %s\n" %
+                       ("thread", "own ms", "total ms", "own%", "total%", "function"))
+            keys = sorted(arg_total, key=lambda k: arg_total[k], reverse=True)[:TOP]
+            for key in keys:
+                name, code = key
+                count = arg_threads[name]
+                file.write("%-16s %9.1f %9.1f %7.1f %7.1f  %s (%s:%d)\n" % (
+                    name[:16],
+                    arg_own.get(key, 0) * per * 1000,
+                    arg_total[key] * per * 1000,
+                    100.0 * arg_own.get(key, 0) / count,
+                    100.0 * arg_total[key] / count,
+                    code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        return file_name
@@ -0,0 +1,314 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Station Event Publisher (UDP multicast)
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import collections
+import socket
+import struct
+import threading
+import time
+
+import EventRecorder
+import Metrics
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+GROUP_DEFAULT = "239.255.0.23"  # マルチキャストグループ（組織内ローカル）
+PORT_DEFAULT = 8123  # 配信ポート
+TTL_DEFAULT = 1  # 届く範囲（1:同じセグメントのみ）
+
+MAGIC = b"PK"
+VERSION = 1
+
+# データグラムのヘッダ（後ろにステーション名が続く）
+# （識別子, バージョン, 件数, 現在のステート, 通し番号, 基準時刻 epoch sec, ステーション名の長さ）
+# （18byte。購読側もこの並びで読むので変えない事）
+HEADER = struct.Struct("<2sBBBIdB")
+# 1件分（基準時刻からのms, 種類, ステート, 値a, 値b）（7byte）
+EVENT = struct.Struct("<HBBBH")
+OFFSET_MAX = 0xffff  # 基準時刻からのmsの上限（EVENTのH）
+
+# 配信するイベントの種類（EventRecorderと同じ番号）
+EV_STEP = EventRecorder.EV_STEP
+EV_WRONG = EventRecorder.EV_WRONG
+EV_CYCLE = EventRecorder.EV_CYCLE
+EV_STATE = EventRecorder.EV_STATE
+
+QUEUE_MAX = 4096  # 送信待ちの上限（溢れたら古いものから捨てる）
+BATCH_MAX = 100  # 1データグラムの最大件数（約720byte）
+SPAN_MAX = 60.0  # 1データグラムに入れる時刻の幅（sec）（EVENTのmsに収まる範囲）
+INTERVAL = 0.05  # まとめて送る間隔（sec）
+HEARTBEAT = 1.0  # イベントが無い時の生存通知の間隔（sec）
+
+
+def decode(arg_data):
+    """
+    データグラムの解読
+    Parameters
+    ----------
+    arg_data : bytes
+        受信したデータグラム
+    Returns
+    -------
+    station : str
+        ステーション名
+    state : int
+        送信時のステート
+    seq : int
+        通し番号
+    base : float
+        基準時刻（epoch sec）
+    events : list
+        (時刻, 種類, ステート, 値a, 値b) のリスト（生存通知の時は空）
+    """
+    magic, version, count, state, seq, base, length = HEADER.unpack_from(arg_data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a station event datagram")
+    offset = HEADER.size
+    station = arg_data[offset:offset + length].decode()
+    offset += length
+    events = []
+    for dt, kind, ev_state, a, b in EVENT.iter_unpack(
+            arg_data[offset:offset + count * EVENT.size]):
+        events.append((base + dt / 1000.0, kind, ev_state, a, b))
+    return station, state, seq, base, events
+
+
+class Publisher():
+    """
+    ステーションのイベント配信
+    （Writeは送信待ちに積むだけ。送信は専用スレッドでまとめて行うので、
+      ネットワークが遅くてもメインループは待たされない）
+    """
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 送信したデータグラム数、送信待ちから捨てたイベント数、送信エラー数
+    sent = 0
+    dropped = 0
+    errors = 0
+
+    # 最後に送信した時刻（monotonic）
+    __last_send = 0.0
+    # 送信エラーが続いている（エラーの表示は続いている間に1回だけ）
+    __failing = False
+    # 現在のステート（生存通知に載せる）
+    __state = 0
+
+    def __init__(self, arg_station, arg_group=GROUP_DEFAULT, arg_port=PORT_DEFAULT,
+                 arg_ttl=TTL_DEFAULT, arg_clock=time, arg_thread=True):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_station : str
+            ステーション名
+        arg_group : str
+            送信先（マルチキャストグループ、またはユニキャストアドレス）
+        arg_port : int
+            送信先ポート
+        arg_ttl : int
+            マルチキャストの届く範囲
+        arg_clock :
+            時計（timeモジュール、またはSimBackend.SimClock）
+        arg_thread : bool
+            送信スレッドを起動する（Falseの時は呼び出し側がFlushを呼ぶ）
+        """
+        self.__name = arg_station.encode()[:255]
+        self.__addr = (arg_group, arg_port)
+        self.__clock = arg_clock
+        self.__queue = collections.deque(maxlen=QUEUE_MAX)
+        self.__wake = threading.Event()
+        self.__seq = 0
+
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, arg_ttl)
+        # 同じ機械の購読者にも届ける
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.__sock.setblocking(False)
+
+        if arg_thread == True:
+            thread_1 = threading.Thread(target=self.event_Thread, name="Publisher")
+            thread_1.daemon = True
+            thread_1.start()
+
+    def Write(self, arg_kind, arg_state, arg_a=0, arg_b=0):
+        """
+        イベントを送信待ちに積む
+        Parameters
+        ----------
+        arg_kind : int
+            種類（EV_*）
+        arg_state : int
+            現在のステート
+        arg_a : int
+            値a（0～255）
+        arg_b : int
+            値b（0～65535）
+        """
+        self.__state = arg_state
+        queue = self.__queue
+        if len(queue) == QUEUE_MAX:
+            # 古いものから捨てる（dequeのmaxlen）
+            self.dropped += 1
+            Metrics.COUNTERS[Metrics.PUB_DROPPED] += 1
+        # 時刻はmonotonicで持つ（時計合わせで戻っても、基準時刻からのmsが負にならない）
+        queue.append((self.__clock.monotonic(), arg_kind, arg_state, arg_a, arg_b))
+        if len(queue) >= BATCH_MAX:
+            self.__wake.set()
+
+    def Flush(self):
+        """
+        送信待ちをまとめて送信（イベントが無い時は、一定間隔で生存通知（件数0）を送る）
+        """
+        queue = self.__queue
+        while queue:
+            base = queue[0][0]
+            batch = []
+            while queue and len(batch) < BATCH_MAX and queue[0][0] - base < SPAN_MAX:
+                batch.append(queue.popleft())
+            self.__Send(base, batch)
+        now = self.__clock.monotonic()
+        if now - self.__last_send >= HEARTBEAT:
+            self.__Send(now, [])
+
+    def __Send(self, arg_base, arg_batch):
+        """
+        データグラム1つ分の送信
+        （送信スレッドやメインループを止めないよう、例外は外に出さない）
+        Parameters
+        ----------
+        arg_base : float
+            基準時刻（monotonic）
+        arg_batch : list
+            送るイベント
+        """
+        seq = self.__seq
+        self.__seq = (seq + 1) & 0xffffffff
+        self.__last_send = self.__clock.monotonic()
+        try:
+            events = []
+            for t, kind, state, a, b in arg_batch:
+                offset = min(max(int((t - arg_base) * 1000), 0), OFFSET_MAX)
+                try:
+                    events.append(EVENT.pack(offset, kind, state, a, b))
+                except struct.error:
+                    # 範囲外の値のイベントだけ捨てる
+                    self.dropped += 1
+                    Metrics.COUNTERS[Metrics.PUB_DROPPED] += 1
+            # ヘッダの基準時刻だけ、送る時点の時計でepoch secに直す
+            wall = self.__clock.time() - (self.__last_send - arg_base)
+            parts = [HEADER.pack(MAGIC, VERSION, len(events), self.__state, seq,
+                                 wall, len(self.__name)), self.__name] + events
+            self.__sock.sendto(b"".join(parts), self.__addr)
+        except Exception as e:
+            # 送れなかった分は捨てる（再送はしない）
+            self.errors += 1
+            Metrics.COUNTERS[Metrics.PUB_ERRORS] += 1
+            if self.__failing == False:
+                self.__failing = True
+                print(" > Publisher send error : %s" % (e))
+            return
+        if self.__failing == True:
+            self.__failing = False
+            print(" > Publisher send recovered : %d errors" % (self.errors))
+        self.sent += 1
+        Metrics.COUNTERS[Metrics.PUB_EVENTS] += len(events)
+
+    def event_Thread(self):
+        """
+        スレッド・送信
+        """
+        while True:
+            self.__wake.wait(INTERVAL)
+            self.__wake.clear()
+            self.Flush()
+
+
+class Subscriber():
+    """
+    ステーションのイベント購読
+    """
+
+    def __init__(self, arg_group=GROUP_DEFAULT, arg_port=PORT_DEFAULT, arg_timeout=None):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_group : str
+            マルチキャストグループ
+        arg_port : int
+            受信ポート
+        arg_timeout : float
+            受信待ちの上限（sec）（Noneの時は無制限）
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("", arg_port))
+        membership = struct.pack("4s4s", socket.inet_aton(arg_group),
+                                 socket.inet_aton("0.0.0.0"))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.sock.settimeout(arg_timeout)
+        # ステーションごとの次の通し番号（抜けの検出用）
+        self.__next_seq = {}
+        # 届かなかったデータグラム数
+        self.lost = 0
+
+    def Receive(self):
+        """
+        データグラム1つ分の受信
+        Returns
+        -------
+        station : str
+            ステーション名
+        state : int
+            送信時のステート
+        events : list
+            (時刻, 種類, ステート, 値a, 値b) のリスト（生存通知の時は空）
+        """
+        while True:
+            data = self.sock.recv(65536)
+            try:
+                station, state, seq, base, events = decode(data)
+            except (ValueError, struct.error):
+                continue
+            expect = self.__next_seq.get(station)
+            if expect is not None and seq != expect:
+                self.lost += (seq - expect) & 0xffffffff
+            self.__next_seq[station] = (seq + 1) & 0xffffffff
+            return station, state, events
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE station event subscriber")
+    parser.add_argument("-g", "--group", default=GROUP_DEFAULT,
+                        help="マルチキャストグループ（既定: %s）" % (GROUP_DEFAULT))
+    parser.add_argument("-p", "--port", type=int, default=PORT_DEFAULT,
+                        help="受信ポート（既定: %d）" % (PORT_DEFAULT))
+    parser.add_argument("--heartbeat", action="store_true",
+                        help="生存通知も表示する")
+    args = parser.parse_args()
+
+    names = {EV_STEP: "STEP", EV_WRONG: "WRONG", EV_CYCLE: "CYCLE", EV_STATE: "STATE"}
+    sub = Subscriber(args.group, args.port)
+    try:
+        while True:
+            station, state, events = sub.Receive()
+            if not events and args.heartbeat:
+                print("%s %-10s HEARTBEAT state %d" % (time.strftime("%H:%M:%S"), station, state))
+            for t, kind, state, a, b in events:
+                print("%s.%03d %-10s %-5s state %d a %d b %d" % (
+                    time.strftime("%H:%M:%S", time.localtime(t)), int(t * 1000) % 1000,
+                    station, names.get(kind, kind), state, a, b))
+    except KeyboardInterrupt:
+        print(" > lost datagrams : %d" % (sub.lost))
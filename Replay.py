@@ -0,0 +1,154 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Event Log Replay
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import sys
+import time
+
+import EventRecorder
+import Main
+import SimBackend
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+STEP = 0.01  # メインループの周期（sec）（Main.Loopと同じ）
+BLINK_TICKS = 15  # 点滅を進める周期（メインループの回数）
+TAIL = 3.0  # 最後の入力のあとに回す時間（sec）
+
+
+def replay(arg_info, arg_records, arg_realtime=False, arg_verbose=False):
+    """
+    記録した入力をMainに流し込む
+    Parameters
+    ----------
+    arg_info : dict
+        記録開始時の情報
+    arg_records : list
+        記録 (経過時間, 種類, 値a, 値b) のリスト
+    arg_realtime : bool
+        記録時と同じ速さで再生する（Falseの時は待たずに再生）
+    arg_verbose : bool
+        デバッグモード
+    Returns
+    -------
+    list
+        再生で得られた記録 (経過時間, 種類, 値a, 値b) のリスト
+    """
+    icaddr = arg_info["icaddr"]
+    backend = SimBackend.SimBackend(
+        icaddr, arg_info["gpio_int"][0], arg_info["start"])
+    # 記録済みのエッジはチャタリング除去を通過したもの
+    backend.gpio.bounce = False
+    clock = backend.clock
+
+    recorder = EventRecorder.EventRecorder(arg_clock=clock)
+    station = {
+        "name": arg_info["station"],
+        "icaddr": icaddr,
+        "gpio_input": arg_info["gpio_input"],
+        "gpio_int": arg_info["gpio_int"],
+        "gpio_output": arg_info["gpio_output"],
+    }
+    m = Main.Main(arg_verbose, arg_station=station,
+                  arg_backend=backend, arg_recorder=recorder)
+    m.pattern = list(arg_info["pattern"])
+    m.Setup()
+
+    real_start = time.monotonic()
+    tick = 0
+
+    def step():
+        # メインループ1回分
+        nonlocal tick
+        clock.sleep(STEP)
+        m.Step()
+        m.OutputTick(tick == 0)
+        tick = (tick + 1) % BLINK_TICKS
+        if arg_realtime:
+            wait = real_start + clock.monotonic() - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    for t, kind, a, b in arg_records:
+        # 入力の時刻までメインループを回す
+        while clock.monotonic() + STEP <= t:
+            step()
+        if kind == EventRecorder.EV_GPIO:
+            backend.gpio.Edge(a, b, arg_force=True)
+        elif kind == EventRecorder.EV_I2C_READ:
+            backend.bus.Input(icaddr, b, arg_force=True)
+
+    # 最後の入力の結果が出るまで回す
+    end = clock.monotonic() + TAIL
+    while clock.monotonic() < end:
+        step()
+    return recorder.records
+
+
+def lamps(arg_records):
+    """
+    記録から点灯条件値の変化だけを取り出す
+    Parameters
+    ----------
+    arg_records : list
+        記録 (経過時間, 種類, 値a, 値b) のリスト
+    Returns
+    -------
+    list
+        (ch番号, 点灯条件値) のリスト
+    """
+    return [(a, b) for t, kind, a, b in arg_records if kind == EventRecorder.EV_LAMP]
+
+
+def compare(arg_expected, arg_actual):
+    """
+    点灯の比較
+    Returns
+    -------
+    int or None
+        最初に食い違った位置（一致すればNone）
+    """
+    for i in range(max(len(arg_expected), len(arg_actual))):
+        if i >= len(arg_expected) or i >= len(arg_actual):
+            return i
+        if arg_expected[i] != arg_actual[i]:
+            return i
+    return None
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="POKAYOKE event log replay")
+    parser.add_argument("log", help="記録ファイル（Main.py --record で作成）")
+    parser.add_argument("--realtime", action="store_true",
+                        help="記録時と同じ速さで再生する")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="デバッグモード")
+    args = parser.parse_args()
+
+    info, records = EventRecorder.load(args.log)
+    begin = time.monotonic()
+    result = replay(info, records, args.realtime, args.verbose)
+    elapsed = time.monotonic() - begin
+
+    expected = lamps(records)
+    actual = lamps(result)
+    index = compare(expected, actual)
+    print("-- REPLAY %s --" % (args.log))
+    print(" > %d events, %.1f sec recorded, replayed in %.1f ms" %
+          (len(records), records[-1][0] if records else 0.0, elapsed * 1000))
+    if index is None:
+        print(" > OK : %d lamp changes match" % (len(expected)))
+        sys.exit(0)
+    print(" > NG : lamp change #%d differs" % (index))
+    print("   expected %s" % (expected[index:index + 5]))
+    print("   actual   %s" % (actual[index:index + 5]))
+    sys.exit(1)
@@ -0,0 +1,301 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Simulated Backend (GPIO / MCP23017 / Clock)
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import IoExpI2C
+
+
+class SimClock():
+    """
+    仮想時計
+    （timeモジュールの代わりに使う。sleepは待たずに時刻だけ進める）
+    """
+
+    def __init__(self, arg_epoch=0.0):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_epoch : float
+            time()が返す時刻の起点
+        """
+        self.__epoch = arg_epoch
+        self.now = 0.0
+
+    def monotonic(self):
+        """
+        経過時間（sec）
+        """
+        return self.now
+
+    def time(self):
+        """
+        現在時刻（epoch sec）
+        """
+        return self.__epoch + self.now
+
+    def sleep(self, arg_sec):
+        """
+        時刻を進める
+        """
+        if arg_sec > 0:
+            self.now += arg_sec
+
+
+class SimGPIO():
+    """
+    RPi.GPIO の代わり
+    （Main/GpioOutが使う関数だけを持つ）
+    """
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 22
+    PUD_DOWN = 21
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, arg_clock):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_clock : SimClock
+            チャタリング除去の時間判定に使う時計
+        """
+        self.__clock = arg_clock
+        # ピンごとのレベル
+        self.level = {}
+        # ピンごとのコールバック（関数, チャタリング除去時間sec）
+        self.__callback = {}
+        # ピンごとの最後に受け付けたエッジの時刻
+        self.__last_edge = {}
+        # チャタリング除去を有効にする（記録済みの入力を再生する時は無効）
+        self.bounce = True
+
+    def setmode(self, arg_mode):
+        """
+        ピン番号の指定方法
+        """
+        pass
+
+    def setwarnings(self, arg_flag):
+        """
+        警告表示の切替
+        """
+        pass
+
+    def setup(self, arg_pin, arg_dir, pull_up_down=None, initial=0):
+        """
+        ピンの入出力設定
+        """
+        if arg_dir == self.IN:
+            # プルアップなら、押されていない時はH
+            self.level[arg_pin] = 1 if pull_up_down == self.PUD_UP else 0
+        else:
+            self.level[arg_pin] = initial
+
+    def add_event_detect(self, arg_pin, arg_edge, callback=None, bouncetime=0):
+        """
+        エッジ検出コールバックの設定
+        """
+        self.__callback[arg_pin] = (callback, bouncetime / 1000.0)
+
+    def remove_event_detect(self, arg_pin):
+        """
+        エッジ検出コールバックの解除
+        """
+        self.__callback.pop(arg_pin, None)
+
+    def input(self, arg_pin):
+        """
+        入力
+        """
+        return self.level.get(arg_pin, 0)
+
+    def output(self, arg_pin, arg_val):
+        """
+        出力
+        """
+        self.level[arg_pin] = arg_val
+
+    def cleanup(self):
+        """
+        解放
+        """
+        self.__callback = {}
+
+    def Edge(self, arg_pin, arg_level, arg_force=False):
+        """
+        入力ピンのレベル変化（コールバックはその場で呼び出す）
+        Parameters
+        ----------
+        arg_pin : int
+            ピン番号
+        arg_level : int
+            変化後のレベル
+        arg_force : bool
+            レベルが変わらなくてもコールバックを呼び出す（記録の再生用）
+        Returns
+        -------
+        bool
+            コールバックを呼び出したらTrue
+            （レベルが変わらない時、チャタリング除去で捨てた時はFalse）
+        """
+        if self.level.get(arg_pin) == arg_level and arg_force == False:
+            return False
+        self.level[arg_pin] = arg_level
+        if arg_pin not in self.__callback:
+            return False
+        callback, bouncetime = self.__callback[arg_pin]
+        now = self.__clock.monotonic()
+        last = self.__last_edge.get(arg_pin)
+        if self.bounce and last is not None and now - last < bouncetime:
+            # RPi.GPIOと同じく、前回のエッジからbouncetime以内は捨てる
+            return False
+        self.__last_edge[arg_pin] = now
+        callback(arg_pin)
+        return True
+
+
+class SimSMBus():
+    """
+    smbus.SMBus の代わり（MCP23017のレジスタを模擬する）
+    （PORTB入力の状態変化で、INTピンに繋いだGPIOをLにする）
+    """
+
+    def __init__(self, arg_gpio=None):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_gpio : SimGPIO
+            INTピンを繋ぐGPIO
+        """
+        self.__gpio = arg_gpio
+        # ICアドレスごとのレジスタ
+        self.regs = {}
+        # ICアドレスごとのINTピン番号
+        self.__int_pin = {}
+        # 通信回数
+        self.transfers = 0
+
+    def Attach(self, arg_addr, arg_int_pin):
+        """
+        ICの追加
+        Parameters
+        ----------
+        arg_addr : int
+            I2Cアドレス
+        arg_int_pin : int
+            INTBを繋ぐGPIOピン番号
+        """
+        self.__int_pin[arg_addr] = arg_int_pin
+        self.PowerOn(arg_addr)
+
+    def PowerOn(self, arg_addr):
+        """
+        電源投入時（リセット時）のレジスタ値に戻す
+        """
+        regs = [0] * (IoExpI2C.REG_OLATB + 1)
+        regs[IoExpI2C.REG_IODIRA] = 0xff
+        regs[IoExpI2C.REG_IODIRB] = 0xff
+        self.regs[arg_addr] = regs
+        self.__SetInt(arg_addr, False)
+
+    def __Regs(self, arg_addr):
+        """
+        レジスタの取得（存在しないアドレスは通信エラー）
+        """
+        if arg_addr not in self.regs:
+            raise OSError(121, "Remote I/O error")
+        self.transfers += 1
+        return self.regs[arg_addr]
+
+    def __SetInt(self, arg_addr, arg_active):
+        """
+        INTピンの出力
+        （IOCON.ODR=1 のオープンドレイン出力なので、割込発生中はL）
+        """
+        pin = self.__int_pin.get(arg_addr)
+        if self.__gpio is not None and pin is not None:
+            self.__gpio.level[pin] = 0 if arg_active else 1
+
+    def read_byte_data(self, arg_addr, arg_reg):
+        """
+        1バイト読み込み
+        """
+        regs = self.__Regs(arg_addr)
+        if arg_reg == IoExpI2C.REG_GPIOB or arg_reg == IoExpI2C.REG_INTCAPB:
+            # GPIO/INTCAPを読むと割込が解除される
+            self.__SetInt(arg_addr, False)
+        if arg_reg == IoExpI2C.REG_GPIOA:
+            # 出力ピンはラッチの値
+            return regs[IoExpI2C.REG_OLATA]
+        return regs[arg_reg]
+
+    def write_byte_data(self, arg_addr, arg_reg, arg_val):
+        """
+        1バイト書き込み
+        """
+        regs = self.__Regs(arg_addr)
+        regs[arg_reg] = arg_val & 0xff
+
+    def read_i2c_block_data(self, arg_addr, arg_reg, arg_len):
+        """
+        連続読み込み
+        """
+        regs = self.__Regs(arg_addr)
+        return list(regs[arg_reg:arg_reg + arg_len])
+
+    def Input(self, arg_addr, arg_val, arg_force=False):
+        """
+        PORTBの入力変化
+        Parameters
+        ----------
+        arg_addr : int
+            I2Cアドレス
+        arg_val : int
+            PORTBの値
+        arg_force : bool
+            値が変わらなくても割込を発生させる（記録の再生用）
+        """
+        regs = self.regs[arg_addr]
+        changed = (regs[IoExpI2C.REG_GPIOB] ^ arg_val) & regs[IoExpI2C.REG_GPINTENB]
+        regs[IoExpI2C.REG_GPIOB] = arg_val
+        if changed or arg_force:
+            regs[IoExpI2C.REG_INTCAPB] = arg_val
+            self.__SetInt(arg_addr, True)
+
+
+class SimBackend():
+    """
+    シミュレーション用のバックエンド一式
+    （Mainの arg_backend に渡す）
+    """
+
+    def __init__(self, arg_icaddr=IoExpI2C.ICADDR_DEFAULT, arg_int_pin=7, arg_epoch=0.0):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_icaddr : int
+            IoExpanderのI2Cアドレス
+        arg_int_pin : int
+            INTBを繋ぐGPIOピン番号
+        arg_epoch : float
+            仮想時計の起点（epoch sec）
+        """
+        self.clock = SimClock(arg_epoch)
+        self.gpio = SimGPIO(self.clock)
+        self.bus = SimSMBus(self.gpio)
+        self.bus.Attach(arg_icaddr, arg_int_pin)
@@ -0,0 +1,109 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# Status Server Class
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Metrics
+
+
+# ------------------------
+# 定数
+# ------------------------
+
+HOST_DEFAULT = "127.0.0.1"  # 待ち受けアドレス（ローカルのみ）
+PORT_DEFAULT = 8023  # 待ち受けポート
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    HTTPリクエストの処理
+    """
+
+    def do_GET(self):
+        """
+        GETリクエスト
+        """
+        # 公開済みの内容を返すだけ（ロックもバス操作もしない）
+        body = self.server.status.body
+        if self.path == "/" or self.path == "/status":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/metrics":
+            # Prometheusテキスト形式（カウンタを読むだけ）
+            body = Metrics.Render()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        """
+        アクセスログは出力しない（高頻度のポーリングでログが溢れるため）
+        """
+        pass
+
+
+class StatusServer():
+    """
+    ステーションの状態をJSONで返すサーバ
+    （/status:状態 /metrics:Prometheus形式のメトリクス）
+    """
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 公開中の状態（JSONエンコード済み）
+    body = b"{}"
+
+    # ------------------------
+    # メンバ関数
+    # ------------------------
+
+    def __init__(self, arg_port=PORT_DEFAULT, arg_host=HOST_DEFAULT):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_port : int
+            待ち受けポート
+        arg_host : str
+            待ち受けアドレス
+        """
+        self.__server = ThreadingHTTPServer((arg_host, arg_port), StatusHandler)
+        self.__server.daemon_threads = True
+        self.__server.status = self
+
+    def Start(self):
+        """
+        待ち受けスレッドの開始
+        """
+        thread_1 = threading.Thread(target=self.__server.serve_forever,
+                                    name="StatusServer")
+        thread_1.daemon = True
+        thread_1.start()
+
+    def Publish(self, arg_status):
+        """
+        状態の公開
+        （エンコード済みの内容を差し替えるだけなので、呼び出し側は待たされない）
+        Parameters
+        ----------
+        arg_status : dict
+            公開する状態
+        """
+        self.body = json.dumps(arg_status).encode()
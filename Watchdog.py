@@ -0,0 +1,253 @@
+#!/usr/bin/env /usr/bin/python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------
+# systemd Watchdog Class
+#
+# The MIT License (MIT)
+# Copyright (C) 2019 myasu.
+# -----------------------------------------------
+
+import os
+import socket
+import threading
+import time
+
+
+class Watchdog():
+    """
+    systemd Watchdog
+    (Type=notify の起動完了通知と、WatchdogSec の生存通知)
+    """
+    # ------------------------
+    # メンバ定数
+    # ------------------------
+
+    # WatchdogSecが設定されていない時の監視間隔（sec）
+    __INTERVAL_DEFAULT = 5.0
+
+    # ------------------------
+    # メンバ変数
+    # ------------------------
+
+    # 通知先ソケット
+    __sock = None
+    __addr = None
+
+    # メインループの監視
+    # 最後にループを回った時刻
+    __last_beat = 0.0
+    # 監視間隔中のループ回数
+    __beat_count = 0
+    # 監視間隔中の最長ループ時間
+    __max_period = 0.0
+
+    # 監視対象スレッド（名前, 最終動作時刻を返す関数, 許容停止時間）
+    __threads = []
+
+    # 前回判定した時刻（スレッドを使わない時）
+    __last_check = 0.0
+
+    # デバッグモード
+    __debug = False
+
+    # ------------------------
+    # メンバ関数
+    # ------------------------
+
+    def __init__(self, arg_loop_deadline=3.0, arg_loop_slow=0.5,
+                 arg_thread_deadline=1.0, arg_verbose=False):
+        """
+        コンストラクタ
+        Parameters
+        ----------
+        arg_loop_deadline : float
+            メインループ1回の許容時間（sec）
+            これを超えて止まっていたら生存通知を止める
+        arg_loop_slow : float
+            メインループの平均周期の許容値（sec）
+            動いていても、これより遅ければ生存通知を止める
+        arg_thread_deadline : float
+            出力スレッドの許容停止時間（sec）
+        arg_verbose : bool
+            メッセージの強制表示
+        """
+        self.__loop_deadline = arg_loop_deadline
+        self.__loop_slow = arg_loop_slow
+        self.__thread_deadline = arg_thread_deadline
+        self.__debug = arg_verbose
+        self.__threads = []
+
+        # 通知先ソケット（systemd配下でなければ通知しない）
+        addr = os.environ.get("NOTIFY_SOCKET")
+        if addr:
+            if addr.startswith("@"):
+                # 抽象名前空間ソケット
+                addr = "\0" + addr[1:]
+            self.__addr = addr
+            self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+        # 監視間隔（WatchdogSecの半分）
+        usec = os.environ.get("WATCHDOG_USEC")
+        if usec:
+            self.__interval = int(usec) / 1e6 / 2
+        else:
+            self.__interval = self.__INTERVAL_DEFAULT
+
+        self.__last_beat = time.monotonic()
+
+    def print(self, arg_message, arg_err=False):
+        """
+        デバッグ用メッセージ
+        """
+        if self.__debug == True or arg_err == True:
+            print(" > %s" % (arg_message))
+
+    def Notify(self, arg_state):
+        """
+        systemdへの通知
+        Parameters
+        ----------
+        arg_state : str
+            通知内容（READY=1, WATCHDOG=1 など）
+        """
+        if self.__sock is None:
+            return
+        try:
+            self.__sock.sendto(arg_state.encode(), self.__addr)
+        except OSError as e:
+            self.print("sd_notify error %s" % (e), True)
+
+    def AddThread(self, arg_name, arg_func, arg_deadline=None):
+        """
+        監視対象スレッドの追加
+        Parameters
+        ----------
+        arg_name : str
+            スレッド名（ログ表示用）
+        arg_func :
+            スレッドが最後に動いた時刻(time.monotonic)を返す関数
+        arg_deadline : float
+            許容停止時間（sec）（Noneの時は出力スレッドの許容時間）
+        """
+        if arg_deadline is None:
+            arg_deadline = self.__thread_deadline
+        self.__threads.append((arg_name, arg_func, arg_deadline))
+
+    def Start(self, arg_thread=True):
+        """
+        監視スレッドの開始
+        Parameters
+        ----------
+        arg_thread : bool
+            監視スレッドを起動する（Falseの時はメインループからPollを呼ぶ）
+        """
+        # 起動処理の時間は監視対象外
+        self.__last_beat = time.monotonic()
+        self.__beat_count = 0
+        self.__max_period = 0.0
+        self.__last_check = self.__last_beat
+
+        if arg_thread == False:
+            return
+        thread_1 = threading.Thread(target=self.event_Thread, name="Watchdog")
+        thread_1.daemon = True
+        thread_1.start()
+
+    def Ready(self):
+        """
+        起動完了の通知
+        """
+        self.Notify("READY=1")
+
+    def Stopping(self):
+        """
+        停止処理中の通知
+        """
+        self.Notify("STOPPING=1")
+
+    def Beat(self):
+        """
+        メインループから毎回呼び出す
+        """
+        now = time.monotonic()
+        period = now - self.__last_beat
+        if period > self.__max_period:
+            self.__max_period = period
+        self.__beat_count += 1
+        self.__last_beat = now
+
+    def Check(self, arg_window):
+        """
+        健全性の判定
+        Parameters
+        ----------
+        arg_window : float
+            前回の判定からの経過時間（sec）
+        Returns
+        -------
+        str or None
+            異常の内容（正常ならNone）
+        """
+        now = time.monotonic()
+        # 監視間隔中の値を取り出してリセット
+        count = self.__beat_count
+        max_period = self.__max_period
+        self.__beat_count = 0
+        self.__max_period = 0.0
+
+        # メインループが止まっている
+        stall = now - self.__last_beat
+        if stall > self.__loop_deadline:
+            return "main loop stalled %.2f sec" % (stall)
+        # メインループ1回が長すぎる
+        if max_period > self.__loop_deadline:
+            return "main loop iteration %.2f sec" % (max_period)
+        # メインループは回っているが遅すぎる
+        if count == 0 or arg_window / count > self.__loop_slow:
+            return "main loop too slow (%d loops in %.2f sec)" % (count, arg_window)
+        # 監視対象スレッドが止まっている
+        for name, func, deadline in self.__threads:
+            stall = now - func()
+            if stall > deadline:
+                return "%s thread stalled %.2f sec" % (name, stall)
+        return None
+
+    def Poll(self):
+        """
+        スレッドを使わない時の生存通知（メインループから毎回呼び出す）
+        （メインループが止まれば通知も止まるので、systemdが再起動する）
+        """
+        now = time.monotonic()
+        if now - self.__last_check < self.__interval:
+            return
+        self.__Judge(now - self.__last_check)
+        self.__last_check = now
+
+    def __Judge(self, arg_window):
+        """
+        判定して、正常な時だけ生存通知
+        Parameters
+        ----------
+        arg_window : float
+            前回の判定からの経過時間（sec）
+        """
+        error = self.Check(arg_window)
+        if error is None:
+            # 正常な時だけ生存通知
+            self.Notify("WATCHDOG=1")
+        else:
+            # 通知を止めて、systemdに再起動させる
+            self.print("Watchdog : %s" % (error), True)
+
+    def event_Thread(self):
+        """
+        スレッド・生存通知
+        """
+        last = time.monotonic()
+        while True:
+            # ウェイト
+            time.sleep(self.__interval)
+
+            now = time.monotonic()
+            self.__Judge(now - last)
+            last = now
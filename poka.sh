@@ -8,4 +8,5 @@ SCRIPTDIR=/home/pi/gitwork/python/poka
 LOGDIR=$SCRIPTDIR/log
 
 #実行
-exec /usr/bin/env /usr/bin/python3 $SCRIPTDIR/Main.py -v >> $LOGDIR/run.log 2>&1
+#（-u：出力をバッファしない。Watchdogに止められた時も直前のメッセージがログに残る）
+exec /usr/bin/env /usr/bin/python3 -u $SCRIPTDIR/Main.py -v --fast --status 8023 --profile-dir $LOGDIR --flight >> $LOGDIR/run.log 2>&1